@@ -1,41 +1,335 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException, Query, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import chromadb
-import numpy as np
-from nltk.tokenize import word_tokenize
-from sentence_transformers import SentenceTransformer
-import pickle
+from fastapi.middleware.gzip import GZipMiddleware
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+import hashlib
+import json
 import os
-import sqlite3
-from .utils import zscore_norm
+import threading
+import time
+from .metadata import build_chunk_metadata
+from .hierarchy import HierarchyIndex, CODE_PATTERN
+from .bm25 import FtsIndex
+from .search import HybridSearcher
+from .suggest import load_suggest_index
+from .cache import LRUCache
+from .vectors import mmap_chunk_embeddings
+from .shared_index import MANIFEST_FILE, bundle_published, load_bm25_index, load_shared_index, resolve_bundle
+from .shared_index import load_bundle_embeddings
+from .role_index import load_role_index
+from .utils import iter_hierarchy_names
+from .encoders import load_encoder, MODEL_NAME
+from .workers import BoundedExecutor, EncodeBatcher, ReadOnlyConnections, ServiceOverloaded
+from .metrics import StageMetrics, render_samples, process_memory
+from .roles_db import FTS_TABLE, fetch_roles, has_fts
 
 # Load Prebuilt Indexes 
 CHROMA_PATH = "db/chroma_db"
-BM25_PATH = "db/bm25_index.pkl"
+BM25_PATH = "db/bm25_index.pkl"  # legacy pickle, used until migrated to SHARED_INDEX_DIR
 COLLECTION_NAME = "nco_roles"
 SQLITE_DB_PATH = "db/roles.db"
+EMBEDDINGS_PATH = "db/embeddings.npy"  # exported from Chroma while BM25 comes from the legacy pickle
+SHARED_INDEX_DIR = "db/shared"
+HIERARCHY_JSON = "data/json/IDs.json"
 
-# Initialize Chroma and sqlite
-client = chromadb.PersistentClient(path=CHROMA_PATH)
-collection = client.get_or_create_collection(name=COLLECTION_NAME)
-conn = sqlite3.Connection(SQLITE_DB_PATH, check_same_thread=False)
+# Index storage: "chroma" opens Chroma and memory-maps BM25 from the index bundle in
+# SHARED_INDEX_DIR; "shared" memory-maps everything from the bundle, so all workers share its pages
+INDEX_MODE = os.environ.get("INDEX_MODE", "chroma")
 
-# Load BM25 index
-if os.path.exists(BM25_PATH):
-    with open(BM25_PATH, "rb") as f:
-        bm25_index, bm25_ids = pickle.load(f)
-else:
-    raise FileNotFoundError("BM25 index not found. Please run preprocessing first.")
+# Vector search backend: "chroma" (HNSW) or "numpy" (exact matvec over the mmap'd embeddings)
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "chroma")
+EMBEDDINGS_DTYPE = os.environ.get("EMBEDDINGS_DTYPE", "float32")
+
+# Lexical backend: "bm25" (the BM25 index over chunks) or "fts5" (SQLite FTS5 over
+# role titles and descriptions in roles.db; build it with `python -m app.roles_db --fts`)
+LEXICAL_BACKEND = os.environ.get("LEXICAL_BACKEND", "bm25")
+
+# Cache settings
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", 4096))
+QUERY_CACHE_TTL = float(os.environ["QUERY_CACHE_TTL"]) if os.environ.get("QUERY_CACHE_TTL") else None
+QUERY_CACHE_DIR = os.environ.get("QUERY_CACHE_DIR")  # e.g. "db/query_cache" to spill to disk
+QUERY_CACHE_DISK_SIZE = int(os.environ.get("QUERY_CACHE_DISK_SIZE", 65536))  # files kept in QUERY_CACHE_DIR
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", 1024))
+
+# Request limits: results per query (top_k) and queries per /search/batch call
+MAX_TOP_K = int(os.environ.get("MAX_TOP_K", 100))
+MAX_BATCH_QUERIES = int(os.environ.get("MAX_BATCH_QUERIES", 256))
+
+# Role descriptions: LRU of roles.db rows, at most ROLE_LOOKUP_MAX_ROLES per /roles call, and
+# how long clients may reuse a response before revalidating it against its ETag
+ROLE_CACHE_SIZE = int(os.environ.get("ROLE_CACHE_SIZE", 8192))
+ROLE_LOOKUP_MAX_ROLES = int(os.environ.get("ROLE_LOOKUP_MAX_ROLES", 500))
+ROLE_CACHE_MAX_AGE = int(os.environ.get("ROLE_CACHE_MAX_AGE", 3600))
+
+# Responses of at least GZIP_MIN_SIZE bytes are gzipped for clients that accept it
+GZIP_MIN_SIZE = int(os.environ.get("GZIP_MIN_SIZE", 1000))
+
+# Query encoder: "torch", "torch-int8", "onnx" or "onnx-int8" (see app/encoders.py)
+ENCODER_BACKEND = os.environ.get("ENCODER_BACKEND", "torch")
+ONNX_DIR = "db/onnx"
+
+# Search worker pool: CPU-heavy search work runs on SEARCH_WORKERS threads with at most
+# SEARCH_QUEUE_SIZE requests waiting; beyond that, or after SEARCH_QUEUE_TIMEOUT seconds
+# in the queue, requests get a 429
+SEARCH_WORKERS = int(os.environ.get("SEARCH_WORKERS", min(4, os.cpu_count() or 1)))
+SEARCH_QUEUE_SIZE = int(os.environ.get("SEARCH_QUEUE_SIZE", 64))
+SEARCH_QUEUE_TIMEOUT = float(os.environ.get("SEARCH_QUEUE_TIMEOUT", 5.0))
+
+# Concurrent query encodes are coalesced into batches of up to ENCODE_MAX_BATCH,
+# waiting at most ENCODE_MAX_WAIT_MS for more queries to arrive
+ENCODE_MAX_BATCH = int(os.environ.get("ENCODE_MAX_BATCH", 32))
+ENCODE_MAX_WAIT_MS = float(os.environ.get("ENCODE_MAX_WAIT_MS", 2))
+
+# Startup settings
+WARMUP_MODEL = os.environ.get("WARMUP_MODEL", "1") == "1"
+
+# Caches outlive index generations; results are invalidated on reload
+embedding_cache = LRUCache(QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL,
+                           spill_dir=os.path.join(QUERY_CACHE_DIR, ENCODER_BACKEND) if QUERY_CACHE_DIR else None,
+                           spill_maxsize=QUERY_CACHE_DISK_SIZE)
+result_cache = LRUCache(RESULT_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+role_cache = LRUCache(ROLE_CACHE_SIZE)
+
+search_executor = BoundedExecutor(SEARCH_WORKERS, SEARCH_QUEUE_SIZE, SEARCH_QUEUE_TIMEOUT)
+
+# Latency histograms, exported on /metrics
+search_metrics = StageMetrics("search_stage_seconds", "Time spent in each stage of a search call.")
+facet_metrics = StageMetrics("facet_stage_seconds", "Time spent in each stage of a facets call.")
+request_metrics = StageMetrics("http_request_duration_seconds",
+                               "Handler latency including the wait for a search worker.", label="endpoint")
+
+# Read-only SQLite connection per thread
+db = ReadOnlyConnections(SQLITE_DB_PATH)
+
+# Resources are loaded in the background by the lifespan handler
+model = None
+searcher = None
+suggest_index = None
+reload_lock = threading.Lock()
+startup_state = {"status": "starting", "error": None, "timings": {}}
+
+
+def timed(name, fn, *args):
+    """
+    Run a loading step and record how long it took in `startup_state`.
+    """
+    start = time.perf_counter()
+    result = fn(*args)
+    startup_state["timings"][name] = round(time.perf_counter() - start, 4)
+    return result
+
+
+def open_collection():
+    """
+    Open the Chroma collection.
+    """
+    import chromadb
+
+    client = chromadb.PersistentClient(path=CHROMA_PATH)
+    return client.get_or_create_collection(name=COLLECTION_NAME)
+
+
+def load_bm25(index_dir=SHARED_INDEX_DIR):
+    """
+    Memory-map the BM25 index from the index bundle (or convert the legacy
+    pickle if the bundle has not been built or migrated yet).
+    Args:
+        index_dir (str): The bundle directory.
+    Returns:
+        tuple: The SparseBM25 index, the chunk ids and the index version.
+    """
+    return load_bm25_index(index_dir, BM25_PATH, {"model": MODEL_NAME})
+
+
+def load_embeddings(index_dir, collection, ids, index_version):
+    """
+    Memory-map the chunk embeddings from the index bundle BM25 was loaded
+    from. Without a bundle (legacy pickle), export them from Chroma to
+    EMBEDDINGS_PATH first.
+    Args:
+        index_dir (str): The bundle directory.
+        collection (chromadb.Collection): The Chroma collection holding the chunks.
+        ids (list): Chunk ids, in `bm25_ids` order.
+        index_version (str): The loaded index version.
+    Returns:
+        np.ndarray: The read-only memory-mapped matrix.
+    """
+    if os.path.exists(os.path.join(index_dir, MANIFEST_FILE)):
+        return load_bundle_embeddings(index_dir)
+    return mmap_chunk_embeddings(collection, ids, EMBEDDINGS_PATH, index_version, EMBEDDINGS_DTYPE)
+
+
+def load_model():
+    """
+    Load the query encoder for ENCODER_BACKEND, optionally warming it up with
+    a dummy encode so the first request does not pay for lazy initialization.
+    """
+    embedding_model = load_encoder(ENCODER_BACKEND, MODEL_NAME, ONNX_DIR)
+    if WARMUP_MODEL:
+        timed("model_warmup", embedding_model.encode, "warmup")
+    return embedding_model
+
+
+def load_fts_index(db_conn, chunk_meta):
+    """
+    Wrap the FTS5 table in roles.db as the lexical index for LEXICAL_BACKEND=fts5.
+    Queries run on the calling thread's read-only connection.
+    """
+    if not has_fts(db_conn):
+        raise FileNotFoundError(f"{FTS_TABLE} not found in {SQLITE_DB_PATH}. Run `python -m app.roles_db --fts` first.")
+    return FtsIndex(db, chunk_meta.roles, chunk_meta.role_codes, table=FTS_TABLE)
+
+
+def load_hierarchy(chunk_meta):
+    """
+    Build the NCO code prefix index, with level names from HIERARCHY_JSON if present.
+    """
+    names = dict(iter_hierarchy_names(HIERARCHY_JSON)) if os.path.exists(HIERARCHY_JSON) else {}
+    return HierarchyIndex(chunk_meta, names)
+
+
+def load_indexes(db_conn) -> dict:
+    """
+    Load the current index generation (Chroma, BM25, chunk metadata) from disk.
+    Chroma and BM25 load concurrently. With INDEX_MODE=shared everything is
+    memory-mapped from SHARED_INDEX_DIR instead, and vector search uses the
+    numpy backend. With LEXICAL_BACKEND=fts5, lexical scores come from the
+    FTS5 table in roles.db instead of the BM25 index.
+    Args:
+        db_conn (sqlite3.Connection): Connection to the roles database.
+    Returns:
+        dict: HybridSearcher keyword arguments, except the model.
+    """
+    if INDEX_MODE == "shared":
+        shared = timed("shared_index", load_shared_index, db_conn, SHARED_INDEX_DIR, {"model": MODEL_NAME})
+        indexes = {
+            **shared,
+            "collection": None,
+            "vector_backend": "numpy",
+            "embedding_cache": embedding_cache,
+            "result_cache": result_cache,
+            "metrics": search_metrics,
+            "facet_metrics": facet_metrics
+        }
+    else:
+        # Read BM25 and the role index from the same generation, even if a
+        # new bundle is published while this runs
+        bundle_dir = resolve_bundle(SHARED_INDEX_DIR) if bundle_published(SHARED_INDEX_DIR) else SHARED_INDEX_DIR
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            collection_future = pool.submit(timed, "chroma", open_collection)
+            bm25_future = pool.submit(timed, "bm25", load_bm25, bundle_dir)
+            collection = collection_future.result()
+            # Both the full build and the incremental indexer write a new bundle version
+            bm25_index, bm25_ids, index_version = bm25_future.result()
+
+        # Build the in-memory chunk metadata table
+        chunk_meta = timed("chunk_metadata", build_chunk_metadata, collection, db_conn, bm25_ids)
+        chunk_embeddings = timed("embeddings", load_embeddings, bundle_dir, collection, bm25_ids, index_version)
+        # From the bundle, or aggregated here while BM25 still comes from the legacy pickle
+        role_index = timed("role_index", load_role_index, bundle_dir, chunk_meta, bm25_index,
+                           chunk_embeddings)
+
+        indexes = {
+            "bm25_index": bm25_index,
+            "collection": collection,
+            "chunk_meta": chunk_meta,
+            "embeddings": chunk_embeddings,
+            "role_index": role_index,
+            "vector_backend": VECTOR_BACKEND,
+            "embedding_cache": embedding_cache,
+            "result_cache": result_cache,
+            "index_version": index_version,
+            "metrics": search_metrics,
+            "facet_metrics": facet_metrics
+        }
+
+    if LEXICAL_BACKEND == "fts5":
+        indexes["bm25_index"] = load_fts_index(db_conn, indexes["chunk_meta"])
+    indexes["hierarchy"] = timed("hierarchy", load_hierarchy, indexes["chunk_meta"])
+    return indexes
+
+
+def load_resources() -> HybridSearcher:
+    """
+    Load SQLite, the embedding model and the indexes, the model concurrently
+    with the indexes, and publish them as module globals.
+    Returns:
+        HybridSearcher: The search engine, also stored in `searcher`.
+    """
+    global model, searcher, suggest_index
+
+    start = time.perf_counter()
+    startup_state["status"] = "loading"
+    try:
+        # Initialize sqlite
+        conn = timed("sqlite", db.get)
+
+        # Typeahead needs only roles.db, so it is served while the model loads
+        suggest_index = timed("suggest", load_suggest_index, conn)
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            model_future = pool.submit(timed, "model", load_model)
+            indexes = load_indexes(conn)
+            model = EncodeBatcher(model_future.result(), ENCODE_MAX_BATCH, ENCODE_MAX_WAIT_MS / 1000)
+
+        searcher = HybridSearcher(model=model, **indexes)
+    except Exception as e:
+        startup_state["status"] = "failed"
+        startup_state["error"] = repr(e)
+        raise
+
+    startup_state["timings"]["total"] = round(time.perf_counter() - start, 4)
+    startup_state["status"] = "ready"
+    return searcher
+
+
+def get_searcher() -> HybridSearcher:
+    """
+    Return the loaded search engine, or answer 503 while startup is still running.
+    """
+    if searcher is None:
+        raise HTTPException(status_code=503, detail=f"Service {startup_state['status']}")
+    return searcher
+
+
+async def run_search(fn, *args, **kwargs):
+    """
+    Run a search call on the bounded search pool, answering 429 when it is saturated.
+    The time spent waiting for a worker is recorded as the "queue_wait" stage.
+    """
+    submitted = time.perf_counter()
+
+    def call():
+        waited = time.perf_counter() - submitted
+        search_metrics.observe("queue_wait", waited)
+        if kwargs.get("timings") is not None:
+            kwargs["timings"]["queue_wait"] = waited
+        return fn(*args, **kwargs)
+
+    try:
+        return await search_executor.run(call)
+    except ServiceOverloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load in the background so liveness answers while resources load
+    threading.Thread(target=load_resources, name="startup-loader", daemon=True).start()
+    yield
+    search_executor.shutdown()
 
-# Load embedding model
-model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
 
 # FastAPI App 
 app = FastAPI(
     title="Hybrid Search API",
     description="Hybrid BM25 + Vector Semantic Search",
-    version="1.0"
+    version="1.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -45,24 +339,80 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE)
 
 # Define request models
 class SearchRequest(BaseModel):
     query: str
-    top_k: int = 10
+    top_k: int = Field(10, ge=1, le=MAX_TOP_K)
     bm25_weight: float = 0.4
     vector_weight: float = 0.6
+    mode: Literal["exhaustive", "candidates", "roles"] = "exhaustive"
+    fusion: Literal["zscore", "rrf"] = "zscore"
+    candidate_pool: int = Field(200, ge=1)
+    debug_timings: bool = False
+    code_prefix: Optional[str] = Field(None, pattern=CODE_PATTERN.pattern)
+
+class FacetRequest(BaseModel):
+    query: str
+    level: Literal["division", "sub_division", "group", "family"] = "family"
+    top_k: int = Field(10, ge=1, le=MAX_TOP_K)
+    bm25_weight: float = 0.4
+    vector_weight: float = 0.6
+    fusion: Literal["zscore", "rrf"] = "zscore"
+    code_prefix: Optional[str] = Field(None, pattern=CODE_PATTERN.pattern)
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str] = Field(..., max_length=MAX_BATCH_QUERIES)
+    top_k: int = Field(10, ge=1, le=MAX_TOP_K)
+    bm25_weight: float = 0.4
+    vector_weight: float = 0.6
+    mode: Literal["exhaustive", "candidates"] = "exhaustive"
+    fusion: Literal["zscore", "rrf"] = "zscore"
+    candidate_pool: int = Field(200, ge=1)
+    batch_size: int = Field(64, ge=1)
 
 class RoleDescriptionRequest(BaseModel):
     role_number: str
 
 
+@app.get("/health/live")
+def liveness():
+    """
+    Liveness probe: the process is up and serving HTTP.
+    Returns:
+        dict: The liveness status.
+    """
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+def readiness():
+    """
+    Readiness probe: 200 once the model and indexes are loaded, 503 before
+    that (or if loading failed). Also reports per-resource load times.
+    Returns:
+        JSONResponse: The startup status and timings.
+    """
+    status_code = 200 if startup_state["status"] == "ready" else 503
+    return JSONResponse(status_code=status_code, content=startup_state)
+
+
 @app.post("/search")
-def hybrid_search(req: SearchRequest):
+async def hybrid_search(req: SearchRequest):
     """
     Hybrid search combining BM25 and vector search.
     Ensures only one chunk per role_number is returned (the best-scoring one).
+    Scores either the whole corpus ("exhaustive"), only the union of each
+    retriever's top `candidate_pool` chunks ("candidates"), or ranks roles on
+    the role-level index and rescores the chunks of the top `candidate_pool`
+    roles ("roles").
+    The work runs on the bounded search pool; a saturated pool answers 429.
+    With `debug_timings`, the response also lists the milliseconds spent in
+    each stage of this request. `code_prefix` restricts the search to an NCO
+    division, sub-division, group or family (e.g. "2" or "2141").
     
     Args:
         req (SearchRequest): The search request containing query and parameters.
@@ -70,73 +420,292 @@ def hybrid_search(req: SearchRequest):
         dict: The search results.
     """
 
-    # Initializing the Cursor
-    cursor = conn.cursor()
+    start = time.perf_counter()
+    timings = {} if req.debug_timings else None
+    results = await run_search(
+        get_searcher().search,
+        req.query,
+        top_k=req.top_k,
+        bm25_weight=req.bm25_weight,
+        vector_weight=req.vector_weight,
+        mode=req.mode,
+        fusion=req.fusion,
+        candidate_pool=req.candidate_pool,
+        timings=timings,
+        code_prefix=req.code_prefix
+    )
+    request_metrics.observe("/search", time.perf_counter() - start)
 
+    response = {"query": req.query, "results": results}
+    if timings is not None:
+        response["debug_timings"] = {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}
+    return response
 
-    # Extract parameters
-    query = req.query
-    top_k = req.top_k
-    bm25_weight = req.bm25_weight
-    vector_weight = req.vector_weight
 
-    # BM25 search
-    tokenized_query = word_tokenize(query.lower())
-    bm25_scores = bm25_index.get_scores(tokenized_query)
+@app.post("/search/facets")
+async def search_facets(req: FacetRequest):
+    """
+    Rank NCO divisions, sub-divisions, groups or families for a query, e.g.
+    "top families for this query". The corpus is scored once and the fused
+    chunk scores are aggregated up the hierarchy (a role scores its best
+    chunk, a group its best role).
 
-    # Vector search
-    query_emb = model.encode(query).tolist()
-    vector_results = collection.query(
-        query_embeddings=[query_emb],
-        n_results=len(bm25_ids)  # Retrieve all
+    Args:
+        req (FacetRequest): The query, hierarchy level and search parameters.
+    Returns:
+        dict: The best groups with their best role.
+    """
+
+    start = time.perf_counter()
+    groups = await run_search(
+        get_searcher().facets,
+        req.query,
+        level=req.level,
+        top_k=req.top_k,
+        bm25_weight=req.bm25_weight,
+        vector_weight=req.vector_weight,
+        fusion=req.fusion,
+        code_prefix=req.code_prefix
     )
+    request_metrics.observe("/search/facets", time.perf_counter() - start)
+
+    return {"query": req.query, "level": req.level, "groups": groups}
+
+
+@app.post("/search/batch")
+async def batch_search(req: BatchSearchRequest):
+    """
+    Hybrid search for many queries in one call.
+    Queries are embedded in batches and scored against the chunk embedding
+    matrix with one matrix product per batch; results match `/search`.
+
+    Args:
+        req (BatchSearchRequest): The queries and search parameters.
+    Returns:
+        dict: One entry per query, in input order.
+    """
+
+    start = time.perf_counter()
+    all_results = await run_search(
+        get_searcher().batch_search,
+        req.queries,
+        top_k=req.top_k,
+        bm25_weight=req.bm25_weight,
+        vector_weight=req.vector_weight,
+        mode=req.mode,
+        fusion=req.fusion,
+        candidate_pool=req.candidate_pool,
+        batch_size=req.batch_size
+    )
+    request_metrics.observe("/search/batch", time.perf_counter() - start)
+
+    return {"results": [
+        {"query": query, "results": results} for query, results in zip(req.queries, all_results)
+    ]}
+
+
+@app.get("/suggest")
+async def suggest(q: str = Query(..., max_length=200), limit: int = Query(10, ge=1, le=50)):
+    """
+    Typeahead completions over role titles and role numbers. Answered
+    from the in-memory prefix index on the event loop, without the model
+    or Chroma, and available as soon as roles.db is open.
+    Args:
+        q (str): The text typed so far.
+        limit (int): The maximum number of suggestions.
+    Returns:
+        dict: The query and its suggestions.
+    """
+    if suggest_index is None:
+        raise HTTPException(status_code=503, detail=f"Service {startup_state['status']}")
+    start = time.perf_counter()
+    suggestions = suggest_index.suggest(q, limit)
+    request_metrics.observe("/suggest", time.perf_counter() - start)
+    return {"query": q, "suggestions": suggestions}
 
-    # Initialize vector_scores aligned to bm25_ids
-    vector_scores = np.zeros(len(bm25_ids))
-    id_to_idx = {bm25_ids[i]: i for i in range(len(bm25_ids))}
 
-    # Convert distances to similarity
-    for i, doc_id in enumerate(vector_results["ids"][0]):
-        if doc_id in id_to_idx:
-            idx = id_to_idx[doc_id]
-            sim = 1 - vector_results["distances"][0][i]  # cosine distance → similarity
-            vector_scores[idx] = sim
+@app.get("/cache/stats")
+def cache_stats():
+    """
+    Report hit/miss counters of the query embedding and result caches.
+    Returns:
+        dict: The cache statistics.
+    """
+    return {
+        "index_version": get_searcher().index_version,
+        "embedding_cache": embedding_cache.stats(),
+        "result_cache": result_cache.stats(),
+        "role_cache": role_cache.stats()
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Prometheus metrics: per-stage /search and /search/facets latency histograms, handler
+    latency, cache counters, and search pool and encoder batching stats.
+    Returns:
+        PlainTextResponse: The metrics in the Prometheus text format.
+    """
+    lines = search_metrics.render() + facet_metrics.render() + request_metrics.render()
+
+    caches = {"embedding": embedding_cache.stats(), "result": result_cache.stats(), "role": role_cache.stats()}
+    for name, kind, help_text in (
+        ("hits", "counter", "Cache lookups that found an entry."),
+        ("misses", "counter", "Cache lookups that found nothing."),
+        ("evictions", "counter", "Entries evicted from memory."),
+        ("disk_hits", "counter", "Hits served from the on-disk spill."),
+        ("size", "gauge", "Entries held in memory.")
+    ):
+        metric = f"search_cache_{name}_total" if kind == "counter" else f"search_cache_{name}"
+        lines += render_samples(metric, kind, help_text,
+                                [({"cache": cache}, stats[name]) for cache, stats in caches.items()])
+
+    pool = search_executor.stats()
+    lines += render_samples("search_pool_in_flight", "gauge", "Search calls running or waiting for a worker.",
+                            [({}, pool["in_flight"])])
+    lines += render_samples("search_pool_rejected_total", "counter", "Search calls rejected with a full queue.",
+                            [({}, pool["rejected"])])
+    lines += render_samples("search_pool_timed_out_total", "counter", "Search calls that waited too long for a worker.",
+                            [({}, pool["timed_out"])])
 
-    # Normalize scores
-    bm25_scores = zscore_norm(np.array(bm25_scores))
-    vector_scores = zscore_norm(np.array(vector_scores))
+    if isinstance(model, EncodeBatcher):
+        encoder = model.stats()
+        lines += render_samples("encoder_batches_total", "counter", "Query encoder model calls.",
+                                [({}, encoder["batches"])])
+        lines += render_samples("encoder_queries_total", "counter", "Queries encoded through the batcher.",
+                                [({}, encoder["queries"])])
+        lines += render_samples("encoder_pending", "gauge", "Queries waiting for the encoder.",
+                                [({}, encoder["pending"])])
 
-    # Combine scores 
-    combined_scores = bm25_weight * bm25_scores + vector_weight * vector_scores
+    memory = process_memory()
+    lines += render_samples("process_resident_memory_bytes", "gauge", "Resident memory size in bytes.",
+                            [({}, memory["rss_bytes"])])
+    lines += render_samples("process_max_resident_memory_bytes", "gauge", "Peak resident memory size in bytes.",
+                            [({}, memory["max_rss_bytes"])])
+    lines += render_samples("search_ready", "gauge", "1 once the model and indexes are loaded.",
+                            [({}, int(startup_state["status"] == "ready"))])
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
 
-    # Track best chunk per role_number
-    best_chunks = {}
-    for idx, score in enumerate(combined_scores):
-        doc_id = bm25_ids[idx]
-        doc_data = collection.get(ids=[doc_id])
-        role_number = doc_data["metadatas"][0]["role_number"]
-        cursor.execute("SELECT title FROM roles WHERE role_number=?", (role_number,))
-        role_title = cursor.fetchone()
 
-        # If role not seen OR this chunk is better, replace
-        if role_number not in best_chunks or score > best_chunks[role_number]["combined_score"]:
-            best_chunks[role_number] = {
-                "id": doc_id,
-                "role_number": role_number,
-                "role_title": role_title[0] if role_title else "Unknown",
-                "chunk_index": doc_data["metadatas"][0]["chunk_index"],
-                "chunk_text": doc_data["documents"][0],
-                "bm25_score": float(bm25_scores[idx]),
-                "vector_score": float(vector_scores[idx]),
-                "combined_score": float(score)
-            }
+@app.get("/workers/stats")
+def worker_stats():
+    """
+    Report search pool load and rejections, and query encoder batching.
+    Returns:
+        dict: The worker statistics.
+    """
+    get_searcher()
+    return {"search_pool": search_executor.stats(), "encoder": model.stats()}
 
-    # Sort by combined score and take top_k
-    results = sorted(best_chunks.values(), key=lambda x: -x["combined_score"])[:top_k]
 
-    return {"query": query, "results": results}
+@app.post("/cache/clear")
+def cache_clear():
+    """
+    Drop cached search results, e.g. after the indexes were rebuilt.
+    Returns:
+        dict: The new cache statistics.
+    """
+    current = get_searcher()
+    current.invalidate(current.index_version)
+    return cache_stats()
+
 
+@app.post("/index/reload")
+def reload_index():
+    """
+    Swap in the index generation currently on disk without restarting.
+    The new indexes are loaded next to the old ones and replace them in a
+    single assignment, so in-flight requests finish on the old generation.
+    Returns:
+        dict: The loaded index version and chunk count.
+    """
+    global searcher, suggest_index
+
+    get_searcher()
+    with reload_lock:
+        if INDEX_MODE != "shared":
+            from chromadb.api.client import SharedSystemClient
+
+            # Drop Chroma's cached system so the new client reads the updated HNSW index
+            SharedSystemClient.clear_system_cache()
+        new_searcher = HybridSearcher(model=model, **load_indexes(db.get()))
+        new_suggest_index = load_suggest_index(db.get())
+        result_cache.clear()
+        role_cache.clear()
+        searcher = new_searcher
+        suggest_index = new_suggest_index
+
+    return {"index_version": searcher.index_version, "chunks": len(searcher.chunk_meta)}
+
+
+def lookup_roles(role_numbers):
+    """
+    Titles and descriptions of many roles: cached rows from `role_cache`,
+    the rest with one `fetch_roles` call. Unknown roles are cached too, as None.
+    Args:
+        role_numbers (list): Distinct role numbers.
+    Returns:
+        dict: Mapping of role number to a (title, description) tuple, or None for unknown roles.
+    """
+    missing = object()
+    rows = {role_number: role_cache.get(role_number, missing) for role_number in role_numbers}
+    uncached = [role_number for role_number, row in rows.items() if row is missing]
+    if uncached:
+        found = fetch_roles(db.get(), uncached, ["title", "description"])
+        for role_number in uncached:
+            rows[role_number] = found.get(role_number)
+            role_cache.put(role_number, rows[role_number])
+    return rows
+
+
+def etag_matches(etag, if_none_match):
+    """
+    Whether an If-None-Match header lists `etag` (weak comparison, as for GET).
+    """
+    if if_none_match is None:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in tags)
+
+
+@app.get("/roles")
+def get_roles(ids: str = Query(..., description="Comma-separated role numbers"),
+              if_none_match: Optional[str] = Header(None)):
+    """
+    Titles and descriptions of many roles in one call, e.g. every result
+    card of a results page. Rows come from an in-process LRU in front of
+    roles.db, so it only needs SQLite and answers during startup. The ETag
+    is a hash of the response, so clients revalidate with If-None-Match
+    and get a 304 until the roles change.
+    Args:
+        ids (str): Comma-separated role numbers.
+        if_none_match (str): ETags the client already holds.
+    Returns:
+        JSONResponse: The found roles keyed by role number, and the role numbers not found.
+    """
+    start = time.perf_counter()
+    role_numbers = list(dict.fromkeys(filter(None, (role_number.strip() for role_number in ids.split(",")))))
+    if not role_numbers or len(role_numbers) > ROLE_LOOKUP_MAX_ROLES:
+        raise HTTPException(status_code=422,
+                            detail=f"Expected between 1 and {ROLE_LOOKUP_MAX_ROLES} role numbers")
 
+    rows = lookup_roles(role_numbers)
+    content = {
+        "roles": {
+            role_number: {"title": row[0], "description": row[1]}
+            for role_number, row in rows.items() if row is not None
+        },
+        "missing": [role_number for role_number, row in rows.items() if row is None]
+    }
+    digest = hashlib.sha1(json.dumps(content, ensure_ascii=False).encode("utf-8")).hexdigest()
+    headers = {"ETag": f'"{digest}"', "Cache-Control": f"public, max-age={ROLE_CACHE_MAX_AGE}"}
+    if etag_matches(headers["ETag"], if_none_match):
+        response = Response(status_code=304, headers=headers)
+    else:
+        response = JSONResponse(content=content, headers=headers)
+    request_metrics.observe("/roles", time.perf_counter() - start)
+    return response
 
 
 @app.get('/getroledescription')
@@ -151,12 +720,10 @@ def get_role_description(req: RoleDescriptionRequest):
 
     # Extract the Role Number
     role_number = req.role_number
-    # Query the database
-    cur = conn.cursor()
-    cur.execute("SELECT description FROM roles WHERE role_number=?", (role_number,))
-    description = cur.fetchone()
+    # Query the database (through the role cache); needs only SQLite, not the model
+    row = lookup_roles([role_number])[role_number]
 
-    return {"description": description[0] if description else "Role not found"}
+    return {"description": row[1] if row else "Role not found"}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,313 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .metrics import process_memory
+
+FORMATTED_JSON = "data/json/formatted.json"
+
+# Search parameters recorded with every run
+SEARCH_PARAMS = ["top_k", "bm25_weight", "vector_weight", "mode", "fusion", "candidate_pool"]
+
+
+def build_query_set(json_file=FORMATTED_JSON, indexed_roles=None, max_queries=500, seed=0):
+    """
+    Build the query set from role titles. A title's relevant results are all
+    role numbers carrying that title (a few titles are shared by several roles).
+    Args:
+        json_file (str): The formatted roles JSON (list of role dicts).
+        indexed_roles (set): Role numbers present in the index, or None for all.
+        max_queries (int): Maximum number of queries, sampled deterministically.
+        seed (int): Sampling seed.
+    Returns:
+        list: (title, sorted list of relevant role numbers) pairs.
+    """
+    with open(json_file, "r", encoding="utf-8") as f:
+        roles = json.load(f)
+
+    relevant = {}
+    for role in roles:
+        title = (role.get("Role Name") or "").strip()
+        if title and (indexed_roles is None or role["role_number"] in indexed_roles):
+            relevant.setdefault(title, set()).add(role["role_number"])
+
+    queries = sorted((title, sorted(role_numbers)) for title, role_numbers in relevant.items())
+    if len(queries) > max_queries:
+        queries = sorted(random.Random(seed).sample(queries, max_queries))
+    return queries
+
+
+def indexed_role_numbers(index_dir="db/shared"):
+    """
+    Role numbers covered by the local index, read from the BM25 chunk ids.
+    """
+    from .shared_index import load_bm25_index
+
+    _, bm25_ids, _ = load_bm25_index(index_dir)
+    return {doc_id.rsplit("_chunk", 1)[0] for doc_id in bm25_ids}
+
+
+def relevance(ranked, expected, top_k):
+    """
+    Recall@k, hit@1 and MRR of ranked role numbers against the relevant ones.
+    Args:
+        ranked (list): Returned role numbers per query, best first.
+        expected (list): Relevant role numbers per query.
+        top_k (int): The cutoff.
+    Returns:
+        dict: Mean recall@k, hit@1 and MRR@k.
+    """
+    recalls, hits, reciprocal_ranks = [], [], []
+    for found, relevant in zip(ranked, expected):
+        relevant = set(relevant)
+        found = found[:top_k]
+        recalls.append(len(relevant & set(found)) / len(relevant))
+        hits.append(float(bool(found) and found[0] in relevant))
+        rank = next((i + 1 for i, role_number in enumerate(found) if role_number in relevant), None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+    return {
+        f"recall@{top_k}": round(float(np.mean(recalls)), 4),
+        "hit@1": round(float(np.mean(hits)), 4),
+        f"mrr@{top_k}": round(float(np.mean(reciprocal_ranks)), 4)
+    }
+
+
+def latency_summary(latencies, wall_seconds):
+    """
+    Throughput and latency percentiles of one run.
+    Args:
+        latencies (list): Per-query latencies in seconds.
+        wall_seconds (float): Wall time of the whole run.
+    Returns:
+        dict: queries, qps, and mean/p50/p95/p99/max latency in ms.
+    """
+    ms = np.asarray(latencies) * 1000
+    return {
+        "queries": len(latencies),
+        "qps": round(len(latencies) / wall_seconds, 2),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3)
+    }
+
+
+def replay(search_one, queries, concurrency=1, warmup=10):
+    """
+    Send every query once through `search_one` and time each call.
+    Args:
+        search_one (callable): Maps a query text to its list of result dicts.
+        queries (list): The query texts.
+        concurrency (int): Number of queries in flight at once.
+        warmup (int): Queries sent first and left out of the measurement.
+    Returns:
+        tuple: (latency summary, ranked role numbers per query).
+    """
+    for query in queries[:warmup]:
+        search_one(query)
+
+    def timed_search(query):
+        start = time.perf_counter()
+        results = search_one(query)
+        return time.perf_counter() - start, [result["role_number"] for result in results]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        timed = list(pool.map(timed_search, queries))
+    wall_seconds = time.perf_counter() - start
+
+    return latency_summary([latency for latency, _ in timed], wall_seconds), [ranked for _, ranked in timed]
+
+
+def run_in_process(queries, params, concurrency=1, warmup=10, use_cache=False):
+    """
+    Load the indexes in this process and replay the queries against HybridSearcher.
+    Args:
+        queries (list): (title, relevant role numbers) pairs.
+        params (dict): Search parameters.
+        concurrency (int): Number of queries in flight at once.
+        warmup (int): Unmeasured warm-up queries.
+        use_cache (bool): Keep the query embedding and result caches enabled.
+    Returns:
+        dict: Startup time, latency summary, relevance and peak RSS.
+    """
+    from .app import load_resources, startup_state
+
+    start = time.perf_counter()
+    searcher = load_resources()
+    startup_seconds = time.perf_counter() - start
+
+    if not use_cache:
+        searcher.embedding_cache = None
+        searcher.result_cache = None
+
+    latency, ranked = replay(lambda query: searcher.search(query, **params),
+                             [title for title, _ in queries], concurrency, warmup)
+    return {
+        "startup_s": round(startup_seconds, 3),
+        "startup_timings": dict(startup_state["timings"]),
+        "latency": latency,
+        "relevance": relevance(ranked, [expected for _, expected in queries], params["top_k"]),
+        "peak_rss_mb": round(process_memory()["max_rss_bytes"] / 2 ** 20, 1)
+    }
+
+
+def http_get(url):
+    with urllib.request.urlopen(url) as response:
+        return response.status, response.read().decode("utf-8")
+
+
+def run_http(base_url, queries, params, concurrency=1, warmup=10, ready_timeout=300):
+    """
+    Replay the queries against a running API's POST /search.
+    Startup time and server memory come from /health/ready and /metrics.
+    Args:
+        base_url (str): The API base URL, e.g. http://localhost:8000.
+        queries (list): (title, relevant role numbers) pairs.
+        params (dict): Search parameters.
+        concurrency (int): Number of requests in flight at once.
+        warmup (int): Unmeasured warm-up requests.
+        ready_timeout (float): Seconds to wait for the API to become ready.
+    Returns:
+        dict: Startup time, latency summary, relevance and server peak RSS.
+    """
+    deadline = time.monotonic() + ready_timeout
+    while True:
+        try:
+            status, body = http_get(f"{base_url}/health/ready")
+            break
+        except urllib.error.HTTPError as e:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"API not ready after {ready_timeout}s: {e.read().decode('utf-8')}")
+        except urllib.error.URLError:
+            if time.monotonic() > deadline:
+                raise
+        time.sleep(0.5)
+    startup_timings = json.loads(body)["timings"]
+
+    def search_one(query):
+        request = urllib.request.Request(
+            f"{base_url}/search",
+            data=json.dumps({"query": query, **params}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())["results"]
+
+    latency, ranked = replay(search_one, [title for title, _ in queries], concurrency, warmup)
+
+    # Server memory, from the process metrics on /metrics
+    server_rss = {}
+    for line in http_get(f"{base_url}/metrics")[1].splitlines():
+        name, _, value = line.partition(" ")
+        if name in ("process_resident_memory_bytes", "process_max_resident_memory_bytes"):
+            server_rss[name] = round(float(value) / 2 ** 20, 1)
+
+    return {
+        "startup_s": startup_timings.get("total"),
+        "startup_timings": startup_timings,
+        "latency": latency,
+        "relevance": relevance(ranked, [expected for _, expected in queries], params["top_k"]),
+        "peak_rss_mb": server_rss.get("process_max_resident_memory_bytes"),
+        "rss_mb": server_rss.get("process_resident_memory_bytes")
+    }
+
+
+def compare(report, baseline, max_relevance_drop=0.0):
+    """
+    Compare a report against a baseline report of the same benchmark.
+    Args:
+        report (dict): The current report.
+        baseline (dict): The baseline report.
+        max_relevance_drop (float): Allowed absolute drop of any relevance metric.
+    Returns:
+        tuple: (list of printable comparison lines, list of relevance regressions).
+    """
+    lines, regressions = [], []
+    for target, result in report["results"].items():
+        base = baseline.get("results", {}).get(target)
+        if base is None:
+            continue
+        for key in ("qps", "p50_ms", "p95_ms", "p99_ms"):
+            old, new = base["latency"][key], result["latency"][key]
+            change = (new - old) / old * 100 if old else 0.0
+            lines.append(f"{target:<10} {key:<16} {old:>10} -> {new:<10} ({change:+.1f}%)")
+        for key, new in result["relevance"].items():
+            old = base["relevance"].get(key)
+            if old is None:
+                continue
+            lines.append(f"{target:<10} {key:<16} {old:>10} -> {new:<10}")
+            if new < old - max_relevance_drop:
+                regressions.append(f"{target} {key} dropped from {old} to {new}")
+    return lines, regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark /search latency and relevance on role-title queries")
+    parser.add_argument("--http", metavar="URL", help="Also benchmark a running API, e.g. http://localhost:8000")
+    parser.add_argument("--no-in-process", action="store_true", help="Skip the in-process benchmark")
+    parser.add_argument("--max-queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--use-cache", action="store_true", help="Keep the in-process query caches enabled")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--bm25-weight", type=float, default=0.4)
+    parser.add_argument("--vector-weight", type=float, default=0.6)
+    parser.add_argument("--mode", choices=["exhaustive", "candidates", "roles"], default="exhaustive")
+    parser.add_argument("--fusion", choices=["zscore", "rrf"], default="zscore")
+    parser.add_argument("--candidate-pool", type=int, default=200)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="A previous JSON report to compare against")
+    parser.add_argument("--max-relevance-drop", type=float, default=0.0,
+                        help="Exit with status 1 if any relevance metric drops by more than this")
+    args = parser.parse_args()
+
+    params = {name: getattr(args, name) for name in SEARCH_PARAMS}
+    queries = build_query_set(indexed_roles=indexed_role_numbers(), max_queries=args.max_queries, seed=args.seed)
+
+    report = {
+        "params": params,
+        "queries": len(queries),
+        "seed": args.seed,
+        "concurrency": args.concurrency,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "config": {name: os.environ[name] for name in (
+                "VECTOR_BACKEND", "ENCODER_BACKEND", "INDEX_MODE", "EMBEDDINGS_DTYPE", "SEARCH_WORKERS",
+                "LEXICAL_BACKEND"
+            ) if name in os.environ}
+        },
+        "results": {}
+    }
+    if not args.no_in_process:
+        report["results"]["in_process"] = run_in_process(queries, params, args.concurrency, args.warmup,
+                                                         args.use_cache)
+    if args.http:
+        report["results"]["http"] = run_http(args.http.rstrip("/"), queries, params, args.concurrency, args.warmup)
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            lines, regressions = compare(report, json.load(f), args.max_relevance_drop)
+        print("\n".join(lines), file=sys.stderr)
+        if regressions:
+            print("Relevance regressions:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,350 @@
+import json
+import math
+import os
+import numpy as np
+
+# Arrays written by SparseBM25.save, in addition to the JSON header
+ARRAY_FIELDS = ["indptr", "doc_ids", "tfs", "idf", "doc_len", "len_norm", "weights"]
+
+
+class SparseBM25:
+    """
+    Okapi BM25 over an inverted postings matrix (CSR, one row per term).
+
+    Each posting stores its final per-term contribution, so scoring a query
+    only touches the postings of the query terms. Scores are bit-for-bit
+    identical to `rank_bm25.BM25Okapi.get_scores`.
+    """
+
+    def __init__(self, vocab, indptr, doc_ids, tfs, idf, doc_len, avgdl, k1=1.5, b=0.75):
+        """
+        Args:
+            vocab (dict): Mapping of term to row in the postings matrix.
+            indptr (np.ndarray): Row offsets into `doc_ids` / `tfs`, length n_terms + 1.
+            doc_ids (np.ndarray): Document index of each posting.
+            tfs (np.ndarray): Term frequency of each posting.
+            idf (np.ndarray): IDF of each term.
+            doc_len (np.ndarray): Token count of each document.
+            avgdl (float): Average document length.
+            k1 (float): Term frequency saturation.
+            b (float): Length normalization strength.
+        """
+        self.vocab = vocab
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        self.tfs = np.asarray(tfs, dtype=np.int32)
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.doc_len = np.asarray(doc_len, dtype=np.int32)
+        self.avgdl = avgdl
+        self.k1 = k1
+        self.b = b
+
+        # Precompute length norms and the weight of every posting
+        # (same operation order as rank_bm25 so the floats match exactly)
+        self.len_norm = self.k1 * (1 - self.b + self.b * self.doc_len / self.avgdl)
+        term_of_posting = np.repeat(np.arange(len(self.idf)), np.diff(self.indptr))
+        self.weights = self.idf[term_of_posting] * (
+            self.tfs * (self.k1 + 1) / (self.tfs + self.len_norm[self.doc_ids])
+        )
+
+    @property
+    def n_docs(self):
+        return len(self.doc_len)
+
+    @classmethod
+    def from_doc_freqs(cls, doc_freqs, idf, avgdl, k1=1.5, b=0.75):
+        """
+        Build the postings matrix from per-document term frequency dicts.
+        Args:
+            doc_freqs (list): One {term: frequency} dict per document.
+            idf (dict): Mapping of term to IDF.
+            avgdl (float): Average document length.
+            k1 (float): Term frequency saturation.
+            b (float): Length normalization strength.
+        Returns:
+            SparseBM25: The index.
+        """
+        postings = {}
+        doc_len = []
+        for doc_id, freqs in enumerate(doc_freqs):
+            doc_len.append(sum(freqs.values()))
+            for term, tf in freqs.items():
+                postings.setdefault(term, []).append((doc_id, tf))
+
+        vocab = {term: i for i, term in enumerate(postings)}
+        indptr = [0]
+        doc_ids, tfs = [], []
+        for term in vocab:
+            for doc_id, tf in postings[term]:
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+            indptr.append(len(doc_ids))
+
+        idf = [idf[term] for term in vocab]
+        return cls(vocab, indptr, doc_ids, tfs, idf, doc_len, avgdl, k1=k1, b=b)
+
+    @classmethod
+    def from_okapi(cls, bm25):
+        """
+        Convert a fitted `rank_bm25.BM25Okapi` index.
+        Args:
+            bm25 (BM25Okapi): The fitted index.
+        Returns:
+            SparseBM25: The equivalent sparse index.
+        """
+        return cls.from_doc_freqs(bm25.doc_freqs, bm25.idf, bm25.avgdl, k1=bm25.k1, b=bm25.b)
+
+    @classmethod
+    def from_corpus(cls, corpus, k1=1.5, b=0.75, epsilon=0.25):
+        """
+        Fit the index on a tokenized corpus, using BM25Okapi's IDF definition.
+        Args:
+            corpus (list): One list of tokens per document.
+            k1 (float): Term frequency saturation.
+            b (float): Length normalization strength.
+            epsilon (float): Floor for negative IDFs, as a fraction of the average IDF.
+        Returns:
+            SparseBM25: The index.
+        """
+        doc_freqs = []
+        nd = {}
+        num_tokens = 0
+        for document in corpus:
+            num_tokens += len(document)
+            freqs = {}
+            for term in document:
+                freqs[term] = freqs.get(term, 0) + 1
+            doc_freqs.append(freqs)
+            for term in freqs:
+                nd[term] = nd.get(term, 0) + 1
+
+        corpus_size = len(corpus)
+        return cls.from_doc_freqs(doc_freqs, okapi_idf(nd, corpus_size, epsilon),
+                                  num_tokens / corpus_size, k1=k1, b=b)
+
+    def doc_freqs(self):
+        """
+        Per-document term frequencies, the inverse of `from_doc_freqs`.
+        Returns:
+            list: One {term: frequency} dict per document.
+        """
+        freqs = [{} for _ in range(self.n_docs)]
+        for term, row in self.vocab.items():
+            start, end = self.indptr[row], self.indptr[row + 1]
+            for doc_id, tf in zip(self.doc_ids[start:end].tolist(), self.tfs[start:end].tolist()):
+                freqs[doc_id][term] = tf
+        return freqs
+
+    def save(self, directory, prefix="bm25_"):
+        """
+        Write the index as plain .npy arrays plus a JSON header, loadable with `load`.
+        Args:
+            directory (str): The output directory.
+            prefix (str): File name prefix of the arrays.
+        Returns:
+            None
+        """
+        for name in ARRAY_FIELDS:
+            np.save(os.path.join(directory, f"{prefix}{name}.npy"), getattr(self, name))
+        with open(os.path.join(directory, f"{prefix}header.json"), "w", encoding="utf-8") as f:
+            json.dump({"avgdl": self.avgdl, "k1": self.k1, "b": self.b, "vocab": list(self.vocab)}, f,
+                      ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory, prefix="bm25_", mmap_mode="r"):
+        """
+        Load an index written by `save`. With mmap_mode="r" the postings stay
+        in the OS page cache and are shared by every process mapping them;
+        nothing is recomputed at load time.
+        Args:
+            directory (str): The index directory.
+            prefix (str): File name prefix of the arrays.
+            mmap_mode (str): NumPy mmap mode, or None to read the arrays into memory.
+        Returns:
+            SparseBM25: The index.
+        """
+        with open(os.path.join(directory, f"{prefix}header.json"), "r", encoding="utf-8") as f:
+            header = json.load(f)
+
+        index = cls.__new__(cls)
+        index.vocab = {term: i for i, term in enumerate(header["vocab"])}
+        index.avgdl = header["avgdl"]
+        index.k1 = header["k1"]
+        index.b = header["b"]
+        for name in ARRAY_FIELDS:
+            setattr(index, name, np.load(os.path.join(directory, f"{prefix}{name}.npy"), mmap_mode=mmap_mode))
+        return index
+
+    def get_scores(self, query):
+        """
+        Score every document for a tokenized query.
+        Args:
+            query (list): The query tokens.
+        Returns:
+            np.ndarray: BM25 score per document.
+        """
+        scores = np.zeros(self.n_docs)
+        for term in query:
+            row = self.vocab.get(term)
+            if row is None:
+                continue
+            start, end = self.indptr[row], self.indptr[row + 1]
+            scores[self.doc_ids[start:end]] += self.weights[start:end]
+        return scores
+
+    def top_n(self, query, n):
+        """
+        Retrieve the n best-scoring documents that match at least one query term.
+        Args:
+            query (list): The query tokens.
+            n (int): The number of documents to return.
+        Returns:
+            tuple: Document indices (best first) and the full score vector.
+        """
+        scores = self.get_scores(query)
+        return top_matches(scores, n), scores
+
+
+def top_matches(scores, n):
+    """
+    Indices of the n highest non-zero scores, best first.
+    Args:
+        scores (np.ndarray): BM25 score per document.
+        n (int): The number of documents to return.
+    Returns:
+        np.ndarray: The document indices.
+    """
+    matched = np.flatnonzero(scores)
+    if len(matched) > n:
+        matched = matched[np.argpartition(-scores[matched], n - 1)[:n]]
+    return matched[np.argsort(-scores[matched], kind="stable")]
+
+
+class FtsIndex:
+    """
+    Lexical scoring with SQLite FTS5, as an alternative to the BM25 index.
+    FTS5 ranks roles (title and description) with its own bm25(); every
+    chunk gets the score of its role. Exposes the `get_scores` / `top_n`
+    interface of SparseBM25, so HybridSearcher can use it in its place.
+    """
+
+    def __init__(self, connections, roles, role_codes, table="roles_fts", weights=(2.0, 1.0)):
+        """
+        Args:
+            connections: Object whose `execute` runs SQL on the roles database (e.g. ReadOnlyConnections).
+            roles (np.ndarray): Sorted unique role numbers (ChunkMetadata.roles).
+            role_codes (np.ndarray): Index into `roles` of every chunk.
+            table (str): The FTS5 table.
+            weights (tuple): bm25() column weights for title and description.
+        """
+        self.connections = connections
+        self.roles = roles
+        self.role_codes = role_codes
+        self.sql = (f"SELECT r.role_number, -bm25({table}, ?, ?) FROM {table} "
+                    f"JOIN roles r ON r.rowid = {table}.rowid WHERE {table} MATCH ?")
+        self.weights = weights
+
+    @property
+    def n_docs(self):
+        return len(self.role_codes)
+
+    @staticmethod
+    def match_expression(query):
+        """
+        OR of the query tokens as quoted FTS5 strings; punctuation-only tokens are dropped.
+        """
+        terms = ['"' + term.replace('"', '""') + '"' for term in query if any(ch.isalnum() for ch in term)]
+        return " OR ".join(dict.fromkeys(terms))
+
+    def get_scores(self, query):
+        """
+        Score every chunk for a tokenized query.
+        Args:
+            query (list): The query tokens.
+        Returns:
+            np.ndarray: FTS5 bm25 score of each chunk's role (0 for roles without a match).
+        """
+        expression = self.match_expression(query)
+        if not expression:
+            return np.zeros(self.n_docs)
+        rows = self.connections.execute(self.sql, (*self.weights, expression)).fetchall()
+
+        role_scores = np.zeros(len(self.roles))
+        if rows:
+            role_numbers = np.asarray([role_number for role_number, _ in rows], dtype=str)
+            positions = np.minimum(np.searchsorted(self.roles, role_numbers), len(self.roles) - 1)
+            indexed = self.roles[positions] == role_numbers
+            role_scores[positions[indexed]] = np.asarray([score for _, score in rows])[indexed]
+        return role_scores[self.role_codes]
+
+    def top_n(self, query, n):
+        """
+        Retrieve the n best-scoring chunks that match at least one query term.
+        Args:
+            query (list): The query tokens.
+            n (int): The number of chunks to return.
+        Returns:
+            tuple: Chunk indices (best first) and the full score vector.
+        """
+        scores = self.get_scores(query)
+        return top_matches(scores, n), scores
+
+
+def okapi_idf(nd, corpus_size, epsilon=0.25):
+    """
+    Compute BM25Okapi IDFs, flooring negative values at epsilon * average IDF.
+    Args:
+        nd (dict): Mapping of term to the number of documents containing it.
+        corpus_size (int): Number of documents.
+        epsilon (float): Floor for negative IDFs, as a fraction of the average IDF.
+    Returns:
+        dict: Mapping of term to IDF.
+    """
+    idf = {}
+    idf_sum = 0
+    negative_idfs = []
+    for term, freq in nd.items():
+        value = math.log(corpus_size - freq + 0.5) - math.log(freq + 0.5)
+        idf[term] = value
+        idf_sum += value
+        if value < 0:
+            negative_idfs.append(term)
+
+    eps = epsilon * (idf_sum / len(idf))
+    for term in negative_idfs:
+        idf[term] = eps
+    return idf
+
+
+def verify_against_okapi(bm25, queries):
+    """
+    Check that SparseBM25 reproduces BM25Okapi scores exactly.
+    Args:
+        bm25 (BM25Okapi): The fitted reference index.
+        queries (list): Tokenized queries to compare on.
+    Returns:
+        int: The number of queries whose scores differ.
+    """
+    sparse = SparseBM25.from_okapi(bm25)
+    mismatches = 0
+    for query in queries:
+        if not np.array_equal(bm25.get_scores(query), sparse.get_scores(query)):
+            mismatches += 1
+            print(f"Mismatch for query: {query}")
+    return mismatches
+
+
+if __name__ == "__main__":
+    import pickle
+
+    with open("db/bm25_index.pkl", "rb") as f:
+        bm25_index, bm25_ids = pickle.load(f)
+
+    # Single terms, multi-term queries with repeats, and unknown terms
+    vocab = sorted(bm25_index.idf)
+    queries = [[term] for term in vocab]
+    queries += [vocab[i:i + 5] for i in range(0, len(vocab), 5)]
+    queries += [["driver", "driver", "electrician"], ["zzz-unknown"], []]
+
+    mismatches = verify_against_okapi(bm25_index, queries)
+    print(f"Checked {len(queries)} queries over {len(bm25_ids)} chunks: {mismatches} mismatches.")
@@ -0,0 +1,219 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+
+def normalize_query(query):
+    """
+    Normalize query text for use as a cache key (lowercase, collapsed whitespace).
+    MiniLM's tokenizer is uncased, so this does not change the embedding.
+    Args:
+        query (str): The query text.
+    Returns:
+        str: The normalized query.
+    """
+    return " ".join(query.lower().split())
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with optional per-entry TTL and hit/miss counters.
+
+    When `spill_dir` is set, NumPy values evicted from memory are written to
+    disk as .npy files and promoted back into memory on the next lookup. The
+    directory holds at most `spill_maxsize` files, least recently used first
+    out; files are written to a temporary name and renamed into place, so a
+    reader never sees a partial file.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, spill_dir=None, spill_maxsize=65536):
+        """
+        Args:
+            maxsize (int): Maximum number of entries kept in memory (0 disables the cache).
+            ttl (float): Seconds an entry stays valid, or None for no expiry.
+            spill_dir (str): Directory for evicted NumPy values, or None to drop them.
+            spill_maxsize (int): Maximum number of files kept in `spill_dir`.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.spill_dir = spill_dir
+        self.spill_maxsize = spill_maxsize
+        self._data = OrderedDict()
+        self._spilled = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+            # Adopt files left by earlier runs, oldest first
+            files = []
+            for entry in os.scandir(spill_dir):
+                if entry.name.endswith(".npy"):
+                    try:
+                        files.append((entry.stat().st_mtime, entry.path))
+                    except FileNotFoundError:
+                        pass
+            for _, path in sorted(files):
+                self._spilled[path] = None
+            self._prune_spill()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _spill_path(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.spill_dir, f"{digest}.npy")
+
+    def _expired(self, stored_at):
+        return self.ttl is not None and time.monotonic() - stored_at > self.ttl
+
+    def _expired_file(self, path):
+        return self.ttl is not None and time.time() - os.path.getmtime(path) > self.ttl
+
+    def _remove_file(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _prune_spill(self):
+        """
+        Delete the least recently used spill files beyond `spill_maxsize`.
+        """
+        with self._lock:
+            pruned = []
+            while len(self._spilled) > self.spill_maxsize:
+                pruned.append(self._spilled.popitem(last=False)[0])
+        for path in pruned:
+            self._remove_file(path)
+
+    def _spill(self, key, value):
+        """
+        Write an evicted array to the spill directory through a temporary file.
+        A failed write (e.g. a full disk) only loses the entry.
+        """
+        path = self._spill_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.save(f, value)
+            os.replace(tmp_path, path)
+        except OSError:
+            self._remove_file(tmp_path)
+            return
+        with self._lock:
+            self._spilled[path] = None
+            self._spilled.move_to_end(path)
+        self._prune_spill()
+
+    def _load_spilled(self, path):
+        """
+        Load a spilled array, or return None if it is missing, expired or unreadable
+        (e.g. removed by another process).
+        """
+        try:
+            if self._expired_file(path):
+                return None
+            return np.load(path)
+        except (OSError, ValueError, EOFError):
+            return None
+
+    def get(self, key, default=None):
+        """
+        Look up a key, refreshing its LRU position.
+        Args:
+            key: The cache key.
+            default: Value returned on a miss.
+        Returns:
+            The cached value, or `default`.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and not self._expired(entry[1]):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._data[key]
+
+        # Fall back to the on-disk spill
+        if self.spill_dir:
+            path = self._spill_path(key)
+            value = self._load_spilled(path)
+            if value is not None:
+                self.put(key, value)
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                    if path in self._spilled:
+                        self._spilled.move_to_end(path)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def put(self, key, value):
+        """
+        Insert or refresh a key, evicting the least recently used entries if needed.
+        Args:
+            key: The cache key.
+            value: The value to store.
+        Returns:
+            None
+        """
+        if self.maxsize <= 0:
+            return
+        evicted = []
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                evicted.append(self._data.popitem(last=False))
+                self.evictions += 1
+
+        # Write evicted arrays outside the lock
+        if self.spill_dir:
+            for old_key, (old_value, _) in evicted:
+                if isinstance(old_value, np.ndarray):
+                    self._spill(old_key, old_value)
+
+    def clear(self):
+        """
+        Drop every entry, in memory and in the spill directory.
+        Returns:
+            None
+        """
+        with self._lock:
+            self._data.clear()
+            spilled = list(self._spilled)
+            self._spilled.clear()
+        for path in spilled:
+            self._remove_file(path)
+
+    def stats(self):
+        """
+        Report cache size and hit/miss counters.
+        Returns:
+            dict: The cache statistics.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "disk_size": len(self._spilled),
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
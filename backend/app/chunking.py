@@ -1,9 +1,33 @@
 import json
+import os
+import re
+import time
+import hashlib
+from functools import lru_cache
 import chromadb
-from nltk.tokenize import word_tokenize
+import numpy as np
+from nltk.tokenize import NLTKWordTokenizer, PunktTokenizer, word_tokenize
+from nltk.tokenize.util import align_tokens
 from sentence_transformers import SentenceTransformer
-from rank_bm25 import BM25Okapi
-import pickle
+from .bm25 import ARRAY_FIELDS, SparseBM25
+from .shared_index import export_from_collection
+from .utils import iter_roles
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# The model truncates its input at this many word pieces, [CLS] and [SEP] included
+MODEL_MAX_SEQ_LENGTH = 256
+
+# "tokens": the original fixed_token_chunk (tokens re-joined with spaces);
+# "spans": windows of max_tokens word tokens sliced out of the description;
+# "sentences": whole sentences packed up to the model's sequence length.
+# "spans" and "sentences" are opt-in: they change the stored chunk text, and their
+# BM25 tokens come from the original-case text rather than `word_tokenize(text.lower())`
+CHUNKERS = ["tokens", "spans", "sentences"]
+DEFAULT_CHUNKER = "tokens"
+
+_word_tokenizer = NLTKWordTokenizer()
+_quotes = re.compile(r"``|'{2}|\"")
 
 
 def fixed_token_chunk(text, max_tokens=250, overlap=50):
@@ -32,60 +56,355 @@ def fixed_token_chunk(text, max_tokens=250, overlap=50):
     return chunks
 
 
+@lru_cache(maxsize=None)
+def punkt_tokenizer(language="english"):
+    return PunktTokenizer(language)
+
+
+@lru_cache(maxsize=None)
+def load_tokenizer(model_name=MODEL_NAME):
+    """
+    Load the model's own (fast) word piece tokenizer, without the model weights.
+    """
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(model_name)
+
+
+def tokenize_with_spans(text, language="english"):
+    """
+    Tokenize text once, exactly like `word_tokenize`, and keep where every
+    token and sentence is in the text.
+    Args:
+        text (str): The input text.
+        language (str): The Punkt sentence model.
+    Returns:
+        tuple: The tokens, an (n, 2) array of their [start, end) character
+        offsets, and the list of sentence (start, end) offsets.
+    """
+    tokens, spans = [], []
+    sentences = list(punkt_tokenizer(language).span_tokenize(text))
+    for sent_start, sent_end in sentences:
+        sentence = text[sent_start:sent_end]
+        raw_tokens = _word_tokenizer.tokenize(sentence)
+
+        # The tokenizer rewrites double quotes as `` and ''; align the originals
+        if '"' in sentence or "''" in sentence:
+            matched = iter(_quotes.findall(sentence))
+            aligned = [next(matched) if token in ('"', "``", "''") else token for token in raw_tokens]
+        else:
+            aligned = raw_tokens
+        tokens += raw_tokens
+        spans += [(sent_start + start, sent_start + end) for start, end in align_tokens(aligned, sentence)]
+    return tokens, np.asarray(spans, dtype=np.int64).reshape(-1, 2), sentences
+
+
+def span_chunks(spans, max_tokens=250, overlap=50):
+    """
+    The windows of `fixed_token_chunk`, as character spans of the original
+    text instead of re-joined tokens.
+    Args:
+        spans (np.ndarray): Token offsets from `tokenize_with_spans`.
+        max_tokens (int): The maximum number of tokens per chunk.
+        overlap (int): The number of overlapping tokens between chunks.
+    Returns:
+        list: (start, end, first_token, end_token) per chunk.
+    """
+    if overlap >= max_tokens:
+        raise ValueError(f"overlap ({overlap}) must be smaller than max_tokens ({max_tokens})")
+    chunks = []
+    start = 0
+    while start < len(spans):
+        end = min(start + max_tokens, len(spans))
+        chunks.append((int(spans[start, 0]), int(spans[end - 1, 1]), start, end))
+        if end == len(spans):
+            break
+        start = end - overlap
+    return chunks
+
+
+def sentence_chunks(text, spans, sentences, tokenizer, max_length=MODEL_MAX_SEQ_LENGTH - 2, overlap=50):
+    """
+    Pack whole sentences into chunks of at most `max_length` word pieces of
+    the model's tokenizer, so no chunk is truncated by the model. Sentences
+    longer than that are cut between word tokens. Consecutive chunks share
+    the trailing sentences of the previous chunk that fit in `overlap` pieces.
+    Args:
+        text (str): The input text.
+        spans (np.ndarray): Token offsets from `tokenize_with_spans`.
+        sentences (list): Sentence offsets from `tokenize_with_spans`.
+        tokenizer: A fast Hugging Face tokenizer (offset mapping support).
+        max_length (int): The maximum number of word pieces per chunk.
+        overlap (int): The maximum number of word pieces shared by consecutive chunks.
+    Returns:
+        list: (start, end, first_token, end_token) per chunk.
+    """
+    if not sentences:
+        return []
+    # Word pieces of the whole text, counted per character range by their start offset
+    encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+    piece_starts = np.asarray([start for start, _ in encoding["offset_mapping"]], dtype=np.int64)
+
+    def pieces(start, end):
+        return int(np.searchsorted(piece_starts, end) - np.searchsorted(piece_starts, start))
+
+    # Units are sentences, or runs of word tokens for sentences that do not fit
+    units = []
+    for sent_start, sent_end in sentences:
+        count = pieces(sent_start, sent_end)
+        if count <= max_length:
+            units.append((sent_start, sent_end, count))
+            continue
+        first = int(np.searchsorted(spans[:, 0], sent_start))
+        last = int(np.searchsorted(spans[:, 0], sent_end))
+        unit_start, unit_count = None, 0
+        for token_start, token_end in spans[first:last].tolist():
+            count = pieces(token_start, token_end)
+            if unit_start is not None and unit_count + count > max_length:
+                units.append((unit_start, previous_end, unit_count))
+                unit_start, unit_count = None, 0
+            if unit_start is None:
+                unit_start = token_start
+            unit_count += count
+            previous_end = token_end
+        if unit_start is not None:
+            units.append((unit_start, previous_end, unit_count))
+
+    chunks = []
+    first = 0
+    while first < len(units):
+        end, total = first, 0
+        while end < len(units) and (end == first or total + units[end][2] <= max_length):
+            total += units[end][2]
+            end += 1
+        start_char, end_char = units[first][0], units[end - 1][1]
+        chunks.append((start_char, end_char, int(np.searchsorted(spans[:, 0], start_char)),
+                       int(np.searchsorted(spans[:, 0], end_char))))
+        if end == len(units):
+            break
+
+        # Step back over trailing sentences that fit in the overlap, leaving
+        # room for the next unit so every chunk extends past the previous one
+        next_first, shared = end, 0
+        while (next_first - 1 > first and shared + units[next_first - 1][2] <= overlap
+               and shared + units[next_first - 1][2] + units[end][2] <= max_length):
+            next_first -= 1
+            shared += units[next_first][2]
+        first = next_first
+    return chunks
+
+
+def chunk_description(text, chunker=DEFAULT_CHUNKER, max_tokens=250, overlap=50, tokenizer=None):
+    """
+    Chunk a role description and produce each chunk's BM25 tokens from the
+    same tokenization pass.
+    Args:
+        text (str): The role description.
+        chunker (str): One of CHUNKERS.
+        max_tokens (int): Tokens per chunk ("spans", "tokens"); caps the word pieces per chunk ("sentences").
+        overlap (int): Tokens (word pieces for "sentences") shared by consecutive chunks.
+        tokenizer: The model's tokenizer, required by "sentences" (see `load_tokenizer`).
+    Returns:
+        list: (chunk text, BM25 tokens) per chunk.
+    """
+    if chunker == "tokens":
+        return [(chunk, word_tokenize(chunk.lower())) for chunk in fixed_token_chunk(text, max_tokens, overlap)]
+
+    tokens, spans, sentences = tokenize_with_spans(text)
+    if chunker == "spans":
+        chunks = span_chunks(spans, max_tokens, overlap)
+    elif chunker == "sentences":
+        if tokenizer is None:
+            raise ValueError("The sentences chunker needs the model's tokenizer")
+        chunks = sentence_chunks(text, spans, sentences, tokenizer, min(max_tokens, MODEL_MAX_SEQ_LENGTH - 2), overlap)
+    else:
+        raise ValueError(f"Unknown chunker {chunker!r}, expected one of {CHUNKERS}")
+
+    lowered = [token.lower() for token in tokens]
+    return [(text[start:end], lowered[first:last]) for start, end, first, last in chunks]
+
+
 def store_chunks_in_chroma_and_bm25(json_file, collection_name="role_descriptions",
-                                    max_tokens=250, overlap=50):
+                                    max_tokens=250, overlap=50, encode_batch_size=512,
+                                    checkpoint_file="db/build_checkpoint.json", chunker=DEFAULT_CHUNKER):
     """
-    Store text chunks in ChromaDB and BM25 index.
+    Store text chunks in ChromaDB and the index bundle (BM25, chunk metadata, embeddings).
+    For corpora too large to keep every chunk in memory, use `app.ingest`.
+    The build runs as a pipeline: chunk and tokenize everything, then encode
+    and upsert into Chroma in large batches, then fit BM25. Progress is
+    checkpointed after every batch, so an interrupted build resumes at the
+    first batch that was not written.
+
     Args:
-        json_file (str): The path to the JSON file.
+        json_file (str): The path to the roles JSON file (any layout `iter_roles` reads).
         collection_name (str): The name of the ChromaDB collection.
         max_tokens (int): The maximum number of tokens per chunk.
         overlap (int): The number of overlapping tokens between chunks.
+        encode_batch_size (int): The number of chunks encoded and written per batch.
+        checkpoint_file (str): The path of the progress checkpoint.
+        chunker (str): One of CHUNKERS.
     Returns:
         tuple: A tuple containing the ChromaDB collection, BM25 index, BM25 IDs, and the model.
     """
+    timings = {}
 
-    # Load JSON data
-    with open(json_file, "r", encoding="utf-8") as f:
-        roles_data = json.load(f)
+    # Stage 1: chunk and tokenize every description (roles are streamed from the file)
+    start = time.perf_counter()
+    tokenizer = load_tokenizer(MODEL_NAME) if chunker == "sentences" else None
+    bm25_corpus = []
+    bm25_ids = []
+    chunk_texts = []
+    chunk_metadatas = []
+    for role in iter_roles(json_file):
+        role_number = role["role_number"]
+        chunks = chunk_description(role["Role Description"], chunker, max_tokens, overlap, tokenizer)
+        for idx, (chunk, tokens) in enumerate(chunks):
+            bm25_ids.append(f"{role_number}_chunk{idx}")
+            chunk_texts.append(chunk)
+            chunk_metadatas.append({"role_number": role_number, "chunk_index": idx})
+            bm25_corpus.append(tokens)
+    timings["chunk"] = time.perf_counter() - start
 
     # Initialize model
-    model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+    model = SentenceTransformer(MODEL_NAME)
 
     # ChromaDB client
     client = chromadb.PersistentClient(path="db/chroma_db")
     collection = client.get_or_create_collection(name=collection_name)
 
-    bm25_corpus = []
-    bm25_ids = []
+    # Resume from the checkpoint if it belongs to this exact build: same
+    # parameters, chunk layout and chunk text (an edited description restarts it)
+    text_digest = hashlib.sha1()
+    for chunk in chunk_texts:
+        text_digest.update(hashlib.sha1(chunk.encode("utf-8")).digest())
+    build_key = hashlib.sha1(
+        json.dumps([collection_name, MODEL_NAME, chunker, max_tokens, overlap, bm25_ids,
+                    text_digest.hexdigest()]).encode("utf-8")
+    ).hexdigest()
+    written = 0
+    checkpoint = {}
+    if os.path.exists(checkpoint_file):
+        with open(checkpoint_file, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    if checkpoint.get("build_key") == build_key:
+        written = checkpoint["written"]
+        print(f"Resuming build at chunk {written}/{len(bm25_ids)}.")
 
-    for role_number, description in roles_data.items():
-        chunks = fixed_token_chunk(description, max_tokens=max_tokens, overlap=overlap)
-        for idx, chunk in enumerate(chunks):
-            emb = model.encode(chunk).tolist()
-            doc_id = f"{role_number}_chunk{idx}"
-
-            # Store in Chroma
-            collection.add(
-                ids=[doc_id],
-                documents=[chunk],
-                embeddings=[emb],
-                metadatas=[{"role_number": role_number, "chunk_index": idx}]
-            )
-
-            # Prepare for BM25
-            bm25_corpus.append(word_tokenize(chunk.lower()))
-            bm25_ids.append(doc_id)
-
-    # Build BM25 index
-    bm25_index = BM25Okapi(bm25_corpus)
-    with open("db/bm25_index.pkl", "wb") as f:
-        pickle.dump((bm25_index, bm25_ids), f)
+    resumed_at = written
+
+    # Stage 2 and 3: encode in batches and upsert into Chroma in bulk
+    timings["encode"] = 0.0
+    timings["write"] = 0.0
+    for batch_start in range(written, len(bm25_ids), encode_batch_size):
+        batch_end = batch_start + encode_batch_size
+
+        start = time.perf_counter()
+        embeddings = model.encode(chunk_texts[batch_start:batch_end], batch_size=64)
+        timings["encode"] += time.perf_counter() - start
+
+        # Upsert keeps the write idempotent if the batch is retried
+        start = time.perf_counter()
+        collection.upsert(
+            ids=bm25_ids[batch_start:batch_end],
+            documents=chunk_texts[batch_start:batch_end],
+            embeddings=embeddings.tolist(),
+            metadatas=chunk_metadatas[batch_start:batch_end]
+        )
+        timings["write"] += time.perf_counter() - start
+
+        written = min(batch_end, len(bm25_ids))
+        with open(checkpoint_file, "w", encoding="utf-8") as f:
+            json.dump({"build_key": build_key, "written": written}, f)
+        print(f"Encoded and stored {written}/{len(bm25_ids)} chunks.")
+
+    # Stage 4: build BM25 index
+    start = time.perf_counter()
+    bm25_index = SparseBM25.from_corpus(bm25_corpus)
+    timings["bm25"] = time.perf_counter() - start
+
+    # Stage 5: write the versioned, memory-mappable index bundle
+    start = time.perf_counter()
+    params = {"collection": collection_name, "model": MODEL_NAME, "chunker": chunker, "max_tokens": max_tokens,
+              "overlap": overlap}
+    export_from_collection(collection, bm25_index, bm25_ids, params=params)
+    timings["bundle"] = time.perf_counter() - start
+
+    # The build is complete, so the checkpoint is no longer needed
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
 
     print(f"Stored {len(bm25_corpus)} chunks in Chroma and BM25.")
+    for stage, seconds in timings.items():
+        # Encode and write only processed the chunks left after a resume
+        count = len(bm25_ids) - resumed_at if stage in ("encode", "write") else len(bm25_ids)
+        rate = count / seconds if seconds else float("inf")
+        print(f"  {stage:<7} {seconds:8.2f}s  {rate:10.1f} chunks/s")
     return collection, bm25_index, bm25_ids, model
 
 
-if __name__ =="__main__":
-    collection, bm25_index, bm25_ids, model = store_chunks_in_chroma_and_bm25( "dump/roles.json", collection_name="nco_roles" )
-   
\ No newline at end of file
+def chunking_report(json_file, chunkers=CHUNKERS, max_tokens=250, overlap=50, tokenizer=None, dim=384):
+    """
+    Chunk every role description with each chunker (BM25 tokenization
+    included) and compare throughput and the size of the resulting index.
+    Args:
+        json_file (str): The roles JSON (any layout `iter_roles` reads).
+        chunkers (list): Chunkers to compare.
+        max_tokens (int): The maximum number of tokens per chunk.
+        overlap (int): The number of overlapping tokens between chunks.
+        tokenizer: The model's tokenizer; needed by "sentences", and to count chunks the model would truncate.
+        dim (int): Embedding dimension, for the size of the embedding matrix.
+    Returns:
+        dict: Per chunker, counts, timings and sizes in MB.
+    """
+    descriptions = [role["Role Description"] for role in iter_roles(json_file)]
+    report = {}
+    for chunker in chunkers:
+        start = time.perf_counter()
+        chunks = [chunk for text in descriptions
+                  for chunk in chunk_description(text, chunker, max_tokens, overlap, tokenizer)]
+        seconds = time.perf_counter() - start
+
+        bm25_index = SparseBM25.from_corpus([tokens for _, tokens in chunks])
+        bm25_bytes = sum(getattr(bm25_index, name).nbytes for name in ARRAY_FIELDS)
+        text_bytes = sum(len(chunk.encode("utf-8")) for chunk, _ in chunks)
+        embedding_bytes = len(chunks) * dim * 4
+        report[chunker] = {
+            "chunks": len(chunks),
+            "seconds": round(seconds, 3),
+            "roles_per_s": round(len(descriptions) / seconds, 1),
+            "chunks_per_s": round(len(chunks) / seconds, 1),
+            "bm25_terms": len(bm25_index.vocab),
+            "bm25_postings": len(bm25_index.doc_ids),
+            "text_mb": round(text_bytes / 2 ** 20, 3),
+            "bm25_mb": round(bm25_bytes / 2 ** 20, 3),
+            "embeddings_mb": round(embedding_bytes / 2 ** 20, 3),
+            "index_mb": round((text_bytes + bm25_bytes + embedding_bytes) / 2 ** 20, 3)
+        }
+        if tokenizer is not None:
+            lengths = [len(ids) for ids in tokenizer([chunk for chunk, _ in chunks], verbose=False)["input_ids"]]
+            report[chunker]["truncated_by_model"] = sum(length > MODEL_MAX_SEQ_LENGTH for length in lengths)
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build Chroma and the index bundle, or compare the chunkers")
+    parser.add_argument("json_file", nargs="?", default="dump/roles.json")
+    parser.add_argument("--collection", default="nco_roles")
+    parser.add_argument("--chunker", choices=CHUNKERS, default=DEFAULT_CHUNKER)
+    parser.add_argument("--report", action="store_true",
+                        help="Compare chunking throughput and index size of every chunker instead of building")
+    args = parser.parse_args()
+
+    if args.report:
+        try:
+            tokenizer = load_tokenizer(MODEL_NAME)
+            chunkers = CHUNKERS
+        except OSError as e:
+            print(f"Model tokenizer unavailable ({e}), skipping the sentences chunker")
+            tokenizer = None
+            chunkers = [chunker for chunker in CHUNKERS if chunker != "sentences"]
+        print(json.dumps(chunking_report(args.json_file, chunkers, tokenizer=tokenizer), indent=2))
+    else:
+        store_chunks_in_chroma_and_bm25(args.json_file, collection_name=args.collection, chunker=args.chunker)
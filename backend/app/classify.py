@@ -0,0 +1,353 @@
+import csv
+import json
+import os
+import shutil
+import time
+from .cache import normalize_query
+from .encoders import MODEL_NAME, ENCODER_BACKENDS
+from .search import HybridSearcher
+from .shared_index import SHARED_INDEX_DIR, load_shared_index, read_manifest
+
+SQLITE_DB_PATH = "db/roles.db"
+ONNX_DIR = "db/onnx"
+CHECKPOINT_FILE = "checkpoint.json"
+SHARD_SIZE = 5000
+
+# Search parameters of a run; resuming with different values would mix rankings
+RUN_PARAMS = ["top_k", "bm25_weight", "vector_weight", "mode", "fusion", "candidate_pool"]
+
+
+def load_searcher(index_dir=SHARED_INDEX_DIR, db_path=SQLITE_DB_PATH, encoder_backend="torch", onnx_dir=ONNX_DIR):
+    """
+    Build a HybridSearcher without the API: every index is memory-mapped from
+    the index bundle, so worker processes share its pages, and vector search
+    runs on the numpy backend.
+    Args:
+        index_dir (str): The index bundle directory.
+        db_path (str): The roles database (for role titles).
+        encoder_backend (str): One of ENCODER_BACKENDS.
+        onnx_dir (str): Directory holding ONNX exports.
+    Returns:
+        HybridSearcher: The search engine, without caches.
+    """
+    from .encoders import load_encoder
+    from .roles_db import open_read_only
+
+    conn = open_read_only(db_path)
+    try:
+        indexes = load_shared_index(conn, index_dir, {"model": MODEL_NAME})
+    finally:
+        conn.close()
+    model = load_encoder(encoder_backend, MODEL_NAME, onnx_dir)
+    return HybridSearcher(model=model, collection=None, vector_backend="numpy", **indexes)
+
+
+def iter_records(path, column="title", id_column=None):
+    """
+    Stream (id, text) records from a CSV file (by column name) or a JSONL
+    file (by field name). Records without an id column are numbered from 0.
+    Args:
+        path (str): A .csv or .jsonl file.
+        column (str): Column or field holding the text to classify.
+        id_column (str): Column or field holding the record id, or None.
+    Returns:
+        generator: (id, text) pairs, in file order.
+    Raises:
+        ValueError: If a CSV file has no such column (checked before anything is read).
+    """
+    f = open(path, "r", encoding="utf-8", newline="")
+    if path.endswith(".csv"):
+        rows = csv.DictReader(f)
+        if column not in (rows.fieldnames or []):
+            f.close()
+            raise ValueError(f"Column {column!r} not found in {path}, columns are {rows.fieldnames}")
+    else:
+        rows = (json.loads(line) for line in f if line.strip())
+
+    def records():
+        with f:
+            for number, row in enumerate(rows):
+                yield (number if id_column is None else row[id_column]), str(row.get(column) or "")
+    return records()
+
+
+def iter_shards(records, shard_size=SHARD_SIZE):
+    """
+    Group records into numbered shards of `shard_size` consecutive records.
+    Shard numbers only depend on record positions, so a rerun over the same
+    input produces the same shards.
+    """
+    shard = []
+    shard_id = 0
+    for record in records:
+        shard.append(record)
+        if len(shard) == shard_size:
+            yield shard_id, shard
+            shard, shard_id = [], shard_id + 1
+    if shard:
+        yield shard_id, shard
+
+
+def part_path(work_dir, shard_id):
+    return os.path.join(work_dir, f"part-{shard_id:06d}.jsonl")
+
+
+def classify_records(searcher, records, params, batch_size=64):
+    """
+    Classify a list of records with `batch_search`. Texts that normalize to
+    the same query (case and whitespace) are searched once.
+    Args:
+        searcher (HybridSearcher): The search engine.
+        records (list): (id, text) pairs.
+        params (dict): Search parameters (see RUN_PARAMS).
+        batch_size (int): Queries encoded and scored together.
+    Returns:
+        list: One output row per record, with its top_k role numbers, titles and scores.
+    """
+    keys = [normalize_query(text) for _, text in records]
+    queries = [key for key in dict.fromkeys(keys) if key]
+    results = dict(zip(queries, searcher.batch_search(queries, batch_size=batch_size, **params)))
+
+    return [
+        {
+            "id": record_id,
+            "text": text,
+            "matches": [
+                {"role_number": result["role_number"], "role_title": result["role_title"],
+                 "score": round(result["combined_score"], 6)}
+                for result in results.get(key, [])
+            ]
+        }
+        for (record_id, text), key in zip(records, keys)
+    ]
+
+
+def write_part(path, rows):
+    """
+    Write a shard's output rows as JSONL, atomically: a part file only
+    exists once its shard is complete.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+
+
+# Per-process searcher of the pool workers, loaded once by `_init_worker`
+_worker = {}
+
+
+def _init_worker(index_dir, db_path, encoder_backend, onnx_dir, threads):
+    if encoder_backend.startswith("torch"):
+        import torch
+        torch.set_num_threads(threads)
+    _worker["searcher"] = load_searcher(index_dir, db_path, encoder_backend, onnx_dir)
+
+
+def _classify_shard(shard_id, records, path, params, batch_size):
+    write_part(path, classify_records(_worker["searcher"], records, params, batch_size))
+    return shard_id, len(records)
+
+
+def open_work_dir(work_dir, run, restart=False):
+    """
+    Prepare the checkpoint directory of a run. An existing directory is
+    resumed only if it was started with the same input, index and parameters.
+    Args:
+        work_dir (str): The checkpoint directory.
+        run (dict): Description of the run (input file, index version, parameters, shard size).
+        restart (bool): Discard an existing checkpoint directory instead of resuming it.
+    Returns:
+        set: Shard ids already completed.
+    Raises:
+        ValueError: If the directory holds a different run.
+    """
+    checkpoint_path = os.path.join(work_dir, CHECKPOINT_FILE)
+    if restart:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            previous = json.load(f)["run"]
+        if previous != run:
+            changed = sorted(key for key in run if previous.get(key) != run[key])
+            raise ValueError(f"{work_dir} holds a run with different {', '.join(changed)}. "
+                             f"Use --restart to discard it.")
+    os.makedirs(work_dir, exist_ok=True)
+
+    # Finished shards are the complete part files; interrupted ones left only a .tmp
+    done = {int(name[5:-6]) for name in os.listdir(work_dir)
+            if name.startswith("part-") and name.endswith(".jsonl")}
+    write_checkpoint(work_dir, run, done)
+    return done
+
+
+def write_checkpoint(work_dir, run, done):
+    """
+    Record the run and its completed shards in checkpoint.json (atomically).
+    """
+    tmp_path = os.path.join(work_dir, f"{CHECKPOINT_FILE}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"run": run, "completed_shards": sorted(done),
+                   "updated": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}, f, indent=2)
+    os.replace(tmp_path, os.path.join(work_dir, CHECKPOINT_FILE))
+
+
+def merge_parts(work_dir, n_shards, output):
+    """
+    Concatenate the part files, in shard order, into the output file.
+    Returns:
+        int: The number of output rows.
+    """
+    rows = 0
+    tmp_path = f"{output}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        for shard_id in range(n_shards):
+            with open(part_path(work_dir, shard_id), "r", encoding="utf-8") as f:
+                for line in f:
+                    out.write(line)
+                    rows += 1
+    os.replace(tmp_path, output)
+    return rows
+
+
+def classify_file(input_path, output, params, column="title", id_column=None, workers=1, shard_size=SHARD_SIZE,
+                  batch_size=64, work_dir=None, restart=False, keep_parts=False, index_dir=SHARED_INDEX_DIR,
+                  db_path=SQLITE_DB_PATH, encoder_backend="torch", onnx_dir=ONNX_DIR, progress=None):
+    """
+    Classify every record of a CSV or JSONL file into its top_k NCO roles.
+
+    The input is streamed and cut into shards of `shard_size` records. Shards
+    run on a pool of `workers` processes, each loading the memory-mapped index
+    bundle and the encoder once; at most two shards per worker are queued, so
+    memory does not grow with the input. Each finished shard is written to
+    its own part file in `work_dir` and checkpointed, and a rerun after a crash
+    skips the shards that already have one. Once every shard is done, the
+    parts are merged in input order into `output` (JSONL).
+
+    Args:
+        input_path (str): A .csv or .jsonl file.
+        output (str): The output JSONL file.
+        params (dict): Search parameters (see RUN_PARAMS).
+        column (str): Column or field holding the text to classify.
+        id_column (str): Column or field holding the record id, or None to number records.
+        workers (int): Worker processes (1 runs in this process).
+        shard_size (int): Records per shard.
+        batch_size (int): Queries encoded and scored together.
+        work_dir (str): Checkpoint directory, `<output>.parts` by default.
+        restart (bool): Discard an existing checkpoint directory instead of resuming it.
+        keep_parts (bool): Keep the checkpoint directory after merging.
+        index_dir (str): The index bundle directory.
+        db_path (str): The roles database.
+        encoder_backend (str): One of ENCODER_BACKENDS.
+        onnx_dir (str): Directory holding ONNX exports.
+        progress (callable): Called with (shards done, rows classified in this run) after each shard, or None.
+    Returns:
+        dict: Row, shard and resumed shard counts, and the elapsed seconds.
+    """
+    start = time.perf_counter()
+    work_dir = work_dir or f"{output}.parts"
+    stat = os.stat(input_path)
+    run = {
+        "input": os.path.abspath(input_path),
+        "input_bytes": stat.st_size,
+        "input_mtime": stat.st_mtime,
+        "column": column,
+        "id_column": id_column,
+        "shard_size": shard_size,
+        "index_version": read_manifest(index_dir, {"model": MODEL_NAME})["index_version"],
+        "params": {key: params[key] for key in RUN_PARAMS}
+    }
+    records = iter_records(input_path, column, id_column)
+    done = open_work_dir(work_dir, run, restart)
+    resumed = len(done)
+    shards = iter_shards(records, shard_size)
+    n_shards = 0
+    rows = 0
+
+    def finished(shard_id, count):
+        nonlocal rows
+        done.add(shard_id)
+        rows += count
+        write_checkpoint(work_dir, run, done)
+        if progress is not None:
+            progress(len(done), rows)
+
+    if workers <= 1:
+        _init_worker(index_dir, db_path, encoder_backend, onnx_dir, os.cpu_count() or 1)
+        for shard_id, records in shards:
+            n_shards += 1
+            if shard_id not in done:
+                finished(*_classify_shard(shard_id, records, part_path(work_dir, shard_id), params, batch_size))
+    else:
+        import multiprocessing
+        from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+        # Split the cores between the workers' encoders
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker,
+                                   initargs=(index_dir, db_path, encoder_backend, onnx_dir, threads))
+        with pool:
+            pending = set()
+            for shard_id, records in shards:
+                n_shards += 1
+                if shard_id in done:
+                    continue
+                if len(pending) >= 2 * workers:
+                    completed, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in completed:
+                        finished(*future.result())
+                pending.add(pool.submit(_classify_shard, shard_id, records, part_path(work_dir, shard_id),
+                                        params, batch_size))
+            for future in wait(pending).done:
+                finished(*future.result())
+
+    total_rows = merge_parts(work_dir, n_shards, output)
+    if not keep_parts:
+        shutil.rmtree(work_dir)
+    return {"rows": total_rows, "shards": n_shards, "resumed_shards": resumed,
+            "seconds": round(time.perf_counter() - start, 3)}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Classify a CSV/JSONL file of job titles into NCO role numbers")
+    parser.add_argument("input", help="A .csv file or a .jsonl file with one object per line")
+    parser.add_argument("--output", required=True, help="Output JSONL file")
+    parser.add_argument("--column", default="title", help="Column or field holding the text to classify")
+    parser.add_argument("--id-column", help="Column or field holding the record id (default: record number)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--work-dir", help="Checkpoint directory (default: <output>.parts)")
+    parser.add_argument("--restart", action="store_true", help="Discard the checkpoints of a previous run")
+    parser.add_argument("--keep-parts", action="store_true", help="Keep the per-shard part files")
+    parser.add_argument("--index-dir", default=SHARED_INDEX_DIR)
+    parser.add_argument("--db", default=SQLITE_DB_PATH)
+    parser.add_argument("--encoder", choices=ENCODER_BACKENDS, default=os.environ.get("ENCODER_BACKEND", "torch"))
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--bm25-weight", type=float, default=0.4)
+    parser.add_argument("--vector-weight", type=float, default=0.6)
+    parser.add_argument("--mode", choices=["exhaustive", "candidates"], default="exhaustive")
+    parser.add_argument("--fusion", choices=["zscore", "rrf"], default="zscore")
+    parser.add_argument("--candidate-pool", type=int, default=200)
+    args = parser.parse_args()
+
+    params = {
+        "top_k": args.top_k,
+        "bm25_weight": args.bm25_weight,
+        "vector_weight": args.vector_weight,
+        "mode": args.mode,
+        "fusion": args.fusion,
+        "candidate_pool": args.candidate_pool
+    }
+    summary = classify_file(
+        args.input, args.output, params, column=args.column, id_column=args.id_column, workers=args.workers,
+        shard_size=args.shard_size, batch_size=args.batch_size, work_dir=args.work_dir, restart=args.restart,
+        keep_parts=args.keep_parts, index_dir=args.index_dir, db_path=args.db, encoder_backend=args.encoder,
+        progress=lambda shards, rows: print(f"{shards} shards done, {rows} rows classified", flush=True)
+    )
+    print(f"Classified {summary['rows']} rows in {summary['shards']} shards "
+          f"({summary['resumed_shards']} resumed) in {summary['seconds']} s -> {args.output}")
@@ -1,45 +1,24 @@
 import sqlite3
-from utils import load_json
+from utils import iter_roles
+from roles_db import bulk_load_roles, role_row
 import os
 
 
 # Setup SQLite
-def create_db_from_json(json_file, db_file="db/roles.db") -> sqlite3.Connection:
-
-    # Load JSON data
-    data = load_json(json_file)
+def create_db_from_json(json_file, db_file="db/roles.db", fts=True) -> sqlite3.Connection:
+    """
+    Bulk-load roles into SQLite (see roles_db.bulk_load_roles). Roles are
+    streamed from the JSON file (formatted list or nested hierarchy) and
+    written in one transaction.
+    Args:
+        json_file (str): The path to the roles JSON file.
+        db_file (str): The path to the SQLite database.
+        fts (bool): Also build the FTS5 index over titles and descriptions.
+    Returns:
+        sqlite3.Connection: The open connection.
+    """
     print(os.path.exists(db_file))
-    # Initialize SQLite
-    conn = sqlite3.connect(db_file)
-    cur = conn.cursor()
-
-    # Create table (role_number as primary key, description as text)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS roles (
-        role_number TEXT PRIMARY KEY,
-        title TEXT,
-        old_regulation TEXT,
-        description TEXT
-    )
-    """)
-    #print(data)
-    for role in data:
-        #print(role)
-        # Each role is a dict with keys: role_number, Role Name, 2004 Regulation, Role Description
-        cur.execute(
-            "INSERT OR REPLACE INTO roles (role_number, title, old_regulation, description) VALUES (?, ?, ?, ?)",
-            (
-                role.get("role_number", ""),
-                role.get("Role Name", ""),
-                role.get("2004 Regulation", ""),
-                role.get("Role Description", "")
-            )
-        )
-        #break 
-
-    # Commit changes and close connection
-    conn.commit()
-    return conn
+    return bulk_load_roles(db_file, (role_row(role) for role in iter_roles(json_file)), fts=fts)
 
 # Query Pipelines
 def search_by_role_number(conn, role_number) -> str:
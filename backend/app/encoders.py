@@ -0,0 +1,232 @@
+import os
+import numpy as np
+from .vectors import normalize_rows
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+ENCODER_BACKENDS = ["torch", "torch-int8", "onnx", "onnx-int8"]
+
+
+class OnnxEncoder:
+    """
+    Query encoder running an ONNX export of the sentence transformer on
+    ONNX Runtime (CPU), with the same mean pooling and normalization as the
+    all-MiniLM-L6-v2 pipeline. Exposes the `encode` call the searcher uses.
+    """
+
+    def __init__(self, model_name=MODEL_NAME, onnx_dir="db/onnx", quantize=False):
+        """
+        Args:
+            model_name (str): The sentence-transformers model to export.
+            onnx_dir (str): Directory holding the exported model and tokenizer.
+            quantize (bool): Use the int8 dynamically quantized export.
+        """
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        path = os.path.join(onnx_dir, "model_int8.onnx" if quantize else "model.onnx")
+        if not os.path.exists(path):
+            export_onnx(model_name, onnx_dir, quantize=quantize)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(onnx_dir)
+        with open(os.path.join(onnx_dir, "max_seq_length")) as f:
+            self.max_seq_length = int(f.read())
+        self.session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        """
+        Embed one sentence or a list of sentences.
+        Args:
+            sentences (str | list): The input text(s).
+            batch_size (int): Sentences per ONNX Runtime call.
+        Returns:
+            np.ndarray: A normalized embedding, or one row per sentence.
+        """
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        embeddings = []
+        for start in range(0, len(sentences), batch_size):
+            tokens = self.tokenizer(sentences[start:start + batch_size], padding=True, truncation=True,
+                                    max_length=self.max_seq_length, return_tensors="np")
+            feeds = {name: value.astype(np.int64) for name, value in tokens.items() if name in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+
+            # Mean pooling over real tokens
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            embeddings.append(normalize_rows(pooled))
+
+        embeddings = np.vstack(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+
+def export_onnx(model_name=MODEL_NAME, onnx_dir="db/onnx", quantize=False):
+    """
+    Export the sentence transformer's underlying transformer to ONNX, and
+    optionally an int8 dynamically quantized copy.
+    Args:
+        model_name (str): The sentence-transformers model to export.
+        onnx_dir (str): The output directory.
+        quantize (bool): Also write model_int8.onnx.
+    Returns:
+        str: The path of the requested export.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(onnx_dir, exist_ok=True)
+    path = os.path.join(onnx_dir, "model.onnx")
+
+    if not os.path.exists(path):
+        st_model = SentenceTransformer(model_name, device="cpu")
+        transformer = st_model[0]
+        transformer.tokenizer.save_pretrained(onnx_dir)
+        with open(os.path.join(onnx_dir, "max_seq_length"), "w") as f:
+            f.write(str(st_model.max_seq_length))
+
+        dummy = transformer.tokenizer(["warm up the exporter"], return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+        class HiddenStates(torch.nn.Module):
+            # Pass inputs by name; positional order differs across transformers versions
+            def __init__(self, auto_model):
+                super().__init__()
+                self.auto_model = auto_model
+
+            def forward(self, *inputs):
+                return self.auto_model(**dict(zip(input_names, inputs))).last_hidden_state
+
+        torch.onnx.export(
+            HiddenStates(transformer.auto_model).eval(),
+            tuple(dummy[name] for name in input_names),
+            path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            dynamo=False
+        )
+
+    if not quantize:
+        return path
+
+    quantized_path = os.path.join(onnx_dir, "model_int8.onnx")
+    if not os.path.exists(quantized_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(path, quantized_path, weight_type=QuantType.QInt8)
+    return quantized_path
+
+
+def load_encoder(backend="torch", model_name=MODEL_NAME, onnx_dir="db/onnx"):
+    """
+    Load a query encoder by backend name.
+      - "torch": the reference PyTorch SentenceTransformer.
+      - "torch-int8": the same model with int8 dynamically quantized Linear layers.
+      - "onnx": ONNX Runtime on an fp32 export.
+      - "onnx-int8": ONNX Runtime on an int8 dynamically quantized export.
+    Args:
+        backend (str): One of ENCODER_BACKENDS.
+        model_name (str): The sentence-transformers model.
+        onnx_dir (str): Directory holding ONNX exports.
+    Returns:
+        An object with a SentenceTransformer-compatible `encode` method.
+    """
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxEncoder(model_name, onnx_dir, quantize=backend == "onnx-int8")
+    if backend not in ("torch", "torch-int8"):
+        raise ValueError(f"Unknown encoder backend {backend!r}, expected one of {ENCODER_BACKENDS}")
+
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu")
+    if backend == "torch-int8":
+        import torch
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def encoder_drift(reference, candidate, texts, batch_size=64):
+    """
+    Cosine similarity between reference and candidate embeddings of the same texts.
+    Args:
+        reference: The reference encoder.
+        candidate: The encoder under test.
+        texts (list): The texts to embed.
+        batch_size (int): Encoding batch size.
+    Returns:
+        dict: Mean, min and 1st-percentile cosine similarity.
+    """
+    ref = normalize_rows(reference.encode(texts, batch_size=batch_size))
+    cand = normalize_rows(candidate.encode(texts, batch_size=batch_size))
+    cosines = np.sum(ref * cand, axis=1)
+    return {
+        "mean_cosine": float(cosines.mean()),
+        "min_cosine": float(cosines.min()),
+        "p1_cosine": float(np.percentile(cosines, 1))
+    }
+
+
+def ranking_drift(searcher, reference, candidate, queries, top_k=10):
+    """
+    Compare /search rankings produced with the reference and candidate encoders.
+    Args:
+        searcher (HybridSearcher): The search engine (its caches are bypassed).
+        reference: The reference encoder.
+        candidate: The encoder under test.
+        queries (list): The query texts.
+        top_k (int): The number of roles compared per query.
+    Returns:
+        dict: Mean top_k overlap and the share of queries with an identical top 1 / top_k.
+    """
+    searcher.embedding_cache = None
+    searcher.result_cache = None
+
+    overlaps, same_top1, same_order = [], 0, 0
+    for query in queries:
+        searcher.model = reference
+        expected = [result["role_number"] for result in searcher.search(query, top_k=top_k)]
+        searcher.model = candidate
+        found = [result["role_number"] for result in searcher.search(query, top_k=top_k)]
+
+        overlaps.append(len(set(expected) & set(found)) / max(len(expected), 1))
+        same_top1 += expected[:1] == found[:1]
+        same_order += expected == found
+    return {
+        f"overlap@{top_k}": float(np.mean(overlaps)),
+        "same_top1": same_top1 / len(queries),
+        "same_ranking": same_order / len(queries)
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Measure embedding and ranking drift of a query encoder backend")
+    parser.add_argument("--backend", choices=ENCODER_BACKENDS, default="onnx-int8")
+    parser.add_argument("--max-queries", type=int, default=300)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    from .app import load_resources
+
+    searcher = load_resources()
+    reference = load_encoder("torch")
+    candidate = load_encoder(args.backend)
+
+    # Fixed query set: role titles plus a few free-text queries
+    queries = sorted(set(searcher.chunk_meta.role_titles))[:args.max_queries]
+    queries += ["driver", "electrician", "software developer", "teacher", "nurse in a hospital"]
+
+    for name, encoder in (("torch", reference), (args.backend, candidate)):
+        start = time.perf_counter()
+        for query in queries:
+            encoder.encode(query)
+        print(f"{name:<11} {(time.perf_counter() - start) * 1000 / len(queries):7.2f} ms/query")
+
+    print("embedding drift:", encoder_drift(reference, candidate, queries + searcher.chunk_meta.chunk_texts[:500]))
+    print("ranking drift:  ", ranking_drift(searcher, reference, candidate, queries, top_k=args.top_k))
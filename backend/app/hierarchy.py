@@ -0,0 +1,106 @@
+import re
+import numpy as np
+
+# Code length of each level of the NCO hierarchy; roles carry the full "1111.0100" code
+LEVELS = {"division": 1, "sub_division": 2, "group": 3, "family": 4}
+CODE_PATTERN = re.compile(r"^(\d{1,4}|\d{4}\.\d{4})$")
+
+
+class HierarchyIndex:
+    """
+    Precomputed prefix index over role codes.
+
+    Role codes sort in hierarchy order, so the roles of any division,
+    sub-division, group or family form a contiguous range of the sorted
+    `ChunkMetadata.roles`. Every code maps to its role range and to the
+    sorted indices of its chunks, which `HybridSearcher` uses as the
+    candidate set of a restricted search. Scores are aggregated up the
+    hierarchy with segmented reductions over those ranges.
+    """
+
+    def __init__(self, chunk_meta, names=None):
+        """
+        Args:
+            chunk_meta (ChunkMetadata): The chunk metadata table.
+            names (dict): Mapping of division/sub-division/group/family code to its name.
+        """
+        self.chunk_meta = chunk_meta
+        self.names = names or {}
+        roles = [str(role_number) for role_number in chunk_meta.roles]
+
+        # Role range of every code, and the start of each group per level
+        self.role_ranges = {role_number: (i, i + 1) for i, role_number in enumerate(roles)}
+        self.level_groups = {}
+        for level, width in LEVELS.items():
+            codes, starts = np.unique([role_number[:width] for role_number in roles], return_index=True)
+            ends = np.append(starts[1:], len(roles))
+            self.level_groups[level] = (codes, starts)
+            self.role_ranges.update({str(code): (start, end) for code, start, end in zip(codes, starts, ends)})
+
+        # Chunk indices of every code, sorted
+        chunk_starts = np.append(chunk_meta.role_starts, len(chunk_meta.role_order))
+        self.scopes = {
+            code: np.sort(chunk_meta.role_order[chunk_starts[start]:chunk_starts[end]]).astype(np.int64)
+            for code, (start, end) in self.role_ranges.items()
+        }
+
+    def scope(self, code):
+        """
+        Chunk indices of every role under a division, sub-division, group,
+        family or role code.
+        Args:
+            code (str): e.g. "2", "21", "214", "2141" or "2141.0100".
+        Returns:
+            np.ndarray: Sorted chunk indices (empty if no indexed role has the code).
+        Raises:
+            ValueError: If the code is not an NCO code.
+        """
+        if not CODE_PATTERN.match(code):
+            raise ValueError(f"Invalid NCO code {code!r}, expected e.g. '2', '21', '214', '2141' or '2141.0100'")
+        return self.scopes.get(code, np.array([], dtype=np.int64))
+
+    def aggregate(self, chunk_scores, level="family", top_k=10, scope=None):
+        """
+        Aggregate chunk scores up the hierarchy: a role scores its best chunk,
+        and a division/sub-division/group/family its best role.
+        Args:
+            chunk_scores (np.ndarray): Combined score per chunk (or per chunk of `scope`).
+            level (str): One of LEVELS.
+            top_k (int): Number of groups to return.
+            scope (np.ndarray): Chunk indices the scores refer to, or None for every chunk.
+        Returns:
+            list: The best groups, best first, with their best role.
+        """
+        if level not in LEVELS:
+            raise ValueError(f"Unknown level {level!r}, expected one of {list(LEVELS)}")
+        meta = self.chunk_meta
+        if scope is not None:
+            full = np.full(len(meta), -np.inf)
+            full[scope] = chunk_scores
+            chunk_scores = full
+        if len(chunk_scores) == 0:
+            return []
+
+        role_max = np.maximum.reduceat(chunk_scores[meta.role_order], meta.role_starts)
+        codes, starts = self.level_groups[level]
+        group_max = np.maximum.reduceat(role_max, starts)
+
+        matched = np.flatnonzero(np.isfinite(group_max))
+        best = matched[np.argsort(-group_max[matched], kind="stable")][:top_k]
+        ends = np.append(starts[1:], len(role_max))
+
+        groups = []
+        for group in best:
+            start, end = starts[group], ends[group]
+            best_role = start + int(np.argmax(role_max[start:end]))
+            code = str(codes[group])
+            groups.append({
+                "code": code,
+                "level": level,
+                "name": self.names.get(code, ""),
+                "score": float(group_max[group]),
+                "roles": int(np.isfinite(role_max[start:end]).sum()),
+                "best_role": str(meta.roles[best_role]),
+                "best_role_title": meta.role_titles[best_role]
+            })
+        return groups
@@ -0,0 +1,259 @@
+import argparse
+import hashlib
+import json
+import os
+import urllib.request
+from collections import Counter
+import chromadb
+from sentence_transformers import SentenceTransformer
+from .bm25 import SparseBM25
+from .chunking import chunk_description, load_tokenizer, CHUNKERS, DEFAULT_CHUNKER, MODEL_NAME
+from .roles_db import connect_for_bulk_load, insert_roles, refresh_fts, role_row
+from .shared_index import LEGACY_BM25_PATH, MANIFEST_FILE, SHARED_INDEX_DIR, export_from_collection, load_bm25_index
+from .utils import iter_roles
+
+CHROMA_PATH = "db/chroma_db"
+SQLITE_DB_PATH = "db/roles.db"
+MANIFEST_PATH = "db/index_manifest.json"
+
+
+def content_hash(*parts):
+    """
+    Stable SHA-1 of a few JSON-serializable values.
+    """
+    return hashlib.sha1(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def write_atomic(path, write):
+    """
+    Write a file through a temporary sibling and rename it into place,
+    so readers only ever see the old or the new version.
+    Args:
+        path (str): The destination path.
+        write (callable): Called with the open binary file object.
+    Returns:
+        None
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(manifest_path, params):
+    """
+    Load the hash manifest, starting fresh if it is missing or was built with other parameters.
+    Args:
+        manifest_path (str): The path to the manifest.
+        params (dict): The build parameters the manifest must match.
+    Returns:
+        dict: The manifest.
+    """
+    manifest = {"generation": 0, "params": params, "roles": {}}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        manifest["generation"] = stored.get("generation", 0)
+        if stored.get("params") == params:
+            manifest["roles"] = stored.get("roles", {})
+    return manifest
+
+
+def unique_roles(roles, chunker=DEFAULT_CHUNKER, max_tokens=250, overlap=50):
+    """
+    Keep one record per role number, the way `ingest` does: the first record
+    that produces chunks wins and later repeats are dropped. A repeat of a
+    record without chunks replaces it (and takes its position).
+    Args:
+        roles (iterable): Role dicts, in file order.
+        chunker (str): One of CHUNKERS.
+        max_tokens (int): The maximum number of tokens per chunk.
+        overlap (int): The number of overlapping tokens between chunks.
+    Returns:
+        list: The role dicts, one per role number.
+    """
+    selected = {}
+    tokenizer = None
+    for role in roles:
+        role_number = role["role_number"]
+        if role_number in selected:
+            # Only repeated roles are chunked here
+            if chunker == "sentences" and tokenizer is None:
+                tokenizer = load_tokenizer(MODEL_NAME)
+            kept = selected[role_number].get("Role Description", "")
+            if chunk_description(kept, chunker, max_tokens, overlap, tokenizer):
+                print(f"Skipping duplicate role {role_number}.")
+                continue
+            del selected[role_number]
+        selected[role_number] = role
+    return list(selected.values())
+
+
+def incremental_update(json_file, collection_name="nco_roles", db_file=SQLITE_DB_PATH,
+                       shared_dir=SHARED_INDEX_DIR, manifest_path=MANIFEST_PATH,
+                       max_tokens=250, overlap=50, encode_batch_size=512, chunker=DEFAULT_CHUNKER):
+    """
+    Bring Chroma, the index bundle and roles.db in line with a roles JSON file,
+    touching only what changed since the last run.
+
+    The manifest stores one content hash per role (title, 2004 regulation,
+    description) and one per chunk. Only chunks whose hash changed are
+    re-embedded and upserted; chunks and roles that disappeared are deleted.
+    BM25 statistics are recomputed from the stored per-chunk term frequencies,
+    so unchanged chunks are not re-tokenized. The new index bundle and the
+    manifest (with a bumped generation) are swapped in atomically at the end.
+
+    Args:
+        json_file (str): The path to the roles JSON (any layout `iter_roles` reads).
+        collection_name (str): The name of the ChromaDB collection.
+        db_file (str): The path to the SQLite database.
+        shared_dir (str): The index bundle directory.
+        manifest_path (str): The path to the hash manifest.
+        max_tokens (int): The maximum number of tokens per chunk.
+        overlap (int): The number of overlapping tokens between chunks.
+        encode_batch_size (int): The number of chunks encoded and written per batch.
+        chunker (str): One of CHUNKERS (see `chunk_description`).
+    Returns:
+        dict: Counts of changed/removed roles and upserted/deleted chunks, the new generation and index version.
+    """
+
+    # Stream the roles, one record per role number
+    roles = unique_roles(iter_roles(json_file), chunker, max_tokens, overlap)
+
+    params = {"collection": collection_name, "model": MODEL_NAME, "chunker": chunker, "max_tokens": max_tokens,
+              "overlap": overlap}
+    manifest = load_manifest(manifest_path, params)
+    old_roles = manifest["roles"]
+
+    # Diff roles by content hash
+    role_hashes = {
+        role["role_number"]: content_hash(role.get("Role Name", ""), role.get("2004 Regulation", ""),
+                                          role.get("Role Description", ""))
+        for role in roles
+    }
+    changed = [role for role in roles if old_roles.get(role["role_number"], {}).get("hash") != role_hashes[role["role_number"]]]
+    removed = [role_number for role_number in old_roles if role_number not in role_hashes]
+
+    # Update SQLite rows
+    conn = connect_for_bulk_load(db_file)
+    insert_roles(conn, (role_row(role) for role in changed))
+    conn.executemany("DELETE FROM roles WHERE role_number=?", [(role_number,) for role_number in removed])
+    conn.commit()
+    if changed or removed:
+        refresh_fts(conn)
+    conn.close()
+
+    # ChromaDB client
+    client = chromadb.PersistentClient(path=CHROMA_PATH)
+    collection = client.get_or_create_collection(name=collection_name)
+
+    # Previous BM25 term frequencies, reused for unchanged chunks
+    old_freqs = {}
+    if os.path.exists(os.path.join(shared_dir, MANIFEST_FILE)) or os.path.exists(LEGACY_BM25_PATH):
+        old_bm25, old_ids, _ = load_bm25_index(shared_dir)
+        old_freqs = dict(zip(old_ids, old_bm25.doc_freqs()))
+
+    # Diff the chunks of changed roles
+    new_roles = {role_number: old_roles[role_number] for role_number in role_hashes if role_number in old_roles}
+    upserts = []
+    deletes = []
+    new_freqs = {}
+    tokenizer = load_tokenizer(MODEL_NAME) if chunker == "sentences" and changed else None
+    for role in changed:
+        role_number = role["role_number"]
+        chunks = chunk_description(role.get("Role Description", ""), chunker, max_tokens, overlap, tokenizer)
+        chunk_hashes = [content_hash(chunk) for chunk, _ in chunks]
+        previous = old_roles.get(role_number, {}).get("chunks", [])
+
+        for idx, ((chunk, tokens), chunk_hash) in enumerate(zip(chunks, chunk_hashes)):
+            doc_id = f"{role_number}_chunk{idx}"
+            if idx >= len(previous) or previous[idx] != chunk_hash or doc_id not in old_freqs:
+                upserts.append((doc_id, chunk, {"role_number": role_number, "chunk_index": idx}))
+                new_freqs[doc_id] = dict(Counter(tokens))
+        deletes += [f"{role_number}_chunk{idx}" for idx in range(len(chunks), len(previous))]
+        new_roles[role_number] = {"hash": role_hashes[role_number], "chunks": chunk_hashes}
+
+    for role_number in removed:
+        deletes += [f"{role_number}_chunk{idx}" for idx in range(len(old_roles[role_number]["chunks"]))]
+
+    # Chunks already stored with identical text (e.g. on the first run
+    # after a full build) keep their embedding
+    if upserts:
+        stored = collection.get(ids=[doc_id for doc_id, _, _ in upserts], include=["documents"])
+        stored_docs = dict(zip(stored["ids"], stored["documents"]))
+        upserts = [(doc_id, chunk, meta) for doc_id, chunk, meta in upserts if stored_docs.get(doc_id) != chunk]
+
+    # Encode in batches and upsert into Chroma
+    if upserts:
+        model = SentenceTransformer(MODEL_NAME)
+        for start in range(0, len(upserts), encode_batch_size):
+            batch = upserts[start:start + encode_batch_size]
+            embeddings = model.encode([chunk for _, chunk, _ in batch], batch_size=64)
+            collection.upsert(
+                ids=[doc_id for doc_id, _, _ in batch],
+                documents=[chunk for _, chunk, _ in batch],
+                embeddings=embeddings.tolist(),
+                metadatas=[meta for _, _, meta in batch]
+            )
+    if deletes:
+        collection.delete(ids=deletes)
+
+    # Rebuild BM25 statistics from per-chunk term frequencies, in role order
+    bm25_ids = [
+        f"{role_number}_chunk{idx}"
+        for role_number in role_hashes
+        for idx in range(len(new_roles[role_number]["chunks"]))
+    ]
+
+    # Unchanged roles without previous postings (e.g. no earlier bundle) are
+    # re-chunked, so their tokens come from the same pass as in a full build
+    for role in roles:
+        role_number = role["role_number"]
+        doc_ids = [f"{role_number}_chunk{idx}" for idx in range(len(new_roles[role_number]["chunks"]))]
+        if all(doc_id in new_freqs or doc_id in old_freqs for doc_id in doc_ids):
+            continue
+        if chunker == "sentences" and tokenizer is None:
+            tokenizer = load_tokenizer(MODEL_NAME)
+        chunks = chunk_description(role.get("Role Description", ""), chunker, max_tokens, overlap, tokenizer)
+        for doc_id, (_, tokens) in zip(doc_ids, chunks):
+            new_freqs.setdefault(doc_id, dict(Counter(tokens)))
+
+    corpus = []
+    for doc_id in bm25_ids:
+        freqs = new_freqs[doc_id] if doc_id in new_freqs else old_freqs[doc_id]
+        corpus.append([term for term, tf in freqs.items() for _ in range(tf)])
+    bm25_index = SparseBM25.from_corpus(corpus)
+    index_version = export_from_collection(collection, bm25_index, bm25_ids, out_dir=shared_dir, params=params)
+
+    # Publish the new generation last
+    manifest["generation"] += 1
+    manifest["roles"] = new_roles
+    write_atomic(manifest_path, lambda f: f.write(json.dumps(manifest, ensure_ascii=False).encode("utf-8")))
+
+    summary = {
+        "generation": manifest["generation"],
+        "changed_roles": len(changed),
+        "removed_roles": len(removed),
+        "upserted_chunks": len(upserts),
+        "deleted_chunks": len(deletes),
+        "total_chunks": len(bm25_ids),
+        "index_version": index_version
+    }
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally update Chroma, the index bundle and SQLite")
+    parser.add_argument("json_file", nargs="?", default="data/json/formatted.json")
+    parser.add_argument("--collection", default="nco_roles")
+    parser.add_argument("--notify", help="URL of a running API's /index/reload endpoint")
+    parser.add_argument("--chunker", choices=CHUNKERS, default=DEFAULT_CHUNKER)
+    args = parser.parse_args()
+
+    print(incremental_update(args.json_file, collection_name=args.collection, chunker=args.chunker))
+
+    # Tell the running service to swap in the new generation
+    if args.notify:
+        request = urllib.request.Request(args.notify, method="POST")
+        with urllib.request.urlopen(request) as response:
+            print(response.read().decode("utf-8"))
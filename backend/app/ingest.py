@@ -0,0 +1,167 @@
+import argparse
+import time
+import chromadb
+from rank_bm25 import BM25Okapi
+from sentence_transformers import SentenceTransformer
+from .bm25 import SparseBM25
+from .chunking import chunk_description, load_tokenizer, CHUNKERS, DEFAULT_CHUNKER, MODEL_NAME
+from .incremental import CHROMA_PATH, SQLITE_DB_PATH
+from .metrics import process_memory
+from .roles_db import connect_for_bulk_load, create_fts, insert_roles, refresh_fts
+from .shared_index import SHARED_INDEX_DIR, SharedIndexWriter
+from .utils import iter_roles
+from .vectors import normalize_rows
+
+
+def ingest(json_file, collection_name="nco_roles", db_file=SQLITE_DB_PATH, shared_dir=SHARED_INDEX_DIR,
+           max_tokens=250, overlap=50, role_batch_size=500, encode_batch_size=512, dtype="float32", fts=True,
+           chunker=DEFAULT_CHUNKER):
+    """
+    Build roles.db, the Chroma collection and the index bundle (BM25,
+    chunk metadata, embeddings) in one streaming pass over a roles JSON file.
+
+    Roles are read from the file one at a time (`iter_roles`), written to
+    SQLite in batches, chunked, and buffered until `encode_batch_size` chunks
+    are waiting; the buffer is then encoded, upserted into Chroma and appended
+    to the shared index. BM25Okapi consumes the tokenized chunks as they are
+    produced, so only its term statistics (which are the index itself) and
+    the chunk ids stay in memory; neither the JSON document nor the chunk
+    texts or embeddings are ever held in full.
+
+    Args:
+        json_file (str): The roles JSON (formatted list, nested hierarchy or roles.json mapping).
+        collection_name (str): The name of the ChromaDB collection.
+        db_file (str): The path to the SQLite database.
+        shared_dir (str): The index bundle directory.
+        max_tokens (int): The maximum number of tokens per chunk.
+        overlap (int): The number of overlapping tokens between chunks.
+        role_batch_size (int): The number of roles written to SQLite per batch.
+        encode_batch_size (int): The number of chunks encoded and written per batch.
+        dtype (str): "float32" or "float16" for the bundle's embedding matrix.
+        fts (bool): Build the FTS5 index over role titles and descriptions.
+        chunker (str): One of CHUNKERS (see `chunk_description`).
+    Returns:
+        dict: Role and chunk counts, the index version, per-stage timings in seconds and peak RSS.
+    """
+    timings = {"read": 0.0, "sqlite": 0.0, "chunk": 0.0, "encode": 0.0, "write": 0.0}
+
+    conn = connect_for_bulk_load(db_file)
+
+    model = SentenceTransformer(MODEL_NAME)
+    client = chromadb.PersistentClient(path=CHROMA_PATH)
+    collection = client.get_or_create_collection(name=collection_name)
+    params = {"collection": collection_name, "model": MODEL_NAME, "chunker": chunker, "max_tokens": max_tokens,
+              "overlap": overlap}
+    tokenizer = load_tokenizer(MODEL_NAME) if chunker == "sentences" else None
+    writer = SharedIndexWriter(shared_dir, dtype, params)
+
+    chunked_roles = set()
+    counts = {"roles": 0, "chunks": 0}
+    role_rows = []
+    pending = []
+
+    def flush_roles():
+        start = time.perf_counter()
+        insert_roles(conn, role_rows)
+        conn.commit()
+        role_rows.clear()
+        timings["sqlite"] += time.perf_counter() - start
+
+    def flush_chunks():
+        ids = [doc_id for doc_id, _, _ in pending]
+        texts = [chunk for _, chunk, _ in pending]
+        metas = [meta for _, _, meta in pending]
+
+        start = time.perf_counter()
+        embeddings = model.encode(texts, batch_size=64)
+        timings["encode"] += time.perf_counter() - start
+
+        # Upsert keeps the write idempotent if the build is re-run
+        start = time.perf_counter()
+        collection.upsert(ids=ids, documents=texts, embeddings=embeddings.tolist(), metadatas=metas)
+        writer.add(ids, [meta["role_number"] for meta in metas], [meta["chunk_index"] for meta in metas],
+                   texts, normalize_rows(embeddings))
+        timings["write"] += time.perf_counter() - start
+        pending.clear()
+        print(f"Encoded and stored {counts['chunks']} chunks ({counts['roles']} roles).")
+
+    def tokenized_chunks():
+        roles = iter_roles(json_file)
+        while True:
+            start = time.perf_counter()
+            role = next(roles, None)
+            timings["read"] += time.perf_counter() - start
+            if role is None:
+                break
+
+            # Chunk ids are derived from role numbers, so a role repeated after
+            # its chunks were stored would collide (empty repeats are harmless)
+            role_number = role["role_number"]
+            if role_number in chunked_roles:
+                print(f"Skipping duplicate role {role_number}.")
+                continue
+            description = role.get("Role Description", "")
+            role_rows.append((role_number, role.get("Role Name", ""), role.get("2004 Regulation", ""), description))
+            counts["roles"] += 1
+            if len(role_rows) >= role_batch_size:
+                flush_roles()
+
+            start = time.perf_counter()
+            chunks = chunk_description(description, chunker, max_tokens, overlap, tokenizer)
+            timings["chunk"] += time.perf_counter() - start
+            if chunks:
+                chunked_roles.add(role_number)
+            for idx, (chunk, tokens) in enumerate(chunks):
+                doc_id = f"{role_number}_chunk{idx}"
+                pending.append((doc_id, chunk, {"role_number": role_number, "chunk_index": idx}))
+                counts["chunks"] += 1
+                yield tokens
+                if len(pending) >= encode_batch_size:
+                    flush_chunks()
+
+        if role_rows:
+            flush_roles()
+        if pending:
+            flush_chunks()
+
+    # BM25Okapi walks its corpus once, so it is fed straight from the pipeline
+    start = time.perf_counter()
+    bm25_index = BM25Okapi(tokenized_chunks())
+    elapsed = time.perf_counter() - start
+    timings["bm25"] = elapsed - sum(timings.values())
+    if fts:
+        create_fts(conn)
+    else:
+        refresh_fts(conn)
+    conn.close()
+
+    start = time.perf_counter()
+    index_version = writer.finish(SparseBM25.from_okapi(bm25_index))
+    timings["finish"] = time.perf_counter() - start
+
+    return {
+        "roles": counts["roles"],
+        "chunks": counts["chunks"],
+        "index_version": index_version,
+        "timings": timings,
+        "peak_rss_mb": round(process_memory()["max_rss_bytes"] / 2 ** 20, 1)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream a roles JSON file into SQLite, Chroma and the index bundle")
+    parser.add_argument("json_file", nargs="?", default="data/json/Complete.json")
+    parser.add_argument("--collection", default="nco_roles")
+    parser.add_argument("--role-batch-size", type=int, default=500)
+    parser.add_argument("--encode-batch-size", type=int, default=512)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--no-fts", action="store_true", help="Do not build the FTS5 index")
+    parser.add_argument("--chunker", choices=CHUNKERS, default=DEFAULT_CHUNKER)
+    args = parser.parse_args()
+
+    summary = ingest(args.json_file, collection_name=args.collection, role_batch_size=args.role_batch_size,
+                     encode_batch_size=args.encode_batch_size, dtype=args.dtype, fts=not args.no_fts,
+                     chunker=args.chunker)
+    print(f"Ingested {summary['roles']} roles as {summary['chunks']} chunks, peak RSS {summary['peak_rss_mb']} MB.")
+    for stage, seconds in summary["timings"].items():
+        print(f"  {stage:<7} {seconds:8.2f}s")
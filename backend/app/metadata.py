@@ -0,0 +1,151 @@
+import numpy as np
+
+
+class ChunkMetadata:
+    """
+    Array-backed metadata for every indexed chunk, aligned position by
+    position with `bm25_ids`. Built once at startup so that `/search`
+    never has to go back to Chroma or SQLite for per-chunk lookups.
+    """
+
+    def __init__(self, ids, role_numbers, chunk_indices, chunk_texts, titles):
+        """
+        Args:
+            ids (list): Chunk ids, in `bm25_ids` order.
+            role_numbers (list): Role number of each chunk.
+            chunk_indices (list): Position of each chunk inside its role description.
+            chunk_texts (Sequence): Text of each chunk (a list, or memory-mapped strings).
+            titles (dict): Mapping of role_number to role title.
+        """
+        self.ids = list(ids)
+        self.id_to_idx = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        self.chunk_indices = np.asarray(chunk_indices, dtype=np.int32)
+        self.chunk_texts = chunk_texts
+
+        # Integer code per chunk pointing into the unique role arrays
+        self.roles, self.role_codes = np.unique(np.asarray(role_numbers, dtype=str), return_inverse=True)
+        self.role_codes = self.role_codes.astype(np.int32)
+        self.role_titles = [titles.get(role_number, "Unknown") for role_number in self.roles]
+
+        # Chunks grouped by role, for segmented reductions over score matrices
+        self.role_order = np.argsort(self.role_codes, kind="stable")
+        self.role_starts = np.searchsorted(self.role_codes[self.role_order], np.arange(len(self.roles)))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def best_per_role(self, scores, top_k, candidates=None):
+        """
+        Select the best-scoring chunk of every role and return the top_k of them.
+        Args:
+            scores (np.ndarray): Combined score per chunk (or per candidate).
+            top_k (int): Number of roles to return.
+            candidates (np.ndarray): Chunk indices the scores refer to, or None for every chunk.
+        Returns:
+            np.ndarray: Positions in `scores` of the winning chunks, best first.
+        """
+        role_codes = self.role_codes if candidates is None else self.role_codes[candidates]
+
+        # Stable sort keeps the earliest chunk of a role on ties
+        order = np.argsort(-scores, kind="stable")
+        _, first = np.unique(role_codes[order], return_index=True)
+        best = order[first]
+        return best[np.argsort(-scores[best], kind="stable")][:top_k]
+
+    def role_chunks(self, codes):
+        """
+        Chunk indices of the given roles, grouped role by role.
+        Args:
+            codes (np.ndarray): Indices into `roles`.
+        Returns:
+            tuple: The chunk indices, and the offset of each role's group in them.
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        role_ends = np.append(self.role_starts[1:], len(self.role_order))
+        lengths = role_ends[codes] - self.role_starts[codes]
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.repeat(self.role_starts[codes] - offsets, lengths) + np.arange(lengths.sum())
+        return self.role_order[positions], offsets
+
+    def best_per_role_batch(self, scores, top_k):
+        """
+        Row-wise `best_per_role` for a (queries x chunks) score matrix.
+        Per-role maxima of every query are computed in one segmented reduction.
+        Args:
+            scores (np.ndarray): Combined score matrix, one row per query.
+            top_k (int): Number of roles to return per query.
+        Returns:
+            list: One array of winning chunk indices (best first) per query.
+        """
+        grouped = scores[:, self.role_order]
+        role_max = np.maximum.reduceat(grouped, self.role_starts, axis=1)
+        role_ends = np.append(self.role_starts[1:], len(self.role_order))
+
+        k = min(top_k, role_max.shape[1])
+        if k <= 0:
+            return [np.array([], dtype=np.int64) for _ in range(len(scores))]
+        winners = []
+        for row, maxima in zip(grouped, role_max):
+            top_roles = np.argpartition(-maxima, k - 1)[:k] if k < len(maxima) else np.arange(len(maxima))
+            top_roles = top_roles[np.lexsort((top_roles, -maxima[top_roles]))]
+
+            # First chunk reaching the maximum, like the stable single-query path
+            winners.append(np.array([
+                self.role_order[self.role_starts[r] + np.argmax(row[self.role_starts[r]:role_ends[r]])]
+                for r in top_roles
+            ], dtype=np.int64))
+        return winners
+
+    def result(self, idx, bm25_score, vector_score, combined_score):
+        """
+        Materialize a single search result row.
+        Args:
+            idx (int): Chunk index.
+            bm25_score (float): Normalized BM25 score.
+            vector_score (float): Normalized vector score.
+            combined_score (float): Weighted combined score.
+        Returns:
+            dict: The search result.
+        """
+        code = self.role_codes[idx]
+        return {
+            "id": self.ids[idx],
+            "role_number": str(self.roles[code]),
+            "role_title": self.role_titles[code],
+            "chunk_index": int(self.chunk_indices[idx]),
+            "chunk_text": self.chunk_texts[idx],
+            "bm25_score": float(bm25_score),
+            "vector_score": float(vector_score),
+            "combined_score": float(combined_score)
+        }
+
+
+def build_chunk_metadata(collection, conn, ids) -> ChunkMetadata:
+    """
+    Build the chunk metadata table with one Chroma call and one SQLite query.
+    Args:
+        collection (chromadb.Collection): The Chroma collection holding the chunks.
+        conn (sqlite3.Connection): Connection to the roles database.
+        ids (list): Chunk ids, in `bm25_ids` order.
+    Returns:
+        ChunkMetadata: The metadata table.
+    """
+
+    # Chroma does not guarantee the order of returned rows
+    data = collection.get(ids=list(ids), include=["metadatas", "documents"])
+    rows = {
+        doc_id: (meta, doc)
+        for doc_id, meta, doc in zip(data["ids"], data["metadatas"], data["documents"])
+    }
+
+    role_numbers, chunk_indices, chunk_texts = [], [], []
+    for doc_id in ids:
+        meta, doc = rows[doc_id]
+        role_numbers.append(meta["role_number"])
+        chunk_indices.append(meta["chunk_index"])
+        chunk_texts.append(doc)
+
+    # Load every role title at once
+    titles = dict(conn.execute("SELECT role_number, title FROM roles").fetchall())
+
+    return ChunkMetadata(ids, role_numbers, chunk_indices, chunk_texts, titles)
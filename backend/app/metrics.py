@@ -0,0 +1,143 @@
+import bisect
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in seconds, from 50 µs to 2.5 s
+LATENCY_BUCKETS = [0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5]
+
+
+class Histogram:
+    """
+    Cumulative-bucket latency histogram in the Prometheus layout.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Returns:
+            list: (upper bound, cumulative count) pairs, ending with +Inf.
+        """
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+class StageMetrics:
+    """
+    A family of latency histograms, one per label value (e.g. per search stage).
+    """
+
+    def __init__(self, name, help_text, label="stage", buckets=LATENCY_BUCKETS):
+        """
+        Args:
+            name (str): The Prometheus metric name.
+            help_text (str): The metric description.
+            label (str): The label that tells the histograms apart.
+            buckets (list): Bucket upper bounds in seconds.
+        """
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, seconds):
+        """
+        Record one duration for a label value.
+        """
+        with self._lock:
+            histogram = self.histograms.get(value)
+            if histogram is None:
+                histogram = self.histograms[value] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def render(self):
+        """
+        Render the family in the Prometheus text exposition format.
+        Returns:
+            list: The output lines.
+        """
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for value, histogram in sorted(self.histograms.items()):
+                labels = f'{self.label}="{value}"'
+                for bound, count in histogram.cumulative():
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{self.name}_bucket{{{labels},le="{le}"}} {count}')
+                lines.append(f"{self.name}_sum{{{labels}}} {histogram.sum!r}")
+                lines.append(f"{self.name}_count{{{labels}}} {histogram.count}")
+        return lines
+
+
+@contextmanager
+def stage_timer(metrics, stage, timings=None):
+    """
+    Time a block with perf_counter and record it in `metrics` (if any) and,
+    for single-request profiling, add it to the `timings` dict (if any).
+    Args:
+        metrics (StageMetrics): The histogram family, or None.
+        stage (str): The stage name.
+        timings (dict): Per-request stage durations in seconds, or None.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if metrics is not None:
+            metrics.observe(stage, elapsed)
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+def render_samples(name, kind, help_text, samples):
+    """
+    Render a counter or gauge in the Prometheus text exposition format.
+    Args:
+        name (str): The metric name.
+        kind (str): "counter" or "gauge".
+        help_text (str): The metric description.
+        samples (list): (labels dict, value) pairs.
+    Returns:
+        list: The output lines.
+    """
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return lines
+
+
+def process_memory():
+    """
+    Current and peak resident set size of this process (Linux units:
+    /proc/self/statm pages, ru_maxrss KiB).
+    Returns:
+        dict: rss_bytes and max_rss_bytes.
+    """
+    rss_bytes = 0
+    if os.path.exists("/proc/self/statm"):
+        with open("/proc/self/statm", "r") as f:
+            rss_bytes = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    return {
+        "rss_bytes": rss_bytes,
+        "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    }
@@ -0,0 +1,98 @@
+import argparse
+import time
+import numpy as np
+
+
+def role_set(results):
+    return {result["role_number"] for result in results}
+
+
+def pool_recall(searcher, queries, pools, top_k=10, fusion="zscore", mode="candidates"):
+    """
+    Compare "candidates" (or "roles") mode against "exhaustive" mode for
+    several pool sizes. Recall@k is the fraction of the exhaustive top_k
+    roles that the pooled mode also returns in its top_k.
+
+    Args:
+        searcher (HybridSearcher): The search engine.
+        queries (list): The query texts.
+        pools (list): Candidate pool sizes to try.
+        top_k (int): The number of roles compared per query.
+        fusion (str): The fusion method used by both modes.
+        mode (str): "candidates" (pools of chunks) or "roles" (pools of roles).
+    Returns:
+        list: One dict per pool size with mean recall and mean latency (ms).
+    """
+
+    # Exhaustive reference results
+    start = time.perf_counter()
+    reference = [role_set(searcher.search(q, top_k=top_k, fusion=fusion)) for q in queries]
+    exhaustive_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    rows = [{"pool": "exhaustive", "recall": 1.0, "latency_ms": exhaustive_ms}]
+    for pool in pools:
+        recalls = []
+        start = time.perf_counter()
+        for query, expected in zip(queries, reference):
+            found = role_set(searcher.search(query, top_k=top_k, fusion=fusion,
+                                             mode=mode, candidate_pool=pool))
+            recalls.append(len(found & expected) / max(len(expected), 1))
+        latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        rows.append({"pool": pool, "recall": float(np.mean(recalls)), "latency_ms": latency_ms})
+    return rows
+
+
+def full_pool_mismatches(searcher, queries, top_k=10, fusion="zscore"):
+    """
+    Check that "roles" mode with a pool covering every role returns exactly
+    the exhaustive results (same roles, chunks, scores and order). Both
+    modes must score vectors exactly, so run it with VECTOR_BACKEND=numpy
+    or INDEX_MODE=shared (Chroma's HNSW distances differ in the last bits).
+    Args:
+        searcher (HybridSearcher): The search engine.
+        queries (list): The query texts.
+        top_k (int): The number of results compared per query.
+        fusion (str): The fusion method used by both modes.
+    Returns:
+        list: The queries whose results differ.
+    """
+    pool = len(searcher.chunk_meta.roles)
+    mismatches = []
+    for query in queries:
+        exhaustive = searcher.search(query, top_k=top_k, fusion=fusion)
+        roles = searcher.search(query, top_k=top_k, fusion=fusion, mode="roles", candidate_pool=pool)
+        if [(r["id"], r["combined_score"]) for r in exhaustive] != [(r["id"], r["combined_score"]) for r in roles]:
+            mismatches.append(query)
+    return mismatches
+
+
+if __name__ == "__main__":
+    from .app import load_resources
+
+    parser = argparse.ArgumentParser(description="Recall@k of candidate retrieval vs exhaustive search")
+    parser.add_argument("--pools", type=int, nargs="+", default=[25, 50, 100, 200, 400])
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--fusion", choices=["zscore", "rrf"], default="zscore")
+    parser.add_argument("--mode", choices=["candidates", "roles"], default="candidates")
+    parser.add_argument("--max-queries", type=int, default=500)
+    parser.add_argument("--check-roles", action="store_true",
+                        help="Check that roles mode with a full pool equals exhaustive search, then exit")
+    args = parser.parse_args()
+    searcher = load_resources()
+    searcher.result_cache = None
+
+    # Role titles make a realistic query set
+    queries = sorted(set(searcher.chunk_meta.role_titles))[:args.max_queries]
+
+    if args.check_roles:
+        mismatches = full_pool_mismatches(searcher, queries, top_k=args.top_k, fusion=args.fusion)
+        print(f"{len(queries) - len(mismatches)}/{len(queries)} queries match exhaustive search")
+        for query in mismatches[:10]:
+            print(f"  differs: {query!r}")
+        raise SystemExit(1 if mismatches else 0)
+
+    print(f"{len(queries)} queries, recall@{args.top_k}, fusion={args.fusion}, mode={args.mode}")
+    print(f"{'pool':>12} {'recall':>8} {'ms/query':>10}")
+    for row in pool_recall(searcher, queries, args.pools, top_k=args.top_k, fusion=args.fusion,
+                           mode=args.mode):
+        print(f"{row['pool']:>12} {row['recall']:>8.4f} {row['latency_ms']:>10.2f}")
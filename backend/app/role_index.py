@@ -0,0 +1,154 @@
+import json
+import os
+import numpy as np
+from .bm25 import SparseBM25, okapi_idf
+from .vectors import normalize_rows
+
+ROLE_HEADER_FILE = "role_index.json"
+ROLE_EMBEDDINGS_FILE = "role_embeddings.npy"
+ROLE_BM25_PREFIX = "role_bm25_"
+
+
+class RoleIndex:
+    """
+    Role-level retrieval index with one entry per role, aligned with the
+    sorted `ChunkMetadata.roles`: the centroid of the role's chunk
+    embeddings, and a BM25 document holding the terms of all its chunks.
+
+    `HybridSearcher` ranks roles against it in "roles" mode and only
+    rescores the chunks of the best roles.
+    """
+
+    def __init__(self, roles, bm25_index, embeddings):
+        """
+        Args:
+            roles (np.ndarray): Sorted unique role numbers.
+            bm25_index (SparseBM25): BM25 index with one document per role.
+            embeddings (np.ndarray): Normalized centroid embedding per role.
+        """
+        self.roles = np.asarray(roles, dtype=str)
+        self.bm25_index = bm25_index
+        self.embeddings = embeddings
+
+    def __len__(self):
+        return len(self.roles)
+
+    def save(self, directory):
+        """
+        Write the role index next to the chunk index of a bundle.
+        Args:
+            directory (str): The bundle directory.
+        Returns:
+            None
+        """
+        self.bm25_index.save(directory, prefix=ROLE_BM25_PREFIX)
+        np.save(os.path.join(directory, ROLE_EMBEDDINGS_FILE), self.embeddings)
+        with open(os.path.join(directory, ROLE_HEADER_FILE), "w", encoding="utf-8") as f:
+            json.dump({"roles": self.roles.tolist()}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        """
+        Load a role index written by `save`, memory-mapped by default.
+        Args:
+            directory (str): The bundle directory.
+            mmap_mode (str): NumPy mmap mode, or None to read the arrays into memory.
+        Returns:
+            RoleIndex: The index.
+        """
+        with open(os.path.join(directory, ROLE_HEADER_FILE), "r", encoding="utf-8") as f:
+            roles = json.load(f)["roles"]
+        return cls(
+            roles,
+            SparseBM25.load(directory, prefix=ROLE_BM25_PREFIX, mmap_mode=mmap_mode),
+            np.load(os.path.join(directory, ROLE_EMBEDDINGS_FILE), mmap_mode=mmap_mode)
+        )
+
+
+def merge_postings(bm25_index, role_codes, n_roles, epsilon=0.25):
+    """
+    Merge a chunk-level BM25 index into one document per role: a role's term
+    frequencies are the sums over its chunks (tokens in the overlap of two
+    chunks count twice), and IDFs and lengths are recomputed over roles.
+    Args:
+        bm25_index (SparseBM25): The chunk-level index.
+        role_codes (np.ndarray): Role of each chunk, as an index into the sorted roles.
+        n_roles (int): Number of roles.
+        epsilon (float): Floor for negative IDFs, as a fraction of the average IDF.
+    Returns:
+        SparseBM25: The role-level index.
+    """
+    terms = sorted(bm25_index.vocab, key=bm25_index.vocab.get)
+    indptr = np.asarray(bm25_index.indptr)
+    term_of_posting = np.repeat(np.arange(len(terms), dtype=np.int64), np.diff(indptr))
+
+    # One posting per (term, role), sorted by term and then role
+    keys, inverse = np.unique(term_of_posting * n_roles + role_codes[bm25_index.doc_ids], return_inverse=True)
+    tfs = np.bincount(inverse, weights=bm25_index.tfs).astype(np.int64)
+    role_of_posting = keys % n_roles
+    role_indptr = np.searchsorted(keys // n_roles, np.arange(len(terms) + 1))
+
+    doc_len = np.bincount(role_of_posting, weights=tfs, minlength=n_roles).astype(np.int64)
+    idf = okapi_idf(dict(zip(terms, np.diff(role_indptr).tolist())), n_roles, epsilon)
+    return SparseBM25(
+        {term: i for i, term in enumerate(terms)},
+        role_indptr,
+        role_of_posting,
+        tfs,
+        [idf[term] for term in terms],
+        doc_len,
+        float(doc_len.sum()) / n_roles,
+        k1=bm25_index.k1,
+        b=bm25_index.b
+    )
+
+
+def build_role_index(role_numbers, bm25_index, embeddings, dtype=None):
+    """
+    Aggregate a chunk-level index into a RoleIndex.
+    Args:
+        role_numbers (list): Role number of each chunk, in index order.
+        bm25_index (SparseBM25): The chunk-level BM25 index.
+        embeddings (np.ndarray): Normalized chunk embeddings aligned with `role_numbers`.
+        dtype (str): dtype of the centroid matrix, or None for the dtype of `embeddings`.
+    Returns:
+        RoleIndex: The role index.
+    """
+    # Same role order as ChunkMetadata
+    roles, role_codes = np.unique(np.asarray(role_numbers, dtype=str), return_inverse=True)
+    role_codes = role_codes.reshape(-1)
+    embeddings = np.asarray(embeddings)
+    dtype = np.dtype(dtype or embeddings.dtype)
+    if len(roles) == 0:
+        return RoleIndex(roles, SparseBM25({}, [0], [], [], [], [], 1.0),
+                         np.zeros((0, embeddings.shape[-1]), dtype=dtype))
+
+    # Centroid of each role's chunks, summed per role in one segmented reduction
+    order = np.argsort(role_codes, kind="stable")
+    starts = np.searchsorted(role_codes[order], np.arange(len(roles)))
+    centroids = np.add.reduceat(embeddings[order].astype(np.float32), starts, axis=0)
+
+    return RoleIndex(roles, merge_postings(bm25_index, role_codes, len(roles)),
+                     normalize_rows(centroids).astype(dtype))
+
+
+def load_role_index(index_dir, chunk_meta, bm25_index, embeddings):
+    """
+    Load the role index of a bundle, or aggregate it from the chunk index
+    when the chunk index was loaded from elsewhere (a legacy pickle).
+    Args:
+        index_dir (str): The bundle directory, or None.
+        chunk_meta (ChunkMetadata): The chunk metadata table.
+        bm25_index (SparseBM25): The chunk-level BM25 index.
+        embeddings (np.ndarray): Normalized chunk embeddings aligned with `chunk_meta`.
+    Returns:
+        RoleIndex: The role index, aligned with `chunk_meta.roles`.
+    Raises:
+        ValueError: If the bundle's roles do not match the chunk metadata.
+    """
+    if index_dir is not None and os.path.exists(os.path.join(index_dir, ROLE_HEADER_FILE)):
+        role_index = RoleIndex.load(index_dir)
+        if not np.array_equal(role_index.roles, chunk_meta.roles):
+            raise ValueError(f"The role index in {index_dir} does not match the chunk index. Rebuild it.")
+        return role_index
+    return build_role_index(chunk_meta.roles[chunk_meta.role_codes], bm25_index, embeddings)
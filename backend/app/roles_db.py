@@ -0,0 +1,275 @@
+import sqlite3
+import time
+from itertools import islice
+
+# Page size for newly created databases (SQLite ignores it for an existing file)
+PAGE_SIZE = 8192
+
+# Rows per executemany call in the bulk loader
+BULK_BATCH_SIZE = 1000
+
+# Keys per `role_number IN (...)` statement. Lists are padded to a power of
+# two so a handful of statement texts cover every size and stay in the
+# connection's prepared statement cache
+MAX_IN_KEYS = 512
+
+# Read connections map the file and keep a larger page cache
+READ_MMAP_SIZE = 256 * 2 ** 20
+READ_CACHE_KIB = 16 * 1024
+
+ROLE_COLUMNS = ["role_number", "title", "old_regulation", "description"]
+FTS_TABLE = "roles_fts"
+
+
+def create_roles_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS roles (
+        role_number TEXT PRIMARY KEY,
+        title TEXT,
+        old_regulation TEXT,
+        description TEXT
+    )
+    """)
+
+
+def role_row(role):
+    """
+    Turn a role dict (formatted.json layout) into a roles table row.
+    """
+    return (role.get("role_number", ""), role.get("Role Name", ""), role.get("2004 Regulation", ""),
+            role.get("Role Description", ""))
+
+
+def connect_for_bulk_load(db_file, page_size=PAGE_SIZE):
+    """
+    Open the roles database for writing: WAL journaling (readers keep
+    working during a load), synchronous=NORMAL (WAL only syncs on
+    checkpoints) and, for a new file, a larger page size.
+    Args:
+        db_file (str): The path to the SQLite database.
+        page_size (int): Page size used if the file is created.
+    Returns:
+        sqlite3.Connection: The connection, with the roles table created.
+    """
+    conn = sqlite3.connect(db_file)
+    conn.execute(f"PRAGMA page_size={int(page_size)}")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    create_roles_table(conn)
+    return conn
+
+
+def insert_roles(conn, rows, batch_size=BULK_BATCH_SIZE):
+    """
+    Insert or replace role rows with batched executemany calls. The caller commits.
+    Args:
+        conn (sqlite3.Connection): The connection.
+        rows (iterable): (role_number, title, old_regulation, description) tuples.
+        batch_size (int): Rows per executemany call.
+    Returns:
+        int: The number of rows written.
+    """
+    rows = iter(rows)
+    count = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return count
+        conn.executemany(
+            "INSERT OR REPLACE INTO roles (role_number, title, old_regulation, description) VALUES (?, ?, ?, ?)",
+            batch
+        )
+        count += len(batch)
+
+
+def create_fts(conn):
+    """
+    Create (if needed) and rebuild the FTS5 index over role titles and
+    descriptions. It is an external-content table reading from `roles`,
+    so it stores only the inverted index.
+    """
+    conn.execute(f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE}
+    USING fts5(title, description, content='roles', content_rowid='rowid')
+    """)
+    conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')")
+    conn.commit()
+
+
+def has_fts(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name=?", (FTS_TABLE,)).fetchone() is not None
+
+
+def refresh_fts(conn):
+    """
+    Rebuild the FTS5 index after roles changed, if the database has one.
+    """
+    if has_fts(conn):
+        create_fts(conn)
+
+
+def bulk_load_roles(db_file, rows, fts=True, batch_size=BULK_BATCH_SIZE, page_size=PAGE_SIZE):
+    """
+    Load role rows into the roles database in a single transaction.
+    Args:
+        db_file (str): The path to the SQLite database.
+        rows (iterable): (role_number, title, old_regulation, description) tuples, e.g. streamed.
+        fts (bool): Also build the FTS5 index.
+        batch_size (int): Rows per executemany call.
+        page_size (int): Page size used if the file is created.
+    Returns:
+        sqlite3.Connection: The open connection.
+    """
+    conn = connect_for_bulk_load(db_file, page_size)
+    with conn:
+        insert_roles(conn, rows, batch_size)
+    if fts:
+        create_fts(conn)
+    conn.execute("PRAGMA optimize")
+    return conn
+
+
+def open_read_only(db_file):
+    """
+    Open a read-only connection tuned for lookups.
+    Args:
+        db_file (str): The path to the SQLite database.
+    Returns:
+        sqlite3.Connection: The connection.
+    """
+    conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+    conn.execute(f"PRAGMA mmap_size={READ_MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size={-READ_CACHE_KIB}")
+    return conn
+
+
+def fetch_roles(conn, role_numbers, columns=("title", "description")):
+    """
+    Look up many roles with `role_number IN (...)` statements instead of one
+    query per role.
+    Args:
+        conn (sqlite3.Connection): Connection to the roles database.
+        role_numbers (iterable): The role numbers to look up.
+        columns (Sequence): Columns to return, from ROLE_COLUMNS.
+    Returns:
+        dict: Mapping of role number to a tuple of the requested columns; unknown roles are left out.
+    """
+    unknown = [column for column in columns if column not in ROLE_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown role columns {unknown}, expected some of {ROLE_COLUMNS}")
+
+    keys = list(dict.fromkeys(role_numbers))
+    found = {}
+    for start in range(0, len(keys), MAX_IN_KEYS):
+        batch = keys[start:start + MAX_IN_KEYS]
+        size = 1 << (len(batch) - 1).bit_length()
+        placeholders = ",".join("?" * size)
+        cur = conn.execute(
+            f"SELECT role_number, {', '.join(columns)} FROM roles WHERE role_number IN ({placeholders})",
+            batch + [batch[-1]] * (size - len(batch))
+        )
+        for row in cur:
+            found[row[0]] = row[1:]
+    return found
+
+
+def benchmark(rows, db_dir, lookups=200, repeats=5):
+    """
+    Compare the previous row-by-row load with the bulk loader, and single-row
+    SELECTs with IN-list lookups, and time FTS5 queries.
+    Args:
+        rows (list): Role rows to load.
+        db_dir (str): Directory for the scratch databases.
+        lookups (int): Number of role numbers looked up per run.
+        repeats (int): Runs per measurement (the best is reported).
+    Returns:
+        dict: Timings in milliseconds.
+    """
+    import os
+    import random
+
+    report = {"roles": len(rows)}
+
+    def best_of(fn):
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        return round(min(times) * 1000, 3)
+
+    # Loading: one execute per role with default journaling (the previous loader) vs bulk
+    def row_by_row():
+        path = os.path.join(db_dir, "row_by_row.db")
+        if os.path.exists(path):
+            os.remove(path)
+        conn = sqlite3.connect(path)
+        create_roles_table(conn)
+        for row in rows:
+            conn.execute(
+                "INSERT OR REPLACE INTO roles (role_number, title, old_regulation, description) VALUES (?, ?, ?, ?)",
+                row
+            )
+        conn.commit()
+        conn.close()
+
+    def bulk(fts):
+        path = os.path.join(db_dir, "bulk.db")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        bulk_load_roles(path, rows, fts=fts).close()
+
+    report["load_row_by_row_ms"] = best_of(row_by_row)
+    report["load_bulk_ms"] = best_of(lambda: bulk(False))
+    report["load_bulk_fts_ms"] = best_of(lambda: bulk(True))
+
+    # Lookups on the bulk-loaded database
+    conn = open_read_only(os.path.join(db_dir, "bulk.db"))
+    keys = random.Random(0).sample([row[0] for row in rows], min(lookups, len(rows)))
+
+    def single_rows():
+        for key in keys:
+            conn.execute("SELECT title, description FROM roles WHERE role_number=?", (key,)).fetchone()
+
+    report[f"lookup_{len(keys)}_single_ms"] = best_of(single_rows)
+    report[f"lookup_{len(keys)}_in_list_ms"] = best_of(lambda: fetch_roles(conn, keys))
+    report["lookup_1_ms"] = best_of(lambda: fetch_roles(conn, keys[:1]))
+
+    queries = ["software developer", "electrician", "teacher primary school", "driver heavy vehicle",
+               "nurse hospital"]
+
+    def fts_queries():
+        for query in queries:
+            conn.execute(
+                f"SELECT rowid, bm25({FTS_TABLE}) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ?",
+                (" OR ".join(query.split()),)
+            ).fetchall()
+
+    report["fts_query_ms"] = round(best_of(fts_queries) / len(queries), 3)
+    conn.close()
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import tempfile
+    from .utils import iter_roles
+
+    parser = argparse.ArgumentParser(description="Add the FTS5 index to roles.db, or benchmark loading and lookups")
+    parser.add_argument("--db", default="db/roles.db")
+    parser.add_argument("--fts", action="store_true", help="Create or rebuild the FTS5 index in --db")
+    parser.add_argument("--benchmark", metavar="JSON_FILE", help="Benchmark on scratch copies loaded from this file")
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.fts:
+        conn = connect_for_bulk_load(args.db)
+        create_fts(conn)
+        conn.close()
+        print(f"Built {FTS_TABLE} in {args.db}")
+    if args.benchmark:
+        with tempfile.TemporaryDirectory() as db_dir:
+            rows = [role_row(role) for role in iter_roles(args.benchmark)]
+            print(json.dumps(benchmark(rows, db_dir, args.lookups), indent=2))
@@ -0,0 +1,542 @@
+import numpy as np
+from nltk.tokenize import word_tokenize
+from .utils import zscore_norm, reciprocal_rank
+from .cache import normalize_query
+from .bm25 import top_matches
+from .vectors import normalize_rows
+from .metrics import stage_timer
+
+RRF_K = 60
+
+
+class HybridSearcher:
+    """
+    Hybrid BM25 + vector search over the prebuilt indexes, independent of FastAPI.
+
+    Three retrieval modes are supported:
+      - "exhaustive": score every chunk with both retrievers and fuse over the whole corpus.
+      - "candidates": take the top `candidate_pool` chunks from each retriever and
+        fuse only the union of those candidates.
+      - "roles": rank roles against the RoleIndex (one centroid embedding and
+        one BM25 document per role), then rescore only the chunks of the top
+        `candidate_pool` roles to pick each role's best chunk.
+    Fusion is either z-score normalization ("zscore") or reciprocal rank fusion ("rrf").
+
+    Query embeddings and full results can be cached; the result cache is tied
+    to `index_version` and must be invalidated when the indexes change.
+
+    Every stage of `search` is timed and recorded in `metrics` when given.
+
+    With a HierarchyIndex, searches can be restricted to an NCO division,
+    sub-division, group or family: the code's chunks become the candidate
+    set, and vector similarity, normalization, fusion and ranking only run
+    over them. `facets` aggregates the fused scores up the hierarchy.
+    """
+
+    def __init__(self, bm25_index, collection, model, chunk_meta, embeddings=None, vector_backend="chroma",
+                 embedding_cache=None, result_cache=None, index_version=None, metrics=None, hierarchy=None,
+                 role_index=None, facet_metrics=None):
+        """
+        Args:
+            bm25_index (SparseBM25): The BM25 index, aligned with `chunk_meta`.
+            collection (chromadb.Collection): The Chroma collection of chunk embeddings.
+            model (SentenceTransformer): The query embedding model.
+            chunk_meta (ChunkMetadata): The chunk metadata table.
+            embeddings (np.ndarray): Normalized chunk embeddings aligned with `chunk_meta`, or None.
+            vector_backend (str): "chroma" for HNSW queries, "numpy" for exact search over `embeddings`.
+            embedding_cache (LRUCache): Cache of query embeddings, or None.
+            result_cache (LRUCache): Cache of full search results, or None.
+            index_version (str): Identifier of the loaded index build.
+            metrics (StageMetrics): Per-stage latency histograms of `search`, or None.
+            hierarchy (HierarchyIndex): Prefix index over role codes, or None.
+            role_index (RoleIndex): Role-level index aligned with `chunk_meta.roles`, or None.
+            facet_metrics (StageMetrics): Per-stage latency histograms of `facets`, or None.
+        """
+        self.bm25_index = bm25_index
+        self.collection = collection
+        self.model = model
+        self.chunk_meta = chunk_meta
+        self.embeddings = embeddings
+        self.vector_backend = vector_backend
+        self.embedding_cache = embedding_cache
+        self.result_cache = result_cache
+        self.index_version = index_version
+        self.metrics = metrics
+        self.hierarchy = hierarchy
+        self.role_index = role_index
+        self.facet_metrics = facet_metrics
+
+    def encode(self, query):
+        """
+        Embed a query, going through the embedding cache when there is one.
+        Args:
+            query (str): The query text.
+        Returns:
+            np.ndarray: The query embedding.
+        """
+        if self.embedding_cache is None:
+            return self.model.encode(query)
+
+        key = normalize_query(query)
+        query_emb = self.embedding_cache.get(key)
+        if query_emb is None:
+            query_emb = self.model.encode(query)
+            self.embedding_cache.put(key, query_emb)
+        return query_emb
+
+    def encode_batch(self, queries, batch_size=64):
+        """
+        Embed many queries, encoding only the cache misses in one model call.
+        Args:
+            queries (list): The query texts.
+            batch_size (int): The model's encoding batch size.
+        Returns:
+            np.ndarray: One embedding row per query.
+        """
+        if self.embedding_cache is None:
+            return np.asarray(self.model.encode(list(queries), batch_size=batch_size))
+
+        keys = [normalize_query(query) for query in queries]
+        found = {key: self.embedding_cache.get(key) for key in set(keys)}
+        missing = [key for key, emb in found.items() if emb is None]
+        if missing:
+            for key, emb in zip(missing, self.model.encode(missing, batch_size=batch_size)):
+                found[key] = emb
+                self.embedding_cache.put(key, emb)
+        return np.stack([found[key] for key in keys])
+
+    def invalidate(self, index_version=None):
+        """
+        Drop cached results after the indexes were rebuilt.
+        Args:
+            index_version (str): Identifier of the new index build.
+        Returns:
+            None
+        """
+        self.index_version = index_version
+        if self.result_cache is not None:
+            self.result_cache.clear()
+
+    def vector_candidates(self, query_emb, n_results):
+        """
+        Retrieve the nearest chunks from the configured vector backend.
+        Args:
+            query_emb (np.ndarray): The query embedding.
+            n_results (int): The number of chunks to retrieve.
+        Returns:
+            tuple: Chunk indices (best first) and their similarities.
+        """
+        if self.vector_backend == "numpy":
+            sims = self.vector_scores(query_emb)
+            top = top_indices(sims, n_results)
+            return top, sims[top]
+
+        vector_results = self.collection.query(
+            query_embeddings=[np.asarray(query_emb).tolist()],
+            n_results=min(n_results, len(self.chunk_meta))
+        )
+
+        # Convert distances to similarity
+        id_to_idx = self.chunk_meta.id_to_idx
+        indices, sims = [], []
+        for doc_id, distance in zip(vector_results["ids"][0], vector_results["distances"][0]):
+            if doc_id in id_to_idx:
+                indices.append(id_to_idx[doc_id])
+                sims.append(1 - distance)
+        return np.array(indices, dtype=np.int64), np.array(sims)
+
+    def vector_scores(self, query_emb):
+        """
+        Exact cosine similarity of the query to every chunk, as a single matvec.
+        Args:
+            query_emb (np.ndarray): The query embedding.
+        Returns:
+            np.ndarray: Similarity per chunk, aligned with `chunk_meta`.
+        """
+        return self.embeddings @ normalize_rows(query_emb)
+
+    def scoped_vector_scores(self, query_emb, scope):
+        """
+        Exact cosine similarity of the query to the chunks in `scope` only.
+        Args:
+            query_emb (np.ndarray): The query embedding.
+            scope (np.ndarray): Sorted chunk indices.
+        Returns:
+            np.ndarray: Similarity per chunk of `scope`.
+        """
+        if self.embeddings is None:
+            raise RuntimeError("Restricted search needs the chunk embedding matrix.")
+        return self.embeddings[scope] @ normalize_rows(query_emb)
+
+    def facet_scope(self, code_prefix):
+        """
+        Candidate chunk indices of an NCO code, or None for an unrestricted search.
+        """
+        if code_prefix is None:
+            return None
+        if self.hierarchy is None:
+            raise RuntimeError("Restricted search needs the hierarchy index.")
+        return self.hierarchy.scope(code_prefix)
+
+    def search(self, query, top_k=10, bm25_weight=0.4, vector_weight=0.6,
+               mode="exhaustive", fusion="zscore", candidate_pool=200, timings=None, code_prefix=None):
+        """
+        Run a hybrid search, returning only the best chunk per role_number.
+        Args:
+            query (str): The query text.
+            top_k (int): The number of roles to return.
+            bm25_weight (float): Weight of the BM25 scores.
+            vector_weight (float): Weight of the vector scores.
+            mode (str): "exhaustive", "candidates" or "roles".
+            fusion (str): "zscore" or "rrf".
+            candidate_pool (int): Chunks taken from each retriever in "candidates" mode,
+                roles rescored in "roles" mode.
+            timings (dict): If given, receives the seconds spent in each stage.
+            code_prefix (str): Restrict the search to this NCO division, sub-division, group or family code.
+        Returns:
+            list: The search results, best first.
+        """
+        with stage_timer(self.metrics, "total", timings):
+            if self.result_cache is None:
+                return self._search(query, top_k, bm25_weight, vector_weight, mode, fusion, candidate_pool,
+                                    timings, code_prefix)
+
+            with stage_timer(self.metrics, "result_cache", timings):
+                key = (self.index_version, normalize_query(query), top_k, bm25_weight, vector_weight,
+                       mode, fusion, candidate_pool, code_prefix)
+                results = self.result_cache.get(key)
+            if results is None:
+                results = self._search(query, top_k, bm25_weight, vector_weight, mode, fusion, candidate_pool,
+                                       timings, code_prefix)
+                self.result_cache.put(key, results)
+            return results
+
+    def _search(self, query, top_k, bm25_weight, vector_weight, mode, fusion, candidate_pool, timings=None,
+                code_prefix=None):
+        """
+        Uncached search; see `search` for the arguments.
+        """
+        scope = self.facet_scope(code_prefix)
+        if scope is not None and len(scope) == 0:
+            return []
+
+        # Tokenize and embed the query
+        with stage_timer(self.metrics, "tokenize", timings):
+            tokenized_query = word_tokenize(query.lower())
+        with stage_timer(self.metrics, "encode", timings):
+            query_emb = self.encode(query)
+
+        if mode == "roles":
+            return self._search_roles(tokenized_query, query_emb, top_k, bm25_weight, vector_weight, fusion,
+                                      candidate_pool, timings, scope)
+
+        if mode == "candidates":
+            with stage_timer(self.metrics, "bm25", timings):
+                if scope is None:
+                    bm25_top, bm25_all = self.bm25_index.top_n(tokenized_query, candidate_pool)
+                else:
+                    bm25_all = self.bm25_index.get_scores(tokenized_query)[scope]
+                    bm25_top = top_matches(bm25_all, candidate_pool)
+            with stage_timer(self.metrics, "vector", timings):
+                if scope is None:
+                    vector_top, vector_sims = self.vector_candidates(query_emb, candidate_pool)
+                else:
+                    sims = self.scoped_vector_scores(query_emb, scope)
+                    vector_top = top_indices(sims, candidate_pool)
+                    vector_sims = sims[vector_top]
+            return self._fuse_candidates(bm25_all, bm25_top, vector_top, vector_sims,
+                                         top_k, bm25_weight, vector_weight, fusion, self.metrics, timings, scope)
+
+        bm25_scores, vector_scores, combined_scores = self._fused_scores(
+            tokenized_query, query_emb, bm25_weight, vector_weight, fusion, scope, timings, self.metrics
+        )
+
+        # Pick the best chunk per role_number and take top_k
+        with stage_timer(self.metrics, "rank", timings):
+            best = self.chunk_meta.best_per_role(combined_scores, top_k, scope)
+        with stage_timer(self.metrics, "results", timings):
+            return self._results(best, bm25_scores, vector_scores, combined_scores, scope)
+
+    def _search_roles(self, tokenized_query, query_emb, top_k, bm25_weight, vector_weight, fusion,
+                      role_pool, timings=None, scope=None):
+        """
+        Two-stage search: rank roles on the role index, then fuse the chunk
+        scores of the best `role_pool` roles only. With a pool covering
+        every role, the results equal exhaustive search.
+        Returns:
+            list: The search results, best first.
+        """
+        if self.role_index is None or self.embeddings is None:
+            raise RuntimeError("Role-level search needs the role index and the chunk embedding matrix.")
+        meta = self.chunk_meta
+        query_emb = normalize_rows(query_emb)
+
+        # Stage one: fuse role-level scores and keep the best roles
+        with stage_timer(self.metrics, "roles", timings):
+            role_bm25 = self.role_index.bm25_index.get_scores(tokenized_query)
+            if scope is None:
+                role_vector = self.role_index.embeddings @ query_emb
+            else:
+                scope_roles = np.unique(meta.role_codes[scope])
+                role_bm25 = role_bm25[scope_roles]
+                role_vector = self.role_index.embeddings[scope_roles] @ query_emb
+            role_bm25, role_vector = normalize_scores(role_bm25, role_vector, fusion)
+            top_roles = top_indices(bm25_weight * role_bm25 + vector_weight * role_vector, role_pool)
+            if scope is not None:
+                top_roles = scope_roles[top_roles]
+            grouped, _ = meta.role_chunks(top_roles)
+
+            # Score in chunk order, so rank fusion and best_per_role break ties like the other modes
+            candidates = np.sort(grouped)
+
+        # Stage two: rescore the chunks of those roles
+        with stage_timer(self.metrics, "bm25", timings):
+            bm25_scores = self.bm25_index.get_scores(tokenized_query)[candidates]
+        with stage_timer(self.metrics, "vector", timings):
+            vector_scores = self.embeddings[candidates] @ query_emb
+        with stage_timer(self.metrics, "fusion", timings):
+            bm25_scores, vector_scores = normalize_scores(bm25_scores, vector_scores, fusion)
+            combined_scores = bm25_weight * bm25_scores + vector_weight * vector_scores
+
+        with stage_timer(self.metrics, "rank", timings):
+            best = meta.best_per_role(combined_scores, top_k, candidates)
+        with stage_timer(self.metrics, "results", timings):
+            return self._results(best, bm25_scores, vector_scores, combined_scores, candidates)
+
+    def _fused_scores(self, tokenized_query, query_emb, bm25_weight, vector_weight, fusion, scope=None,
+                      timings=None, metrics=None):
+        """
+        Score every chunk (or every chunk of `scope`) with both retrievers and fuse the scores.
+        Stage timings are recorded in `metrics` (the caller's histograms), if given.
+        Returns:
+            tuple: Normalized BM25, normalized vector and combined scores.
+        """
+        with stage_timer(metrics, "bm25", timings):
+            bm25_scores = self.bm25_index.get_scores(tokenized_query)
+            if scope is not None:
+                bm25_scores = bm25_scores[scope]
+        with stage_timer(metrics, "vector", timings):
+            if scope is not None:
+                vector_scores = self.scoped_vector_scores(query_emb, scope)
+            elif self.vector_backend == "numpy":
+                vector_scores = self.vector_scores(query_emb)
+            else:
+                vector_top, vector_sims = self.vector_candidates(query_emb, len(self.chunk_meta))
+
+                # Align vector scores to bm25_ids
+                vector_scores = np.zeros(len(self.chunk_meta))
+                vector_scores[vector_top] = vector_sims
+
+        # Normalize and combine scores
+        with stage_timer(metrics, "fusion", timings):
+            bm25_scores, vector_scores = normalize_scores(bm25_scores, vector_scores, fusion)
+            combined_scores = bm25_weight * bm25_scores + vector_weight * vector_scores
+        return bm25_scores, vector_scores, combined_scores
+
+    def facets(self, query, level="family", top_k=10, bm25_weight=0.4, vector_weight=0.6, fusion="zscore",
+               code_prefix=None, timings=None):
+        """
+        Rank NCO divisions, sub-divisions, groups or families for a query.
+        The corpus (or the `code_prefix` subtree) is scored once, as in an
+        exhaustive search, and the fused chunk scores are aggregated up the
+        hierarchy: a role scores its best chunk, a group its best role.
+        Args:
+            query (str): The query text.
+            level (str): "division", "sub_division", "group" or "family".
+            top_k (int): The number of groups to return.
+            bm25_weight (float): Weight of the BM25 scores.
+            vector_weight (float): Weight of the vector scores.
+            fusion (str): "zscore" or "rrf".
+            code_prefix (str): Only rank groups under this NCO code.
+            timings (dict): If given, receives the seconds spent in each stage.
+        Returns:
+            list: The best groups, best first.
+        """
+        if self.hierarchy is None:
+            raise RuntimeError("Facets need the hierarchy index.")
+
+        # Own histograms, so facet calls do not skew the /search stage latencies
+        metrics = self.facet_metrics
+        with stage_timer(metrics, "facets", timings):
+            key = ("facets", self.index_version, normalize_query(query), level, top_k, bm25_weight,
+                   vector_weight, fusion, code_prefix)
+            if self.result_cache is not None:
+                groups = self.result_cache.get(key)
+                if groups is not None:
+                    return groups
+
+            scope = self.facet_scope(code_prefix)
+            if scope is not None and len(scope) == 0:
+                return []
+            with stage_timer(metrics, "tokenize", timings):
+                tokenized_query = word_tokenize(query.lower())
+            with stage_timer(metrics, "encode", timings):
+                query_emb = self.encode(query)
+            _, _, combined_scores = self._fused_scores(
+                tokenized_query, query_emb, bm25_weight, vector_weight, fusion, scope, timings, metrics
+            )
+            with stage_timer(metrics, "aggregate", timings):
+                groups = self.hierarchy.aggregate(combined_scores, level, top_k, scope)
+
+            if self.result_cache is not None:
+                self.result_cache.put(key, groups)
+            return groups
+
+    def _fuse_candidates(self, bm25_all, bm25_top, vector_top, vector_sims,
+                         top_k, bm25_weight, vector_weight, fusion, metrics=None, timings=None, scope=None):
+        """
+        Fuse the union of both retrievers' candidate pools and pick the best chunk per role.
+        Args:
+            bm25_all (np.ndarray): BM25 score of every chunk (of `scope`).
+            bm25_top (np.ndarray): BM25 candidate chunk indices, best first.
+            vector_top (np.ndarray): Vector candidate chunk indices, best first.
+            vector_sims (np.ndarray): Similarities of the vector candidates.
+            top_k (int): The number of roles to return.
+            bm25_weight (float): Weight of the BM25 scores.
+            vector_weight (float): Weight of the vector scores.
+            fusion (str): "zscore" or "rrf".
+            metrics (StageMetrics): Stage histograms to record into, or None.
+            timings (dict): Per-request stage durations, or None.
+            scope (np.ndarray): Chunk indices the other arguments index into, or None for every chunk.
+        Returns:
+            list: The search results, best first.
+        """
+        with stage_timer(metrics, "fusion", timings):
+            candidates = np.union1d(bm25_top, vector_top)
+
+            if fusion == "rrf":
+                # Rank terms only exist for chunks a retriever actually returned
+                bm25_scores = pool_reciprocal_rank(candidates, bm25_top)
+                vector_scores = pool_reciprocal_rank(candidates, vector_top)
+            else:
+                # BM25 is exact for every candidate; chunks outside the ANN pool
+                # get the lowest similarity seen in it
+                bm25_scores = bm25_all[candidates]
+                vector_scores = np.full(len(candidates), vector_sims.min() if len(vector_sims) else 0.0)
+                vector_scores[np.searchsorted(candidates, vector_top)] = vector_sims
+                bm25_scores, vector_scores = normalize_scores(bm25_scores, vector_scores, fusion)
+
+            combined_scores = bm25_weight * bm25_scores + vector_weight * vector_scores
+        if scope is not None:
+            candidates = scope[candidates]
+        with stage_timer(metrics, "rank", timings):
+            best = self.chunk_meta.best_per_role(combined_scores, top_k, candidates)
+        with stage_timer(metrics, "results", timings):
+            return self._results(best, bm25_scores, vector_scores, combined_scores, candidates)
+
+    def _results(self, best, bm25_scores, vector_scores, combined_scores, candidates=None):
+        """
+        Materialize result rows for the winning positions.
+        """
+        return [
+            self.chunk_meta.result(
+                idx if candidates is None else candidates[idx],
+                bm25_scores[idx], vector_scores[idx], combined_scores[idx]
+            )
+            for idx in best
+        ]
+
+    def batch_search(self, queries, top_k=10, bm25_weight=0.4, vector_weight=0.6,
+                     mode="exhaustive", fusion="zscore", candidate_pool=200, batch_size=64):
+        """
+        Search many queries at once. Queries are embedded in batches and vector
+        similarities are computed as one matrix product against the chunk
+        embedding matrix; exhaustive fusion and per-role selection also run on
+        whole score matrices.
+
+        Rankings match `search`; vector scores are exact cosine similarities
+        instead of Chroma's HNSW distances, which only differ by an affine
+        transform that z-score and rank fusion cancel out.
+
+        Args:
+            queries (list): The query texts.
+            top_k (int): The number of roles to return per query.
+            bm25_weight (float): Weight of the BM25 scores.
+            vector_weight (float): Weight of the vector scores.
+            mode (str): "exhaustive" or "candidates".
+            fusion (str): "zscore" or "rrf".
+            candidate_pool (int): Chunks taken from each retriever in "candidates" mode.
+            batch_size (int): Queries encoded and scored together.
+        Returns:
+            list: One list of search results per query.
+        """
+        if self.embeddings is None:
+            raise RuntimeError("Batch search needs the chunk embedding matrix.")
+
+        all_results = []
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start:start + batch_size]
+
+            # Embed the batch and score it against every chunk
+            query_embs = normalize_rows(self.encode_batch(batch, batch_size))
+            vector_scores = query_embs @ self.embeddings.T
+            bm25_scores = np.stack([
+                self.bm25_index.get_scores(word_tokenize(query.lower())) for query in batch
+            ])
+
+            if mode == "candidates":
+                for bm25_row, vector_row in zip(bm25_scores, vector_scores):
+                    bm25_top = top_matches(bm25_row, candidate_pool)
+                    vector_top = top_indices(vector_row, candidate_pool)
+                    all_results.append(self._fuse_candidates(
+                        bm25_row, bm25_top, vector_top, vector_row[vector_top],
+                        top_k, bm25_weight, vector_weight, fusion
+                    ))
+                continue
+
+            # Normalize and combine whole score matrices
+            bm25_scores, vector_scores = normalize_scores(bm25_scores, vector_scores, fusion)
+            combined_scores = bm25_weight * bm25_scores + vector_weight * vector_scores
+
+            best = self.chunk_meta.best_per_role_batch(combined_scores, top_k)
+            for row, winners in enumerate(best):
+                all_results.append(self._results(
+                    winners, bm25_scores[row], vector_scores[row], combined_scores[row]
+                ))
+        return all_results
+
+
+def normalize_scores(bm25_scores, vector_scores, fusion):
+    """
+    Put BM25 and vector scores on a common scale (row-wise for 2-D inputs).
+    Args:
+        bm25_scores (np.ndarray): BM25 scores.
+        vector_scores (np.ndarray): Vector similarities.
+        fusion (str): "zscore" or "rrf".
+    Returns:
+        tuple: The normalized BM25 and vector scores.
+    """
+    if fusion == "rrf":
+        return reciprocal_rank(bm25_scores, RRF_K), reciprocal_rank(vector_scores, RRF_K)
+    return zscore_norm(bm25_scores), zscore_norm(vector_scores)
+
+
+def top_indices(scores, n):
+    """
+    Indices of the n highest scores, best first.
+    Args:
+        scores (np.ndarray): The scores.
+        n (int): The number of indices to return.
+    Returns:
+        np.ndarray: The indices.
+    """
+    if n < len(scores):
+        top = np.argpartition(-scores, n - 1)[:n]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def pool_reciprocal_rank(candidates, ranked, k=RRF_K):
+    """
+    Reciprocal rank terms of a retriever's ranked list, aligned to the candidate union.
+    Args:
+        candidates (np.ndarray): Sorted chunk indices of the candidate union.
+        ranked (np.ndarray): Chunk indices returned by one retriever, best first.
+        k (int): The RRF smoothing constant.
+    Returns:
+        np.ndarray: 1 / (k + rank) for returned chunks, 0 for the others.
+    """
+    terms = np.zeros(len(candidates))
+    terms[np.searchsorted(candidates, ranked)] = 1.0 / (k + np.arange(1, len(ranked) + 1))
+    return terms
@@ -0,0 +1,628 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+from .bm25 import SparseBM25
+from .metadata import ChunkMetadata
+from .role_index import RoleIndex, build_role_index
+from .vectors import load_chunk_embeddings
+
+SHARED_INDEX_DIR = "db/shared"
+HEADER_FILE = "index.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+
+# Index bundle layout version, bumped whenever files are added, removed or change meaning
+FORMAT_VERSION = 2
+MANIFEST_FILE = "manifest.json"
+
+# Pickled (BM25Okapi, ids) tuple written by builds before the bundle format
+LEGACY_BM25_PATH = "db/bm25_index.pkl"
+
+# How long loaders wait for a bundle's manifest to appear (a publish in progress)
+MANIFEST_WAIT_SECONDS = 2.0
+
+
+class MappedStrings:
+    """
+    Read-only sequence of strings stored as one UTF-8 byte array plus offsets,
+    both memory-mapped. Strings are decoded on access.
+    """
+
+    def __init__(self, data, offsets):
+        """
+        Args:
+            data (np.ndarray): uint8 array holding every string back to back.
+            offsets (np.ndarray): int64 array of length n + 1 with each string's start.
+        """
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        return self.data[self.offsets[idx]:self.offsets[idx + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+
+def save_strings(directory, name, strings):
+    """
+    Write strings as `<name>_bytes.npy` and `<name>_offsets.npy` for MappedStrings.
+    """
+    encoded = [text.encode("utf-8") for text in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(text) for text in encoded])
+    np.save(os.path.join(directory, f"{name}_bytes.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+    np.save(os.path.join(directory, f"{name}_offsets.npy"), offsets)
+
+
+def load_strings(directory, name, mmap_mode="r"):
+    """
+    Memory-map strings written by `save_strings`.
+    """
+    return MappedStrings(np.load(os.path.join(directory, f"{name}_bytes.npy"), mmap_mode=mmap_mode),
+                         np.load(os.path.join(directory, f"{name}_offsets.npy"), mmap_mode=mmap_mode))
+
+
+class SharedIndexWriter:
+    """
+    Builds an index bundle directory batch by batch. Chunk texts and
+    embeddings are appended to raw files as they arrive and only converted
+    to .npy at the end, so a streaming build never holds the full matrix
+    or all chunk texts in memory.
+
+    The directory is assembled next to the destination and published by
+    `finish` (see `publish_bundle`); processes that still map the old files
+    keep reading them until they reload. The manifest is written last, so
+    a directory without one is incomplete.
+    """
+
+    def __init__(self, out_dir=SHARED_INDEX_DIR, dtype="float32", params=None):
+        """
+        Args:
+            out_dir (str): The destination directory.
+            dtype (str): "float32" or "float16" for the embedding matrix.
+            params (dict): Build parameters recorded in the manifest (model, max_tokens, overlap, ...).
+        """
+        self.out_dir = out_dir
+        self.dtype = np.dtype(dtype)
+        self.params = params or {}
+        self.tmp_dir = f"{out_dir}.tmp"
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        os.makedirs(self.tmp_dir)
+
+        self.ids = []
+        self.role_numbers = []
+        self.chunk_indices = []
+        self.text_offsets = [0]
+        self.dim = None
+        self._texts = open(os.path.join(self.tmp_dir, "chunk_texts.bin"), "wb")
+        self._embeddings = open(os.path.join(self.tmp_dir, "embeddings.bin"), "wb")
+
+    def add(self, ids, role_numbers, chunk_indices, texts, embeddings):
+        """
+        Append a batch of chunks.
+        Args:
+            ids (list): Chunk ids, in `bm25_ids` order.
+            role_numbers (list): Role number of each chunk.
+            chunk_indices (list): Position of each chunk inside its role description.
+            texts (list): Text of each chunk.
+            embeddings (np.ndarray): Normalized chunk embeddings aligned with `ids`.
+        Returns:
+            None
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype=self.dtype)
+        if len(ids):
+            self.dim = embeddings.shape[1]
+        self._embeddings.write(embeddings.tobytes())
+        for text in texts:
+            encoded = text.encode("utf-8")
+            self._texts.write(encoded)
+            self.text_offsets.append(self.text_offsets[-1] + len(encoded))
+        self.ids.extend(ids)
+        self.role_numbers.extend(role_numbers)
+        self.chunk_indices.extend(chunk_indices)
+
+    def finish(self, bm25_index, index_version=None):
+        """
+        Write the BM25 arrays, the role index, the header and the manifest,
+        and swap the directory into place.
+        Args:
+            bm25_index (SparseBM25): The BM25 index over the added chunks, in order.
+            index_version (str): The index version, or None to derive it from the file checksums.
+        Returns:
+            str: The index version.
+        """
+        self._texts.close()
+        self._embeddings.close()
+        raw_to_npy(os.path.join(self.tmp_dir, "chunk_texts.bin"),
+                   os.path.join(self.tmp_dir, "chunk_texts_bytes.npy"), np.uint8, (self.text_offsets[-1],))
+        np.save(os.path.join(self.tmp_dir, "chunk_texts_offsets.npy"), np.asarray(self.text_offsets, dtype=np.int64))
+
+        raw_to_npy(os.path.join(self.tmp_dir, "embeddings.bin"), os.path.join(self.tmp_dir, EMBEDDINGS_FILE),
+                   self.dtype, (len(self.ids), self.dim or 0))
+
+        bm25_index.save(self.tmp_dir)
+
+        # Role-level index for two-stage search, aggregated from the finished chunk index
+        embeddings = np.load(os.path.join(self.tmp_dir, EMBEDDINGS_FILE), mmap_mode="r")
+        role_index = build_role_index(self.role_numbers, bm25_index, embeddings, self.dtype)
+        role_index.save(self.tmp_dir)
+        del embeddings
+
+        np.save(os.path.join(self.tmp_dir, "chunk_indices.npy"), np.asarray(self.chunk_indices, dtype=np.int32))
+        with open(os.path.join(self.tmp_dir, HEADER_FILE), "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "role_numbers": self.role_numbers}, f, ensure_ascii=False)
+
+        files = {
+            name: {"bytes": os.path.getsize(os.path.join(self.tmp_dir, name)),
+                   "sha256": file_checksum(os.path.join(self.tmp_dir, name))}
+            for name in sorted(os.listdir(self.tmp_dir))
+        }
+        if index_version is None:
+            index_version = hashlib.sha256(
+                json.dumps({name: entry["sha256"] for name, entry in files.items()}).encode("utf-8")
+            ).hexdigest()[:16]
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "index_version": index_version,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "params": self.params,
+            "counts": {"chunks": len(self.ids), "roles": len(role_index), "terms": len(bm25_index.vocab),
+                       "dim": self.dim or 0},
+            "dtype": self.dtype.name,
+            "files": files
+        }
+        with open(os.path.join(self.tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        publish_bundle(self.tmp_dir, self.out_dir)
+        return index_version
+
+
+def publish_bundle(staged_dir, out_dir=SHARED_INDEX_DIR):
+    """
+    Publish a finished bundle directory. It is moved to a versioned sibling
+    (`<out_dir>.<timestamp>`) and `out_dir`, a symlink, is replaced in one
+    rename, so `out_dir` always points at a complete bundle. The generation
+    it replaces is kept for readers still loading it; older ones are deleted.
+    Args:
+        staged_dir (str): The finished bundle directory.
+        out_dir (str): The published bundle path.
+    Returns:
+        str: The versioned directory.
+    """
+    generation = f"{out_dir}.{time.time_ns()}"
+    os.replace(staged_dir, generation)
+    previous = os.path.realpath(out_dir) if os.path.islink(out_dir) else None
+
+    link_tmp = f"{out_dir}.link"
+    if os.path.lexists(link_tmp):
+        os.remove(link_tmp)
+    try:
+        os.symlink(os.path.basename(generation), link_tmp, target_is_directory=True)
+    except (OSError, NotImplementedError):
+        link_tmp = None
+
+    old_dir = f"{out_dir}.old"
+    if link_tmp is not None and not (os.path.isdir(out_dir) and not os.path.islink(out_dir)):
+        os.replace(link_tmp, out_dir)
+    else:
+        # A bundle directory from before versioned publishing, or no symlink
+        # support: swap directories (loaders wait out the gap)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.lexists(out_dir):
+            os.replace(out_dir, old_dir)
+        os.replace(link_tmp or generation, out_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if link_tmp is None:
+            return out_dir
+
+    keep = {os.path.realpath(generation), previous}
+    for path in glob.glob(f"{glob.escape(out_dir)}.[0-9]*"):
+        if os.path.realpath(path) not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+    return generation
+
+
+def resolve_bundle(index_dir=SHARED_INDEX_DIR, wait=MANIFEST_WAIT_SECONDS):
+    """
+    Resolve the published bundle path to its versioned directory, so every
+    file of one load comes from the same build. Waits up to `wait` seconds
+    for a manifest, in case a bundle is being published.
+    Args:
+        index_dir (str): The published bundle path.
+        wait (float): Seconds to wait for the manifest.
+    Returns:
+        str: The bundle directory (unchanged if it has no manifest).
+    """
+    deadline = time.monotonic() + wait
+    while not os.path.exists(os.path.join(index_dir, MANIFEST_FILE)) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return os.path.realpath(index_dir)
+
+
+def bundle_published(index_dir=SHARED_INDEX_DIR):
+    """
+    Whether a bundle has been published at `index_dir`, even if it is being
+    replaced right now.
+    """
+    return (os.path.lexists(index_dir) or os.path.exists(f"{index_dir}.old")
+            or bool(glob.glob(f"{glob.escape(index_dir)}.[0-9]*")))
+
+
+def file_checksum(path, block_size=1 << 20):
+    """
+    SHA-256 of a file, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def raw_to_npy(raw_path, npy_path, dtype, shape):
+    """
+    Convert a raw array file to .npy through memory maps, then delete it.
+    """
+    if np.prod(shape) == 0:
+        np.save(npy_path, np.zeros(shape, dtype=dtype))
+    else:
+        out = np.lib.format.open_memmap(npy_path, mode="w+", dtype=dtype, shape=shape)
+        out[:] = np.memmap(raw_path, dtype=dtype, mode="r", shape=shape)
+        out.flush()
+        del out
+    os.remove(raw_path)
+
+
+def export_shared_index(bm25_index, ids, role_numbers, chunk_indices, chunk_texts, embeddings,
+                        index_version=None, out_dir=SHARED_INDEX_DIR, dtype="float32", params=None):
+    """
+    Write the search indexes as an index bundle, a read-only, memory-mappable
+    layout: BM25 postings and chunk metadata as .npy arrays, chunk texts as
+    one UTF-8 byte array, the normalized embedding matrix, the role-level
+    index (see `RoleIndex`) and a manifest.
+
+    Args:
+        bm25_index (SparseBM25): The BM25 index.
+        ids (list): Chunk ids, in `bm25_ids` order.
+        role_numbers (list): Role number of each chunk.
+        chunk_indices (list): Position of each chunk inside its role description.
+        chunk_texts (list): Text of each chunk.
+        embeddings (np.ndarray): Normalized chunk embeddings aligned with `ids`.
+        index_version (str): The index version, or None to derive it from the file checksums.
+        out_dir (str): The destination directory.
+        dtype (str): "float32" or "float16" for the embedding matrix.
+        params (dict): Build parameters recorded in the manifest.
+    Returns:
+        str: The index version.
+    """
+    writer = SharedIndexWriter(out_dir, dtype, params)
+    writer.add(list(ids), list(role_numbers), list(chunk_indices), chunk_texts, embeddings)
+    return writer.finish(bm25_index, index_version)
+
+
+def export_from_collection(collection, bm25_index, ids, index_version=None, out_dir=SHARED_INDEX_DIR,
+                           dtype="float32", params=None):
+    """
+    Export the index bundle for a built Chroma collection and BM25 index.
+    Args:
+        collection (chromadb.Collection): The Chroma collection holding the chunks.
+        bm25_index (SparseBM25 | BM25Okapi): The BM25 index.
+        ids (list): Chunk ids, in `bm25_ids` order.
+        index_version (str): The index version, or None to derive it from the file checksums.
+        out_dir (str): The destination directory.
+        dtype (str): "float32" or "float16" for the embedding matrix.
+        params (dict): Build parameters recorded in the manifest.
+    Returns:
+        str: The index version.
+    """
+    if not isinstance(bm25_index, SparseBM25):
+        bm25_index = SparseBM25.from_okapi(bm25_index)
+
+    # Chroma does not guarantee the order of returned rows
+    data = collection.get(ids=list(ids), include=["metadatas", "documents"])
+    rows = dict(zip(data["ids"], zip(data["metadatas"], data["documents"])))
+    metas = [rows[doc_id][0] for doc_id in ids]
+
+    return export_shared_index(
+        bm25_index,
+        ids,
+        [meta["role_number"] for meta in metas],
+        [meta["chunk_index"] for meta in metas],
+        [rows[doc_id][1] for doc_id in ids],
+        load_chunk_embeddings(collection, ids),
+        index_version,
+        out_dir=out_dir,
+        dtype=dtype,
+        params=params
+    )
+
+
+def read_manifest(index_dir=SHARED_INDEX_DIR, expected_params=None):
+    """
+    Read and check the manifest of an index bundle. Only file sizes are
+    checked here; `verify_bundle` compares the checksums.
+    Args:
+        index_dir (str): The bundle directory.
+        expected_params (dict): Build parameters the bundle must have been built with, e.g. the model.
+    Returns:
+        dict: The manifest.
+    Raises:
+        FileNotFoundError: If the bundle is missing or incomplete.
+        ValueError: If the bundle has another format version or build parameters.
+    """
+    index_dir = resolve_bundle(index_dir)
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(f"Index bundle not found in {index_dir}. Build the indexes, or migrate "
+                                f"{LEGACY_BM25_PATH} and Chroma with `python -m app.shared_index`.")
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Index bundle {index_dir} has format version {manifest.get('format_version')}, "
+                         f"expected {FORMAT_VERSION}. Rebuild it.")
+    for key, value in (expected_params or {}).items():
+        if manifest["params"].get(key, value) != value:
+            raise ValueError(f"Index bundle {index_dir} was built with {key}={manifest['params'][key]!r}, "
+                             f"expected {value!r}")
+    for name, entry in manifest["files"].items():
+        path = os.path.join(index_dir, name)
+        if not os.path.exists(path) or os.path.getsize(path) != entry["bytes"]:
+            raise FileNotFoundError(f"Index bundle {index_dir} is incomplete: {name} is missing or truncated")
+    return manifest
+
+
+def verify_bundle(index_dir=SHARED_INDEX_DIR):
+    """
+    Compare every file of an index bundle with the checksum in its manifest.
+    Args:
+        index_dir (str): The bundle directory.
+    Returns:
+        list: Names of the files whose checksum does not match.
+    """
+    index_dir = resolve_bundle(index_dir)
+    manifest = read_manifest(index_dir)
+    return [name for name, entry in manifest["files"].items()
+            if file_checksum(os.path.join(index_dir, name)) != entry["sha256"]]
+
+
+def load_bm25_index(index_dir=SHARED_INDEX_DIR, legacy_path=LEGACY_BM25_PATH, expected_params=None):
+    """
+    Load the BM25 index and chunk ids of the current build: memory-mapped
+    from the index bundle, or unpickled from a legacy bm25_index.pkl when
+    no bundle has ever been built or migrated (never while one is being
+    replaced).
+    Args:
+        index_dir (str): The bundle directory.
+        legacy_path (str): The pickled BM25 index used as a fallback.
+        expected_params (dict): Build parameters the bundle must have been built with.
+    Returns:
+        tuple: The SparseBM25 index, the chunk ids and the index version.
+    """
+    if bundle_published(index_dir) or not os.path.exists(legacy_path):
+        index_dir = resolve_bundle(index_dir)
+        manifest = read_manifest(index_dir, expected_params)
+        with open(os.path.join(index_dir, HEADER_FILE), "r", encoding="utf-8") as f:
+            ids = json.load(f)["ids"]
+        return SparseBM25.load(index_dir), ids, manifest["index_version"]
+
+    import pickle
+    from .utils import file_version
+
+    with open(legacy_path, "rb") as f:
+        bm25_okapi, bm25_ids = pickle.load(f)
+    return SparseBM25.from_okapi(bm25_okapi), bm25_ids, file_version(legacy_path)
+
+
+def load_bundle_embeddings(index_dir=SHARED_INDEX_DIR):
+    """
+    Memory-map the normalized embedding matrix of a bundle, aligned with
+    the bundle's chunk ids.
+    Args:
+        index_dir (str): The bundle directory, as resolved by `resolve_bundle`.
+    Returns:
+        np.ndarray: The read-only memory-mapped matrix.
+    """
+    return np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode="r")
+
+
+def load_shared_index(conn, index_dir=SHARED_INDEX_DIR, expected_params=None):
+    """
+    Memory-map an index bundle.
+    Args:
+        conn (sqlite3.Connection): Connection to the roles database (for role titles).
+        index_dir (str): The bundle directory.
+        expected_params (dict): Build parameters the bundle must have been built with.
+    Returns:
+        dict: The BM25 index, chunk metadata, embedding matrix, role index and index version.
+    """
+    index_dir = resolve_bundle(index_dir)
+    manifest = read_manifest(index_dir, expected_params)
+    with open(os.path.join(index_dir, HEADER_FILE), "r", encoding="utf-8") as f:
+        header = json.load(f)
+
+    titles = dict(conn.execute("SELECT role_number, title FROM roles").fetchall())
+    chunk_meta = ChunkMetadata(
+        header["ids"],
+        header["role_numbers"],
+        np.load(os.path.join(index_dir, "chunk_indices.npy"), mmap_mode="r"),
+        load_strings(index_dir, "chunk_texts"),
+        titles
+    )
+
+    return {
+        "bm25_index": SparseBM25.load(index_dir),
+        "chunk_meta": chunk_meta,
+        "embeddings": load_bundle_embeddings(index_dir),
+        "role_index": RoleIndex.load(index_dir),
+        "index_version": manifest["index_version"]
+    }
+
+
+def migrate_legacy_index(collection, bm25_path=LEGACY_BM25_PATH, out_dir=SHARED_INDEX_DIR, dtype="float32",
+                         params=None):
+    """
+    Convert a pickled BM25Okapi index and its Chroma collection into an
+    index bundle, then check that the bundle scores every vocabulary term
+    exactly like the pickle.
+    Args:
+        collection (chromadb.Collection): The Chroma collection holding the chunks.
+        bm25_path (str): The pickled (BM25Okapi, ids) tuple.
+        out_dir (str): The destination directory.
+        dtype (str): "float32" or "float16" for the embedding matrix.
+        params (dict): Build parameters of the legacy index, recorded in the manifest.
+    Returns:
+        dict: The index version, chunk count and number of mismatching terms.
+    """
+    import pickle
+
+    with open(bm25_path, "rb") as f:
+        bm25_okapi, bm25_ids = pickle.load(f)
+    params = {**(params or {}), "migrated_from": os.path.basename(bm25_path)}
+    index_version = export_from_collection(collection, bm25_okapi, bm25_ids, out_dir=out_dir, dtype=dtype,
+                                           params=params)
+
+    bm25_index, ids, _ = load_bm25_index(out_dir)
+    mismatches = sum(
+        not np.array_equal(bm25_okapi.get_scores([term]), bm25_index.get_scores([term]))
+        for term in bm25_okapi.idf
+    )
+    if ids != list(bm25_ids):
+        raise ValueError("Migrated chunk ids differ from the pickled index")
+    return {"index_version": index_version, "chunks": len(ids), "mismatched_terms": mismatches}
+
+
+def memory_usage():
+    """
+    Memory of the current process from /proc (Linux): RSS counts shared
+    pages in full, PSS splits them between the processes mapping them,
+    and USS counts only pages private to this process.
+    Returns:
+        dict: rss_mb, pss_mb and uss_mb.
+    """
+    usage = {}
+    with open("/proc/self/smaps_rollup", "r") as f:
+        for line in f:
+            fields = line.split()
+            if fields[0] in ("Rss:", "Pss:", "Private_Clean:", "Private_Dirty:"):
+                usage[fields[0][:-1]] = int(fields[1]) / 1024
+    return {
+        "rss_mb": round(usage["Rss"], 1),
+        "pss_mb": round(usage["Pss"], 1),
+        "uss_mb": round(usage["Private_Clean"] + usage["Private_Dirty"], 1)
+    }
+
+
+def _measure_worker(mode, ready, release, results):
+    """
+    Load the indexes the way one API worker would, touch their pages the way
+    queries do and report memory once every worker has loaded.
+    """
+    try:
+        from . import app as api
+
+        conn = api.db.get()
+        if mode == "shared":
+            indexes = load_shared_index(conn, api.SHARED_INDEX_DIR)
+        else:
+            indexes = api.load_indexes(conn)
+
+        bm25_index = indexes["bm25_index"]
+        for term in list(bm25_index.vocab)[:2000]:
+            bm25_index.get_scores([term])
+        np.asarray(indexes["embeddings"]).sum()
+        for idx in range(len(indexes["chunk_meta"])):
+            indexes["chunk_meta"].chunk_texts[idx]
+        usage = memory_usage()
+    except Exception as e:
+        usage = {"error": repr(e)}
+
+    ready.wait()
+    results.put(usage)
+    release.wait()
+
+
+def measure_workers(mode, n_workers):
+    """
+    Start `n_workers` fresh processes that each load the indexes in `mode`
+    ("shared" or "chroma") and collect their memory usage while all of them
+    are alive, so shared pages are counted once in PSS.
+    Args:
+        mode (str): "shared" or "chroma".
+        n_workers (int): Number of worker processes.
+    Returns:
+        list: One memory_usage() dict per worker.
+    """
+    import multiprocessing
+
+    ctx = multiprocessing.get_context("spawn")
+    ready, release = ctx.Barrier(n_workers + 1), ctx.Barrier(n_workers + 1)
+    results = ctx.Queue()
+    workers = [ctx.Process(target=_measure_worker, args=(mode, ready, release, results)) for _ in range(n_workers)]
+    for worker in workers:
+        worker.start()
+    ready.wait()
+    usage = [results.get() for _ in workers]
+    release.wait()
+    for worker in workers:
+        worker.join()
+
+    errors = [u["error"] for u in usage if "error" in u]
+    if errors:
+        raise RuntimeError(f"{len(errors)} worker(s) failed: {errors[0]}")
+    return usage
+
+
+if __name__ == "__main__":
+    import argparse
+    from .encoders import MODEL_NAME
+
+    parser = argparse.ArgumentParser(
+        description="Migrate a pickled BM25 index and Chroma store to an index bundle, verify a bundle's "
+                    "checksums, or measure worker memory"
+    )
+    parser.add_argument("--bm25", default=LEGACY_BM25_PATH)
+    parser.add_argument("--chroma", default="db/chroma_db")
+    parser.add_argument("--collection", default="nco_roles")
+    parser.add_argument("--output", default=SHARED_INDEX_DIR)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--max-tokens", type=int, default=250, help="Chunk size the legacy index was built with")
+    parser.add_argument("--overlap", type=int, default=50, help="Chunk overlap the legacy index was built with")
+    parser.add_argument("--verify", action="store_true", help="Check the checksums of the bundle in --output")
+    parser.add_argument("--measure", type=int, metavar="N_WORKERS",
+                        help="Compare per-worker memory of chroma vs shared index loading with N worker processes")
+    args = parser.parse_args()
+
+    if args.measure:
+        # Indexes only: every worker loads the same query encoder in both modes
+        for mode in ("chroma", "shared"):
+            usage = measure_workers(mode, args.measure)
+            mean = {key: round(sum(u[key] for u in usage) / len(usage), 1) for key in usage[0]}
+            print(f"{mode:<7} {args.measure} workers, per worker: {mean}, "
+                  f"total PSS {sum(u['pss_mb'] for u in usage):.1f} MB")
+    elif args.verify:
+        corrupt = verify_bundle(args.output)
+        print(f"Checksum mismatch in {args.output}: {corrupt}" if corrupt else f"{args.output} is intact")
+        raise SystemExit(1 if corrupt else 0)
+    else:
+        import chromadb
+
+        collection = chromadb.PersistentClient(path=args.chroma).get_collection(name=args.collection)
+        params = {"collection": args.collection, "model": MODEL_NAME, "max_tokens": args.max_tokens,
+                  "overlap": args.overlap}
+        summary = migrate_legacy_index(collection, args.bm25, args.output, args.dtype, params)
+        print(f"Migrated {summary['chunks']} chunks to {args.output} (version {summary['index_version']}), "
+              f"{summary['mismatched_terms']} BM25 terms score differently")
@@ -0,0 +1,167 @@
+import re
+import numpy as np
+
+# Title words are runs of letters and digits; "Manager (Sales)" -> manager, sales
+WORD_PATTERN = re.compile(r"[^\W_]+")
+
+# Queries made of digits and dots complete role numbers instead of titles
+CODE_QUERY_PATTERN = re.compile(r"^\d[\d.]*$")
+
+# Sorts after every character, closing a prefix range in a sorted string array
+PREFIX_END = "\U0010ffff"
+
+
+def normalize_title(title):
+    """
+    Lowercase a title and collapse its whitespace (titles may contain newlines).
+    """
+    return " ".join(title.lower().split())
+
+
+def prefix_range(sorted_strings, prefix):
+    """
+    Positions [lo, hi) of the strings starting with `prefix` in a sorted array.
+    """
+    return (int(np.searchsorted(sorted_strings, prefix, side="left")),
+            int(np.searchsorted(sorted_strings, prefix + PREFIX_END, side="left")))
+
+
+class SuggestIndex:
+    """
+    Typeahead over role titles and role numbers, built once from roles.db.
+
+    Everything is held in sorted NumPy arrays: role numbers, whole
+    normalized titles, and every word of every title with its role and
+    position. A query is answered with binary searches for prefix ranges
+    and a few vectorized operations over the matched roles; it never
+    touches the model, Chroma or SQLite.
+    """
+
+    def __init__(self, roles):
+        """
+        Args:
+            roles (list): (role_number, title) pairs, e.g. from the roles table.
+        """
+        roles = sorted((str(role_number), title or "") for role_number, title in roles)
+        self.role_numbers = np.asarray([role_number for role_number, _ in roles], dtype=str)
+        self.titles = [title for _, title in roles]
+        normalized = [normalize_title(title) for title in self.titles]
+        self.title_lengths = np.asarray([len(title) for title in normalized], dtype=np.int64)
+
+        # Whole titles, for "the title starts with the query"
+        order = np.argsort(np.asarray(normalized, dtype=str), kind="stable")
+        self.sorted_titles = np.asarray(normalized, dtype=str)[order]
+        self.title_rows = order.astype(np.int64)
+
+        # Every title word, for "every query word starts a title word"
+        entries = sorted(
+            (word, row, position)
+            for row, title in enumerate(normalized)
+            for position, word in enumerate(WORD_PATTERN.findall(title))
+        )
+        self.words = np.asarray([word for word, _, _ in entries], dtype=str)
+        self.word_rows = np.asarray([row for _, row, _ in entries], dtype=np.int64)
+        self.word_positions = np.asarray([position for _, _, position in entries], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.role_numbers)
+
+    def _result(self, row, match):
+        return {"role_number": str(self.role_numbers[row]), "title": self.titles[row], "match": match}
+
+    def suggest(self, query, limit=10):
+        """
+        Ranked completions for a partially typed query.
+
+        Digit queries complete role numbers, in code order. Otherwise every
+        query word must be the prefix of a word of the title; titles that
+        start with the whole query come first, then titles where the first
+        query word matches earlier, then shorter titles.
+        Args:
+            query (str): The text typed so far.
+            limit (int): The maximum number of suggestions.
+        Returns:
+            list: Suggestions with role_number, title and match ("code" or "title").
+        """
+        text = normalize_title(query)
+        if not text or limit <= 0:
+            return []
+
+        if CODE_QUERY_PATTERN.match(text):
+            lo, hi = prefix_range(self.role_numbers, text)
+            return [self._result(row, "code") for row in range(lo, min(hi, lo + limit))]
+
+        words = WORD_PATTERN.findall(text)
+        if not words:
+            return []
+
+        # Roles whose title words cover every query word, and where the first one matches
+        matched = None
+        first_position = None
+        for word in words:
+            lo, hi = prefix_range(self.words, word)
+            rows = self.word_rows[lo:hi]
+            if first_position is None:
+                first_position = np.full(len(self), np.iinfo(np.int64).max)
+                np.minimum.at(first_position, rows, self.word_positions[lo:hi])
+            mask = np.zeros(len(self), dtype=bool)
+            mask[rows] = True
+            matched = mask if matched is None else matched & mask
+
+        # Titles starting with the whole query rank first
+        tier = np.ones(len(self), dtype=np.int64)
+        lo, hi = prefix_range(self.sorted_titles, text)
+        tier[self.title_rows[lo:hi]] = 0
+        matched[self.title_rows[lo:hi]] = True
+
+        candidates = np.flatnonzero(matched)
+        order = np.lexsort((candidates, self.title_lengths[candidates], first_position[candidates],
+                            tier[candidates]))
+        return [self._result(row, "title") for row in candidates[order[:limit]]]
+
+
+def load_suggest_index(conn):
+    """
+    Build the typeahead index from the roles table.
+    Args:
+        conn (sqlite3.Connection): Connection to the roles database.
+    Returns:
+        SuggestIndex: The index.
+    """
+    return SuggestIndex(conn.execute("SELECT role_number, title FROM roles").fetchall())
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import time
+    from .roles_db import open_read_only
+
+    parser = argparse.ArgumentParser(description="Build the typeahead index and time completions")
+    parser.add_argument("--db", default="db/roles.db")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = load_suggest_index(open_read_only(args.db))
+    print(f"Built the index over {len(index)} roles in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    # Keystroke prefixes of random titles and role numbers
+    rng = random.Random(0)
+    queries = []
+    for _ in range(args.queries):
+        row = rng.randrange(len(index))
+        source = rng.choice([normalize_title(index.titles[row]), str(index.role_numbers[row])])
+        queries.append(source[:rng.randint(1, max(1, len(source)))])
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.suggest(query, args.limit)
+        latencies.append(time.perf_counter() - start)
+    latencies = np.asarray(latencies) * 1e6
+    print(f"{len(queries)} queries: p50 {np.percentile(latencies, 50):.0f} us, "
+          f"p99 {np.percentile(latencies, 99):.0f} us, max {latencies.max():.0f} us")
+    for query in ["soft", "mana sal", "111", "electric"]:
+        print(query, [(s["role_number"], s["title"]) for s in index.suggest(query, 3)])
@@ -0,0 +1,310 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+import numpy as np
+from nltk.tokenize import word_tokenize
+from .benchmark import build_query_set, indexed_role_numbers
+from .utils import minmax_norm, reciprocal_rank, zscore_norm
+from .vectors import normalize_rows
+
+NORMALIZATIONS = ["zscore", "minmax", "rrf"]
+RRF_KS = [10, 30, 60, 100]
+
+# How a role's chunk scores become one role score: "max" is what /search does
+AGGREGATIONS = ["max", "mean", "sum"]
+
+
+def score_matrices(searcher, queries, batch_size=64):
+    """
+    Raw BM25 and vector scores of every query against every chunk. Vector
+    scores are exact cosine similarities, as in `batch_search`.
+    Args:
+        searcher (HybridSearcher): The search engine (needs the chunk embedding matrix).
+        queries (list): The query texts.
+        batch_size (int): Queries encoded together.
+    Returns:
+        tuple: BM25 and vector score matrices, (queries x chunks).
+    """
+    if searcher.embeddings is None:
+        raise RuntimeError("Score matrices need the chunk embedding matrix.")
+    bm25 = np.stack([searcher.bm25_index.get_scores(word_tokenize(query.lower())) for query in queries])
+    vector = np.concatenate([
+        normalize_rows(searcher.encode_batch(queries[start:start + batch_size], batch_size)) @ searcher.embeddings.T
+        for start in range(0, len(queries), batch_size)
+    ])
+    return bm25, vector
+
+
+def cached_score_matrices(searcher, queries, cache_path=None, batch_size=64):
+    """
+    `score_matrices`, stored in a .npz file and reused while the index
+    version and the query set are unchanged.
+    Args:
+        searcher (HybridSearcher): The search engine.
+        queries (list): The query texts.
+        cache_path (str): The .npz cache file, or None to always compute.
+        batch_size (int): Queries encoded together.
+    Returns:
+        tuple: BM25 and vector score matrices, and whether they came from the cache.
+    """
+    key = hashlib.sha256(json.dumps([searcher.index_version, queries]).encode("utf-8")).hexdigest()
+    if cache_path and os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            if str(cached["key"]) == key:
+                return cached["bm25"], cached["vector"], True
+
+    bm25, vector = score_matrices(searcher, queries, batch_size)
+    if cache_path:
+        np.savez(cache_path, key=key, bm25=bm25, vector=vector)
+    return bm25, vector, False
+
+
+class RelevanceJudgments:
+    """
+    The relevant roles of a query set: one judgment per (query, relevant role) pair.
+    """
+
+    def __init__(self, chunk_meta, expected):
+        """
+        Args:
+            chunk_meta (ChunkMetadata): The chunk metadata table (defines the role columns).
+            expected (list): Relevant role numbers per query.
+        """
+        columns = {str(role_number): i for i, role_number in enumerate(chunk_meta.roles)}
+        pairs = [(row, columns[role_number]) for row, role_numbers in enumerate(expected)
+                 for role_number in role_numbers if role_number in columns]
+        self.rows = np.array([row for row, _ in pairs], dtype=np.int64)
+        self.columns = np.array([column for _, column in pairs], dtype=np.int64)
+        self.n_queries = len(expected)
+        self.n_relevant = np.maximum(np.bincount(self.rows, minlength=self.n_queries), 1)
+
+    def metrics(self, ranks, top_k):
+        """
+        Recall@k, hit@1 and MRR@k from the rank of every judgment, as
+        `benchmark.relevance` computes them on /search results.
+        Args:
+            ranks (np.ndarray): 1-based rank of each judgment's role in its query's ranking.
+            top_k (int): The cutoff.
+        Returns:
+            dict: Mean recall@k, hit@1 and MRR@k.
+        """
+        first = np.full(self.n_queries, np.iinfo(np.int64).max)
+        np.minimum.at(first, self.rows, ranks)
+        found = np.bincount(self.rows, weights=ranks <= top_k, minlength=self.n_queries)
+        return {
+            f"recall@{top_k}": float((found / self.n_relevant).mean()),
+            "hit@1": float((first == 1).mean()),
+            f"mrr@{top_k}": float(np.where(first <= top_k, 1.0 / first, 0.0).mean())
+        }
+
+
+def chunk_layers(chunk_meta):
+    """
+    The chunks of every role, layer by layer: layer d holds the d-th chunk
+    of each role with more than d chunks. Layer 0 covers every role, and
+    most roles have a single chunk.
+    Returns:
+        list: (role indices, chunk indices) per layer.
+    """
+    starts = chunk_meta.role_starts
+    counts = np.diff(np.append(starts, len(chunk_meta.role_order)))
+    layers = []
+    for depth in range(int(counts.max()) if len(counts) else 0):
+        roles = np.flatnonzero(counts > depth)
+        layers.append((roles, chunk_meta.role_order[starts[roles] + depth]))
+    return layers
+
+
+class WeightSweep:
+    """
+    Ranks of the relevant roles under every fusion weight, for one
+    normalization and role aggregation.
+
+    A role's score is w * bm25 + (1 - w) * vector, maximized over its parts
+    (its chunks for "max", a single aggregated part otherwise). Against a
+    relevant role, most roles are beaten or beat it on both normalized
+    scores, and then do so at every weight: they are counted once here.
+    Only the remaining (judgment, role) pairs are rescored per weight, with
+    the same float operations as the full score matrices, so ranks are
+    exact, ties included (tied roles rank in role number order, like
+    `ChunkMetadata.best_per_role`).
+    """
+
+    def __init__(self, parts, judgments, n_roles, top_k):
+        """
+        Args:
+            parts (list): (role indices, BM25 scores, vector scores) per part; part 0 covers every
+                role, and the score matrices are (queries x part roles).
+            judgments (RelevanceJudgments): The relevant roles.
+            n_roles (int): The number of roles.
+            top_k (int): Ranks beyond top_k need not be exact.
+        """
+        rows, relevant = judgments.rows, judgments.columns
+        lower_bm25, lower_vector = parts[0][1], parts[0][2]
+        upper_bm25, upper_vector = lower_bm25.copy(), lower_vector.copy()
+        for roles, bm25, vector in parts[1:]:
+            upper_bm25[:, roles] = np.maximum(upper_bm25[:, roles], bm25)
+            upper_vector[:, roles] = np.maximum(upper_vector[:, roles], vector)
+
+        # Roles that beat, or lose to, the relevant role at every weight
+        above = ((lower_bm25[rows] > upper_bm25[rows, relevant][:, None])
+                 & (lower_vector[rows] > upper_vector[rows, relevant][:, None]))
+        below = ((upper_bm25[rows] < lower_bm25[rows, relevant][:, None])
+                 & (upper_vector[rows] < lower_vector[rows, relevant][:, None]))
+        self.always_above = np.count_nonzero(above, axis=1)
+
+        undecided = ~(above | below)
+        undecided[np.arange(len(rows)), relevant] = False
+        undecided[self.always_above >= top_k] = False
+        self.pair_judgments, pair_roles = np.nonzero(undecided)
+        self.pair_earlier = pair_roles < relevant[self.pair_judgments]
+
+        # Each part's scores for the undecided pairs and for the relevant roles
+        self.pair_parts, self.relevant_parts = [], []
+        for roles, bm25, vector in parts:
+            position = np.full(n_roles, -1)
+            position[roles] = np.arange(len(roles))
+            for targets, role_columns, query_rows in ((self.pair_parts, pair_roles, rows[self.pair_judgments]),
+                                                      (self.relevant_parts, relevant, rows)):
+                positions = position[role_columns]
+                selected = np.flatnonzero(positions >= 0)
+                targets.append((selected, bm25[query_rows[selected], positions[selected]],
+                                vector[query_rows[selected], positions[selected]]))
+        self.n_judgments = len(rows)
+
+    @staticmethod
+    def _scores(parts, n, weight):
+        scores = np.full(n, -np.inf)
+        for selected, bm25, vector in parts:
+            scores[selected] = np.maximum(scores[selected], weight * bm25 + (1 - weight) * vector)
+        return scores
+
+    def ranks(self, weight):
+        """
+        1-based rank of every judgment's role with BM25 weight `weight`.
+        """
+        pair_scores = self._scores(self.pair_parts, len(self.pair_judgments), weight)
+        target = self._scores(self.relevant_parts, self.n_judgments, weight)[self.pair_judgments]
+        beats = (pair_scores > target) | ((pair_scores == target) & self.pair_earlier)
+        return self.always_above + np.bincount(self.pair_judgments, weights=beats, minlength=self.n_judgments) + 1
+
+
+def sweep(bm25, vector, chunk_meta, expected, weights, normalizations=NORMALIZATIONS, rrf_ks=RRF_KS,
+          aggregations=AGGREGATIONS, top_k=10):
+    """
+    Evaluate every combination of BM25 weight, normalization and role
+    aggregation on precomputed score matrices. The vector weight is
+    1 - the BM25 weight (rankings only depend on the ratio). Normalized
+    matrices are computed once per normalization, role aggregates once per
+    aggregation, and each weight only rescores what `WeightSweep` could not
+    settle for every weight at once.
+    Args:
+        bm25 (np.ndarray): Raw BM25 scores (queries x chunks).
+        vector (np.ndarray): Raw vector scores (queries x chunks).
+        chunk_meta (ChunkMetadata): The chunk metadata table.
+        expected (list): Relevant role numbers per query.
+        weights (list): BM25 weights to try, in [0, 1].
+        normalizations (list): Entries of NORMALIZATIONS.
+        rrf_ks (list): RRF smoothing constants tried with "rrf".
+        aggregations (list): Entries of AGGREGATIONS.
+        top_k (int): The metric cutoff.
+    Returns:
+        list: One dict per configuration with its parameters and metrics.
+    """
+    judgments = RelevanceJudgments(chunk_meta, expected)
+    layers = chunk_layers(chunk_meta)
+    n_roles = len(chunk_meta.roles)
+    counts = np.diff(np.append(chunk_meta.role_starts, len(chunk_meta.role_order)))
+
+    variants = []
+    for normalization in normalizations:
+        if normalization == "rrf":
+            variants.extend((f"rrf@{k}", lambda scores, k=k: reciprocal_rank(scores, k)) for k in rrf_ks)
+        else:
+            variants.append((normalization, zscore_norm if normalization == "zscore" else minmax_norm))
+
+    rows = []
+    for name, normalize in variants:
+        # Normalize over all chunks (as /search does), then split the columns into layers
+        normalized_bm25, normalized_vector = normalize(bm25), normalize(vector)
+        layered = [(roles, normalized_bm25[:, chunks], normalized_vector[:, chunks]) for roles, chunks in layers]
+
+        for how in aggregations:
+            if how == "max":
+                parts = layered
+            else:
+                bm25_roles, vector_roles = np.zeros((len(bm25), n_roles)), np.zeros((len(bm25), n_roles))
+                for roles, bm25_layer, vector_layer in layered:
+                    bm25_roles[:, roles] += bm25_layer
+                    vector_roles[:, roles] += vector_layer
+                if how == "mean":
+                    bm25_roles, vector_roles = bm25_roles / counts, vector_roles / counts
+                parts = [(np.arange(n_roles), bm25_roles, vector_roles)]
+
+            ranker = WeightSweep(parts, judgments, n_roles, top_k)
+            for weight in weights:
+                rows.append({
+                    "normalization": name,
+                    "aggregation": how,
+                    "bm25_weight": round(float(weight), 4),
+                    "vector_weight": round(float(1 - weight), 4),
+                    **judgments.metrics(ranker.ranks(weight), top_k)
+                })
+    return rows
+
+
+if __name__ == "__main__":
+    from .app import load_resources
+
+    parser = argparse.ArgumentParser(description="Sweep fusion weights, normalizations and role aggregations "
+                                                 "over cached score matrices of role-title queries")
+    parser.add_argument("--max-queries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--weight-step", type=float, default=0.02, help="Step of the BM25 weight grid over [0, 1]")
+    parser.add_argument("--normalizations", nargs="+", choices=NORMALIZATIONS, default=NORMALIZATIONS)
+    parser.add_argument("--rrf-k", type=int, nargs="+", default=RRF_KS)
+    parser.add_argument("--aggregations", nargs="+", choices=AGGREGATIONS, default=AGGREGATIONS)
+    parser.add_argument("--cache", default="db/tune_scores.npz", help="Score matrix cache ('' to disable)")
+    parser.add_argument("--sort-by", choices=["recall", "hit@1", "mrr"], default="mrr")
+    parser.add_argument("--show", type=int, default=20, help="Number of best configurations to print")
+    parser.add_argument("--output", help="Write every configuration and its metrics to this JSON file")
+    args = parser.parse_args()
+
+    searcher = load_resources()
+    searcher.embedding_cache = None
+    queries = build_query_set(indexed_roles=indexed_role_numbers(), max_queries=args.max_queries, seed=args.seed)
+    texts = [title for title, _ in queries]
+
+    start = time.perf_counter()
+    bm25, vector, cached = cached_score_matrices(searcher, texts, args.cache or None)
+    print(f"Score matrices {bm25.shape} {'loaded from ' + args.cache if cached else 'computed'} "
+          f"in {time.perf_counter() - start:.2f} s")
+
+    weights = np.round(np.arange(0, 1 + args.weight_step / 2, args.weight_step), 6)
+    start = time.perf_counter()
+    rows = sweep(bm25, vector, searcher.chunk_meta, [expected for _, expected in queries], weights,
+                 args.normalizations, args.rrf_k, args.aggregations, args.top_k)
+    print(f"Evaluated {len(rows)} configurations on {len(queries)} queries in {time.perf_counter() - start:.2f} s")
+
+    metric = {"recall": f"recall@{args.top_k}", "hit@1": "hit@1", "mrr": f"mrr@{args.top_k}"}[args.sort_by]
+    columns = ["normalization", "aggregation", "bm25_weight", "vector_weight",
+               f"recall@{args.top_k}", "hit@1", f"mrr@{args.top_k}"]
+    print(" ".join(f"{column:>13}" for column in columns))
+    for row in sorted(rows, key=lambda row: -row[metric])[:args.show]:
+        print(" ".join(f"{row[column]:>13.4f}" if isinstance(row[column], float) else f"{row[column]:>13}"
+                       for column in columns))
+
+    # The /search defaults, for comparison
+    default = next((row for row in rows if row["normalization"] == "zscore" and row["aggregation"] == "max"
+                    and abs(row["bm25_weight"] - 0.4) < 1e-9), None)
+    if default is not None:
+        print("Current default (zscore, max, 0.4/0.6): " +
+              ", ".join(f"{column} {default[column]:.4f}" for column in columns[4:]))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"queries": len(queries), "seed": args.seed, "top_k": args.top_k, "results": rows}, f,
+                      indent=2)
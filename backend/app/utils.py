@@ -45,14 +45,255 @@ def load_json(path):
         print(f"Warning: {path} is corrupt or not UTF-8 JSON. Starting fresh.")
         return {}
 
-def extract_data(filename="data\\pdfs\\NCO_IDS_Sample.pdf", output_file="data/json/IDs_sample.json"):
+class JsonStreamReader:
     """
-    Extract data from a PDF file and save it as a JSON file.
+    Incremental reader over a JSON text file. Structure ({, [, keys) is
+    walked by the caller while only the values asked for are decoded, so
+    memory is bounded by the largest single value rather than the file.
+    """
+
+    def __init__(self, f, chunk_size=1 << 16):
+        """
+        Args:
+            f (file): A text file opened for reading.
+            chunk_size (int): Characters read per refill.
+        """
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        Skip whitespace and return the next character ("" at the end of the file).
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\n\r":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        """
+        Consume the next non-whitespace character, which must be `char`.
+        """
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} but found {found!r}")
+        self.pos += 1
+
+    def value(self):
+        """
+        Decode the next complete JSON value.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number cut at the end of the buffer (e.g. "-4." of "-4.5") may continue in the next chunk
+            if (isinstance(value, (int, float)) and not self.eof
+                    and (end == len(self.buf) or self.buf[end] in "0123456789.eE+-") and self._fill()):
+                continue
+            self.pos = end
+            return value
+
+    def items(self):
+        """
+        Iterate over the members of the next object, decoding only the keys;
+        the caller must consume each value (e.g. with `value` or `skip`).
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("}")
+            return
+
+    def elements(self):
+        """
+        Iterate over the elements of the next array; the caller must consume each one.
+        """
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("]")
+            return
+
+
+def iter_hierarchy_roles(reader, role_pattern=re.compile(r'^\d{4}\.\d{4}$')):
+    """
+    Stream role records out of the nested NCO hierarchy (Complete.json layout),
+    in document order, with the same fields as `format_json`.
+    Args:
+        reader (JsonStreamReader): Positioned at the value to walk.
+        role_pattern (re.Pattern): Keys that hold a role.
+    Returns:
+        generator: One role dict per role.
+    """
+    char = reader.peek()
+    if char == "{":
+        for key in reader.items():
+            if role_pattern.match(key):
+                value = reader.value()
+                # roles.json maps role numbers straight to descriptions
+                if isinstance(value, str):
+                    value = {"Role Description": value}
+                yield {
+                    "role_number": key,
+                    "Role Name": value.get("Role Name", ""),
+                    "2004 Regulation": value.get("2004 regulation", ""),
+                    "Role Description": value.get("Role Description", "")
+                }
+            else:
+                yield from iter_hierarchy_roles(reader, role_pattern)
+    elif char == "[":
+        for _ in reader.elements():
+            yield from iter_hierarchy_roles(reader, role_pattern)
+    else:
+        reader.value()
+
+
+def iter_hierarchy_names(path, role_pattern=re.compile(r'^\d{4}\.\d{4}$')):
+    """
+    Stream the name of every division, sub-division, group and family of the
+    NCO hierarchy (IDs.json or Complete.json layout). Roles are skipped.
+    Args:
+        path (str): The hierarchy JSON file.
+        role_pattern (re.Pattern): Keys that hold a role.
+    Returns:
+        generator: (code, name) pairs, e.g. ("1111", "Legislators").
+    """
+    def walk(reader, code):
+        for key in reader.items():
+            if key.endswith(" Name") and code is not None:
+                yield code, reader.value()
+            elif role_pattern.match(key) or reader.peek() != "{":
+                reader.value()
+            else:
+                yield from walk(reader, key)
+
+    with open(path, "r", encoding="utf-8") as f:
+        yield from walk(JsonStreamReader(f), None)
+
+
+def iter_roles(path):
+    """
+    Stream role records from the flat formatted list (formatted.json), the
+    nested hierarchy (Complete.json) or a role number to description mapping
+    (roles.json), without loading the whole file.
+    Args:
+        path (str): The path to the JSON file.
+    Returns:
+        generator: Dicts with role_number, Role Name, 2004 Regulation and Role Description.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        reader = JsonStreamReader(f)
+        if reader.peek() == "[":
+            for _ in reader.elements():
+                yield reader.value()
+        else:
+            yield from iter_hierarchy_roles(reader)
+
+
+def page_shards(n_pages, workers, shards_per_worker=4):
+    """
+    Split page indices 0..n_pages-1 into contiguous, ordered shards.
+    Args:
+        n_pages (int): The number of pages.
+        workers (int): The number of worker processes.
+        shards_per_worker (int): Shards per worker, for load balancing.
+    Returns:
+        list: One range of page indices per shard.
+    """
+    n_shards = max(1, min(n_pages, workers * shards_per_worker))
+    bounds = np.linspace(0, n_pages, n_shards + 1).astype(int)
+    return [range(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+def map_pages(extract_shard, pdf_path, n_pages, workers=1):
+    """
+    Run a per-page extraction function over every page, serially or on a
+    process pool over page shards. Results always come back in page order,
+    so whatever consumes them sees exactly the serial sequence.
+    Args:
+        extract_shard (callable): Picklable function (pdf_path, page range) -> list of per-page results.
+        pdf_path (str): The path to the PDF file.
+        n_pages (int): The number of pages.
+        workers (int): The number of worker processes (1 runs in this process).
+    Returns:
+        generator: The per-page results, in page order.
+    """
+    if workers <= 1:
+        for shard in page_shards(n_pages, 1, 1):
+            yield from extract_shard(pdf_path, shard)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    shards = page_shards(n_pages, workers)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for results in pool.map(extract_shard, [pdf_path] * len(shards), shards):
+            yield from results
+
+
+def extract_page_tables(filename, pages):
+    """
+    Extract the tables of a range of pages with pdfplumber.
     Args:
         filename (str): The path to the PDF file.
-        output_file (str): The path to the output JSON file.
+        pages (range): Zero-based page indices.
     Returns:
-        None
+        list: The tables of each page.
+    """
+    tables = []
+    with pdfplumber.open(filename) as pdf:
+        for page_index in pages:
+            page = pdf.pages[page_index]
+            tables.append(page.extract_tables())
+            page.close()
+    return tables
+
+
+def build_hierarchy(page_tables):
+    """
+    Build the NCO hierarchy from the tables of every page, in page order.
+    Rows are interpreted in sequence: a page that does not hold exactly one
+    table reuses the last row seen, and roles whose family has not been seen
+    yet are deferred to the end.
+    Args:
+        page_tables (iterable): The tables of each page, in page order.
+    Returns:
+        dict: The nested hierarchy.
     """
 
     # Initialize data dictionary
@@ -64,105 +305,131 @@ def extract_data(filename="data\\pdfs\\NCO_IDS_Sample.pdf", output_file="data/js
     # Define a list to hold rows for later processing
     later = []
 
-    # Extract tables from PDF
-    with pdfplumber.open(filename) as pdf:
-        print('PDF Pages:', len(pdf.pages))
+    # Extract tables from each page
+    for page_no, tables in enumerate(page_tables, start=1):
+        # Skip empty pages
+        if not tables:
+            continue
+        # Check for specific page and table conditions (page 333 is the last page with one table)
+        if len(tables)==1 and page_no!=333:
+
+              # Extract relevant rows
+              for row in tables[0]:
+                if not row or not row[1]:
+                    continue
+                # Extract code and label
+                code = row[1].strip()
+                label = row[0].lower().replace('\n', '')
+
+                # Exceptions which require special handling
+                """
+                This is due to a mistake in the Original Data.
+                Refer to NCO_2015 Page Number 150
+                """
+
+                if code=='7222':
+                    update_nested_dict(data, [code[0], code[:2], code[:3], code], {"Family Name": row[2]})
+                if code=='7222.0100':
+                    update_nested_dict(data, [code[0], code[:2], code[:3], code[:4], code],
+                                           {"Role Name": row[2], "2004 regulation": row[3]})
+
+
+                # Extract division, sub-division, group, and family names
+                if label == 'division':
+                    update_nested_dict(data, [code], {"Division Name": row[2]})
+                elif label == 'sub-division':
+                    update_nested_dict(data, [code[0], code], {"Sub-Division Name": row[2]})
+                elif label == 'group':
+                    update_nested_dict(data, [code[0], code[:-1], code], {"Group Name": row[2]})
+                elif label == 'family':
+                    update_nested_dict(data, [code[0], code[:2], code[:3], code], {"Family Name": row[2]})
+                elif role_pattern.search(code):
+                    if data.get(code[0]):
+                        if data[code[0]].get(code[:2]):
+                            if data[code[0]][code[:2]].get(code[:3]):
+                                if data[code[0]][code[:2]][code[:3]].get(code[:4]):
+                                    update_nested_dict(data, [code[0], code[:2], code[:3], code[:4], code],
+                                           {"Role Name": row[2], "2004 regulation": row[3]})
+                                else:
+                                    later.append(row)
+        else:
+            if data.get(code[0]):
+                if data[code[0]].get(code[:2]):
+                    if data[code[0]][code[:2]].get(code[:3]):
+                        if not data[code[0]][code[:2]][code[:3]].get(code[:4]):
+                            update_nested_dict(data,[code[0], code[:2], code[:3], code[:4], code],
+                                               {
+                                                 "Role Name": label, "2004 regulation":row[2]
+                                               })
+                    else:
+                        update_nested_dict(data, [code[0], code[:-1], code], {"Group Name":"None"})
+                else:
+                    update_nested_dict(data, [code[:1], code], {"Sub-Division Name":"None"})
 
-        # Extract tables from each page
-        for page_no, page in enumerate(pdf.pages, start=1):
-            tables = page.extract_tables()
-            # Skip empty pages
-            if not tables:
-                continue
-            # Check for specific page and table conditions (page 333 is the last page with one table)
-            if len(tables)==1 and page_no!=333:
-
-                  # Extract relevant rows
-                  for row in tables[0]:
-                    if not row or not row[1]:
-                        continue
-                    # Extract code and label
-                    code = row[1].strip()
-                    label = row[0].lower().replace('\n', '')
-
-                    # Exceptions which require special handling
-                    '''
-                    This is due to a mistake in the Original Data.
-                    Refer to NCO_2015 Page Number 150
-                    '''
-
-                    if code=='7222':
-                        update_nested_dict(data, [code[0], code[:2], code[:3], code], {"Family Name": row[2]})
-                    if code=='7222.0100':
-                        update_nested_dict(data, [code[0], code[:2], code[:3], code[:4], code],
-                                               {"Role Name": row[2], "2004 regulation": row[3]})
-
-
-                    # Extract division, sub-division, group, and family names
-                    if label == 'division':
-                        update_nested_dict(data, [code], {"Division Name": row[2]})
-                    elif label == 'sub-division':
-                        update_nested_dict(data, [code[0], code], {"Sub-Division Name": row[2]})
-                    elif label == 'group':
-                        update_nested_dict(data, [code[0], code[:-1], code], {"Group Name": row[2]})
-                    elif label == 'family':
-                        update_nested_dict(data, [code[0], code[:2], code[:3], code], {"Family Name": row[2]})
-                    elif role_pattern.search(code):
-                        if data.get(code[0]):
-                            if data[code[0]].get(code[:2]):
-                                if data[code[0]][code[:2]].get(code[:3]):
-                                    if data[code[0]][code[:2]][code[:3]].get(code[:4]):
-                                        update_nested_dict(data, [code[0], code[:2], code[:3], code[:4], code],
-                                               {"Role Name": row[2], "2004 regulation": row[3]})
-                                    else:
-                                        later.append(row)
             else:
-                if data.get(code[0]):
-                    if data[code[0]].get(code[:2]):
-                        if data[code[0]][code[:2]].get(code[:3]):
-                            if not data[code[0]][code[:2]][code[:3]].get(code[:4]):
-                                update_nested_dict(data,[code[0], code[:2], code[:3], code[:4], code],
-                                                   {
-                                                     "Role Name": label, "2004 regulation":row[2]      
-                                                   })
-                        else:
-                            update_nested_dict(data, [code[0], code[:-1], code], {"Group Name":"None"})
-                    else:
-                        update_nested_dict(data, [code[:1], code], {"Sub-Division Name":"None"})
+                update_nested_dict(data,[code[0]],{"Division Name":"None"})
+
+    # Process later rows
+    for row in later:
+        code = row[1].strip()
+        label = row[0].lower().replace('\n', '')
+        update_nested_dict(data, [code[0], code[:2], code[:3], code[:4], code],
+                                           {"Role Name": row[2], "2004 regulation": row[3]})
+    return data
 
-                else:
-                    update_nested_dict(data,[code[0]],{"Division Name":"None"})
 
-        # Process later rows
-        for row in later:
-            code = row[1].strip()
-            label = row[0].lower().replace('\n', '')
-            update_nested_dict(data, [code[0], code[:2], code[:3], code[:4], code],
-                                               {"Role Name": row[2], "2004 regulation": row[3]})
+def extract_data(filename="data\\pdfs\\NCO_IDS_Sample.pdf", output_file="data/json/IDs_sample.json", workers=1):
+    """
+    Extract data from a PDF file and save it as a JSON file.
+    With workers > 1, table extraction runs on a process pool over page
+    shards; the hierarchy is still built from the pages in order, so the
+    output is byte-identical to the serial run.
+    Args:
+        filename (str): The path to the PDF file.
+        output_file (str): The path to the output JSON file.
+        workers (int): The number of extraction processes.
+    Returns:
+        None
+    """
 
-        # Write the output JSON file
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
+    # Extract tables from PDF
+    with pdfplumber.open(filename) as pdf:
+        n_pages = len(pdf.pages)
+    print('PDF Pages:', n_pages)
 
-            print(f"Processed page {page_no}/{len(pdf.pages)}")
+    data = build_hierarchy(map_pages(extract_page_tables, filename, n_pages, workers))
 
-    print("Extraction complete!")
+    # Write the output JSON file
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
 
+    print(f"Processed page {n_pages}/{n_pages}")
+    print("Extraction complete!")
 
 
-def extract_role_descriptions(pdf_path,output_json,max_nos=100000):
+def extract_page_lines(pdf_path, pages):
     """
-    Extract role descriptions from a PDF file and save them as a JSON file.
+    Extract the text lines inside the page border of a range of pages with PyMuPDF.
     Args:
         pdf_path (str): The path to the PDF file.
-        output_json (str): The path to the output JSON file.
-        max_nos (int): The maximum number of roles to extract.
+        pages (range): Zero-based page indices.
     Returns:
-        None
+        list: The lines of each page.
     """
+    with fitz.open(pdf_path) as doc:
+        return [doc[page_index].get_text("text",clip=border_rect).split("\n") for page_index in pages]
 
-    # Open the PDF file
-    doc = fitz.open(pdf_path)
+
+def collect_role_descriptions(page_lines, max_nos=100000):
+    """
+    Assemble role descriptions from the text lines of every page, in page order.
+    A description runs from its role number to the next one and may span pages.
+    Args:
+        page_lines (iterable): The lines of each page, in page order.
+        max_nos (int): The maximum number of roles to extract.
+    Returns:
+        dict: Mapping of role number to description.
+    """
     role_pattern = re.compile(r"\b\d{4}\.\d{4}\b")   # Role numbers like 1111.0300
     roles_dict = {}
     current_role_number = None
@@ -172,10 +439,7 @@ def extract_role_descriptions(pdf_path,output_json,max_nos=100000):
     prev_role_no = None
 
 
-    for page in doc:
-
-        # Extract text from the page
-        lines = page.get_text("text",clip=border_rect).split("\n")
+    for lines in page_lines:
 
         for line in lines:
 
@@ -188,15 +452,15 @@ def extract_role_descriptions(pdf_path,output_json,max_nos=100000):
 
             # Detect a new role number
             match = role_pattern.search(line_stripped)
-            if (match!=prev_role_no) and match:    
+            if (match!=prev_role_no) and match:
                 flag = False
                 count+=1
-            
+
             # Skip unwanted headings or patterns
             if 'isco ' in line.lower():
                 flag = True
             if flag:
-                continue       
+                continue
 
             # Process role description
             if match:
@@ -216,13 +480,36 @@ def extract_role_descriptions(pdf_path,output_json,max_nos=100000):
      # Save the last role
     if current_role_number and current_description:
         roles_dict[current_role_number] = " ".join(current_description).strip()
+    return roles_dict
+
+
+def extract_role_descriptions(pdf_path,output_json,max_nos=100000,workers=1):
+    """
+    Extract role descriptions from a PDF file and save them as a JSON file.
+    With workers > 1, page text is extracted on a process pool over page
+    shards and assembled in page order, so the output is byte-identical to
+    the serial run.
+    Args:
+        pdf_path (str): The path to the PDF file.
+        output_json (str): The path to the output JSON file.
+        max_nos (int): The maximum number of roles to extract.
+        workers (int): The number of extraction processes.
+    Returns:
+        None
+    """
+
+    # Open the PDF file
+    with fitz.open(pdf_path) as doc:
+        n_pages = len(doc)
+
+    roles_dict = collect_role_descriptions(map_pages(extract_page_lines, pdf_path, n_pages, workers), max_nos)
 
     # Save to UTF-8 JSON
     with open(output_json, "w", encoding="utf-8") as fp:
         json.dump(roles_dict, fp, indent=4, ensure_ascii=False)
 
     print(f"Extracted {len(roles_dict)} roles.")
-    
+
 
 def merge_jsons(roles_json,hierarchy_json):
     """
@@ -283,6 +570,17 @@ def merge_jsons(roles_json,hierarchy_json):
     with open('full.json','w',encoding='utf-8') as full:
         json.dump(hierarchy,full, indent=4,ensure_ascii=False )
 
+def file_version(path: str) -> str:
+    """
+    Identify a file's current version by its modification time and size.
+    Args:
+        path (str): The path to the file.
+    Returns:
+        str: The file version.
+    """
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
 def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
     """
     Compute the cosine similarity between two vectors.
@@ -297,44 +595,68 @@ def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
 def zscore_norm(scores: np.ndarray) -> np.ndarray:
     """
     Apply Z-score normalization to a numpy array.
+    2-D arrays are normalized row by row.
     Args:
         scores (np.ndarray): The input array to normalize.
     Returns:
         np.ndarray: The Z-score normalized array.
     """
+    if scores.ndim == 2:
+        std = np.std(scores, axis=1, keepdims=True)
+        mean = np.mean(scores, axis=1, keepdims=True)
+        return np.where(std == 0, 0.0, (scores - mean) / np.where(std == 0, 1, std))
     if np.std(scores) == 0:
         return np.zeros_like(scores)
     return (scores - np.mean(scores)) / np.std(scores)
 
-def format_json(input_file, output_file):
-    import json
-    import re
-
-    with open(input_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    pattern = re.compile(r'^\d{4}\.\d{4}$')
-    results = []
-
-    def extract_roles(obj):
-        if isinstance(obj, dict):
-            for key, value in obj.items():
-                if pattern.match(key):
-                    results.append({
-                        "role_number": key,
-                        "Role Name": value.get("Role Name", ""),
-                        "2004 Regulation": value.get("2004 regulation", ""),
-                        "Role Description": value.get("Role Description", "")
-                    })
-                extract_roles(value)
-        elif isinstance(obj, list):
-            for item in obj:
-                extract_roles(item)
-
-    extract_roles(data)
+def minmax_norm(scores: np.ndarray) -> np.ndarray:
+    """
+    Scale scores to [0, 1] by their minimum and maximum.
+    2-D arrays are normalized row by row; constant rows become 0.
+    Args:
+        scores (np.ndarray): The input array to normalize.
+    Returns:
+        np.ndarray: The min-max normalized array.
+    """
+    low = np.min(scores, axis=-1, keepdims=True)
+    span = np.max(scores, axis=-1, keepdims=True) - low
+    return np.where(span == 0, 0.0, (scores - low) / np.where(span == 0, 1, span))
+
+def reciprocal_rank(scores: np.ndarray, k: int = 60) -> np.ndarray:
+    """
+    Compute reciprocal rank fusion terms 1 / (k + rank), rank 1 being the highest score.
+    2-D arrays are ranked row by row.
+    Args:
+        scores (np.ndarray): The input scores.
+        k (int): The RRF smoothing constant.
+    Returns:
+        np.ndarray: The reciprocal rank of each element.
+    """
+    order = np.argsort(-scores, axis=-1, kind="stable")
+    ranks = np.empty(scores.shape)
+    np.put_along_axis(ranks, order, np.broadcast_to(np.arange(1, scores.shape[-1] + 1), scores.shape), axis=-1)
+    return 1.0 / (k + ranks)
 
+def format_json(input_file, output_file):
+    """
+    Flatten the role hierarchy into a list of role dicts. Roles are streamed
+    from the input and written one at a time, in the layout `json.dump(...,
+    indent=2)` produces, so neither file is held in memory.
+    Args:
+        input_file (str): The hierarchy JSON (Complete.json layout).
+        output_file (str): The path of the formatted JSON list.
+    Returns:
+        int: The number of roles written.
+    """
+    count = 0
     with open(output_file, 'w', encoding='utf-8') as out:
-        json.dump(results, out, ensure_ascii=False, indent=2)
-    return results
+        out.write('[')
+        for role in iter_roles(input_file):
+            item = json.dumps(role, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+            out.write(('\n  ' if count == 0 else ',\n  ') + item)
+            count += 1
+        out.write('\n]' if count else ']')
+    return count
 
 
 if __name__ == '__main__':
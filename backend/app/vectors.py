@@ -0,0 +1,122 @@
+import json
+import os
+import numpy as np
+
+
+def normalize_rows(matrix):
+    """
+    Scale every row of a matrix to unit L2 norm (zero rows are left as is).
+    Args:
+        matrix (np.ndarray): The input matrix.
+    Returns:
+        np.ndarray: The row-normalized float32 matrix.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def load_chunk_embeddings(collection, ids):
+    """
+    Fetch the chunk embeddings from Chroma as one normalized matrix aligned with `ids`.
+    Args:
+        collection (chromadb.Collection): The Chroma collection holding the chunks.
+        ids (list): Chunk ids, in `bm25_ids` order.
+    Returns:
+        np.ndarray: Float32 matrix of shape (len(ids), dim).
+    """
+    data = collection.get(ids=list(ids), include=["embeddings"])
+
+    # Chroma does not guarantee the order of returned rows
+    position = {doc_id: i for i, doc_id in enumerate(data["ids"])}
+    embeddings = np.asarray(data["embeddings"], dtype=np.float32)
+    return normalize_rows(embeddings[[position[doc_id] for doc_id in ids]])
+
+
+def export_embeddings(embeddings, ids, path, index_version, dtype="float32"):
+    """
+    Write an embedding matrix to a .npy file, with a JSON sidecar holding the
+    chunk id order and the index version it was exported from. Both files are
+    written to temporary siblings and renamed into place.
+    Args:
+        embeddings (np.ndarray): Normalized chunk embeddings aligned with `ids`.
+        ids (list): Chunk ids, in `bm25_ids` order.
+        path (str): The destination .npy path.
+        index_version (str): The index version the embeddings belong to.
+        dtype (str): "float32" or "float16".
+    Returns:
+        None
+    """
+    # Per-process temporary names: several API workers may export at once
+    suffix = f".{os.getpid()}.tmp"
+    with open(f"{path}{suffix}", "wb") as f:
+        np.save(f, np.ascontiguousarray(embeddings, dtype=dtype))
+    with open(f"{sidecar_path(path)}{suffix}", "w", encoding="utf-8") as f:
+        json.dump({"index_version": index_version, "dtype": dtype, "ids": list(ids)}, f)
+    os.replace(f"{path}{suffix}", path)
+    os.replace(f"{sidecar_path(path)}{suffix}", sidecar_path(path))
+
+
+def sidecar_path(path):
+    return os.path.splitext(path)[0] + ".json"
+
+
+def load_embedding_matrix(path, ids, index_version):
+    """
+    Memory-map an exported embedding matrix if it matches the loaded index.
+    Every process mapping the same file shares its pages through the OS page cache.
+    Args:
+        path (str): The .npy path.
+        ids (list): Chunk ids the rows must line up with.
+        index_version (str): The index version the export must come from.
+    Returns:
+        np.ndarray: The read-only memory-mapped matrix, or None if missing or stale.
+    """
+    if not os.path.exists(path) or not os.path.exists(sidecar_path(path)):
+        return None
+    with open(sidecar_path(path), "r", encoding="utf-8") as f:
+        sidecar = json.load(f)
+    if sidecar["index_version"] != index_version or sidecar["ids"] != list(ids):
+        return None
+    return np.load(path, mmap_mode="r")
+
+
+def mmap_chunk_embeddings(collection, ids, path, index_version, dtype="float32"):
+    """
+    Memory-map the chunk embedding matrix, exporting it from Chroma first if
+    the file on disk is missing or belongs to another index version.
+    Args:
+        collection (chromadb.Collection): The Chroma collection holding the chunks.
+        ids (list): Chunk ids, in `bm25_ids` order.
+        path (str): The .npy path.
+        index_version (str): The loaded index version.
+        dtype (str): "float32" or "float16".
+    Returns:
+        np.ndarray: The read-only memory-mapped matrix.
+    """
+    embeddings = load_embedding_matrix(path, ids, index_version)
+    if embeddings is None:
+        export_embeddings(load_chunk_embeddings(collection, ids), ids, path, index_version, dtype)
+        embeddings = load_embedding_matrix(path, ids, index_version)
+    return embeddings
+
+
+if __name__ == "__main__":
+    import argparse
+    import chromadb
+    from .shared_index import SHARED_INDEX_DIR, load_bm25_index
+
+    parser = argparse.ArgumentParser(description="Export normalized chunk embeddings for memory-mapping")
+    parser.add_argument("--bundle", default=SHARED_INDEX_DIR, help="Index bundle the chunk ids and version come from")
+    parser.add_argument("--chroma", default="db/chroma_db")
+    parser.add_argument("--collection", default="nco_roles")
+    parser.add_argument("--output", default="db/embeddings.npy")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    args = parser.parse_args()
+
+    _, bm25_ids, index_version = load_bm25_index(args.bundle)
+    collection = chromadb.PersistentClient(path=args.chroma).get_collection(name=args.collection)
+
+    embeddings = load_chunk_embeddings(collection, bm25_ids)
+    export_embeddings(embeddings, bm25_ids, args.output, index_version, args.dtype)
+    print(f"Exported {embeddings.shape[0]} x {embeddings.shape[1]} {args.dtype} embeddings to {args.output}")
@@ -0,0 +1,209 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from .roles_db import open_read_only
+
+
+class ServiceOverloaded(Exception):
+    """
+    Raised when a request cannot be queued or waited too long for a worker.
+    """
+
+
+class BoundedExecutor:
+    """
+    A fixed-size thread pool with a bounded wait queue, for running the
+    CPU-heavy search path off the event loop.
+
+    At most `max_workers` calls run at once and at most `max_queue` more
+    wait for a worker. Further calls fail immediately with
+    ServiceOverloaded, as do queued calls that do not start within
+    `queue_timeout` seconds.
+    """
+
+    def __init__(self, max_workers=4, max_queue=64, queue_timeout=5.0):
+        """
+        Args:
+            max_workers (int): Number of worker threads.
+            max_queue (int): Number of calls allowed to wait for a worker.
+            queue_timeout (float): Seconds a call may wait before it is rejected, or None to wait forever.
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search")
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run `fn(*args, **kwargs)` on the pool and await its result.
+        Raises:
+            ServiceOverloaded: If the queue is full or the call did not start in time.
+        """
+        with self._lock:
+            if self.in_flight >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ServiceOverloaded("Search queue is full")
+            self.in_flight += 1
+
+        loop = asyncio.get_running_loop()
+        started = loop.create_future()
+
+        def mark_started():
+            if not started.done():
+                started.set_result(None)
+
+        def call():
+            loop.call_soon_threadsafe(mark_started)
+            return fn(*args, **kwargs)
+
+        future = self._pool.submit(call)
+        future.add_done_callback(self._release)
+        try:
+            # Only the wait for a worker is bounded; once started, the call runs to completion
+            await asyncio.wait_for(asyncio.shield(started), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if future.cancel():
+                with self._lock:
+                    self.timed_out += 1
+                raise ServiceOverloaded(f"No search worker available within {self.queue_timeout}s")
+        return await asyncio.wrap_future(future)
+
+    def _release(self, future):
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        """
+        Report pool size, current load and rejection counters.
+        Returns:
+            dict: The executor statistics.
+        """
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queue_timeout": self.queue_timeout,
+                "in_flight": self.in_flight,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class EncodeBatcher:
+    """
+    Coalesces concurrent single-query `encode` calls into one batched model
+    call. A single background thread owns the model: it takes the first
+    waiting query, collects whatever else arrives within `max_wait` seconds
+    (up to `max_batch` queries) and encodes them together.
+
+    Exposes the SentenceTransformer `encode` interface, so it can be passed
+    to HybridSearcher in place of the model. Lists are encoded directly.
+    """
+
+    def __init__(self, model, max_batch=32, max_wait=0.002):
+        """
+        Args:
+            model: The query encoder.
+            max_batch (int): Maximum queries per model call.
+            max_wait (float): Seconds to wait for more queries after the first one.
+        """
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self.batches = 0
+        self.queries = 0
+        threading.Thread(target=self._run, name="encode-batcher", daemon=True).start()
+
+    def encode(self, sentences, **kwargs):
+        """
+        Embed one sentence through the shared batch, or a list directly.
+        Args:
+            sentences (str | list): The input text(s).
+        Returns:
+            np.ndarray: The embedding(s).
+        """
+        if not isinstance(sentences, str):
+            return self.model.encode(sentences, **kwargs)
+        future = Future()
+        self._queue.put((sentences, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(items) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    items.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                embeddings = self.model.encode([text for text, _ in items], batch_size=len(items))
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.queries += len(items)
+            for (_, future), emb in zip(items, embeddings):
+                future.set_result(emb)
+
+    def stats(self):
+        """
+        Report how many model calls served how many queries.
+        Returns:
+            dict: The batching statistics.
+        """
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "mean_batch": self.queries / self.batches if self.batches else 0.0,
+            "pending": self._queue.qsize()
+        }
+
+
+class ReadOnlyConnections:
+    """
+    One read-only SQLite connection per thread, opened on first use
+    (memory-mapped, with a larger page cache; see roles_db.open_read_only).
+    """
+
+    def __init__(self, db_file):
+        """
+        Args:
+            db_file (str): The path to the SQLite database.
+        """
+        self.db_file = db_file
+        self._local = threading.local()
+
+    def get(self) -> sqlite3.Connection:
+        """
+        Return the calling thread's connection.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = open_read_only(self.db_file)
+            self._local.conn = conn
+        return conn
+
+    def execute(self, sql, params=()):
+        """
+        Run a query on the calling thread's connection.
+        Returns:
+            sqlite3.Cursor: The cursor.
+        """
+        return self.get().execute(sql, params)
@@ -74,6 +74,7 @@ function App() {
           query={query}
           setQuery={setQuery}
           isLoading={isLoading}
+          baseURL={baseURL}
         />
       </div>
 
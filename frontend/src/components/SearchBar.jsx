@@ -1,47 +1,116 @@
-import React from 'react'
+import React, { useState, useEffect } from 'react'
+import axios from 'axios';
+
+function SearchBar({ onSearch, query, setQuery, isLoading, baseURL }) {
+  const [suggestions, setSuggestions] = useState([]);
+  const [showSuggestions, setShowSuggestions] = useState(false);
+
+  // Fetch typeahead completions shortly after the user stops typing
+  useEffect(() => {
+    if (!query.trim()) {
+      setSuggestions([]);
+      return;
+    }
+    const controller = new AbortController();
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.get(`${baseURL}/suggest`, {
+          params: { q: query, limit: 8 },
+          signal: controller.signal,
+        });
+        setSuggestions(response.data.suggestions || []);
+      } catch (error) {
+        if (!axios.isCancel(error)) {
+          setSuggestions([]);
+        }
+      }
+    }, 80);
+    return () => {
+      clearTimeout(timer);
+      controller.abort();
+    };
+  }, [query, baseURL]);
 
-function SearchBar({ onSearch, query, setQuery, isLoading }) {
   const handleKeyPress = (e) => {
     if (e.key === 'Enter') {
+      setShowSuggestions(false);
       onSearch(query);
     }
   };
 
+  const handleKeyDown = (e) => {
+    if (e.key === 'Escape') {
+      setShowSuggestions(false);
+    }
+  };
+
+  // Picked on mousedown, which fires before the input's blur hides the list
+  const selectSuggestion = (suggestion) => {
+    const title = suggestion.title.replace(/\s+/g, ' ');
+    setQuery(title);
+    setShowSuggestions(false);
+    onSearch(title);
+  };
+
   return (
     <div className="search-bar-container">
-      <div className="search-bar">
-        <input
-          type="text"
-          value={query}
-          onChange={(e) => setQuery(e.target.value)}
-          onKeyPress={handleKeyPress}
-          placeholder="Search for roles (e.g., 'software engineer', 'doctor', 'teacher')..."
-          className="search-input"
-          disabled={isLoading}
-        />
-        <button
-          onClick={() => onSearch(query)}
-          className="search-button"
-          disabled={isLoading || !query.trim()}
-          title={isLoading ? 'Searching...' : 'Search'}
-        >
-          {isLoading ? (
-            <svg className="search-icon spinning" viewBox="0 0 24 24" fill="none">
-              <circle cx="12" cy="12" r="10" stroke="currentColor" strokeWidth="2" strokeDasharray="31.416" strokeDashoffset="31.416">
-                <animate attributeName="stroke-dasharray" dur="2s" values="0 31.416;15.708 15.708;0 31.416" repeatCount="indefinite" />
-                <animate attributeName="stroke-dashoffset" dur="2s" values="0;-15.708;-31.416" repeatCount="indefinite" />
-              </circle>
-            </svg>
-          ) : (
-            <svg className="search-icon" viewBox="0 0 24 24" fill="none">
-              <circle cx="11" cy="11" r="8" stroke="currentColor" strokeWidth="2" />
-              <path d="m21 21-4.35-4.35" stroke="currentColor" strokeWidth="2" />
-            </svg>
-          )}
-        </button>
+      <div className="search-bar-wrapper">
+        <div className="search-bar">
+          <input
+            type="text"
+            value={query}
+            onChange={(e) => {
+              setQuery(e.target.value);
+              setShowSuggestions(true);
+            }}
+            onFocus={() => setShowSuggestions(true)}
+            onBlur={() => setShowSuggestions(false)}
+            onKeyPress={handleKeyPress}
+            onKeyDown={handleKeyDown}
+            placeholder="Search for roles (e.g., 'software engineer', 'doctor', 'teacher')..."
+            className="search-input"
+            disabled={isLoading}
+          />
+          <button
+            onClick={() => onSearch(query)}
+            className="search-button"
+            disabled={isLoading || !query.trim()}
+            title={isLoading ? 'Searching...' : 'Search'}
+          >
+            {isLoading ? (
+              <svg className="search-icon spinning" viewBox="0 0 24 24" fill="none">
+                <circle cx="12" cy="12" r="10" stroke="currentColor" strokeWidth="2" strokeDasharray="31.416" strokeDashoffset="31.416">
+                  <animate attributeName="stroke-dasharray" dur="2s" values="0 31.416;15.708 15.708;0 31.416" repeatCount="indefinite" />
+                  <animate attributeName="stroke-dashoffset" dur="2s" values="0;-15.708;-31.416" repeatCount="indefinite" />
+                </circle>
+              </svg>
+            ) : (
+              <svg className="search-icon" viewBox="0 0 24 24" fill="none">
+                <circle cx="11" cy="11" r="8" stroke="currentColor" strokeWidth="2" />
+                <path d="m21 21-4.35-4.35" stroke="currentColor" strokeWidth="2" />
+              </svg>
+            )}
+          </button>
+        </div>
+        {showSuggestions && !isLoading && suggestions.length > 0 && (
+          <ul className="suggestions">
+            {suggestions.map((suggestion) => (
+              <li
+                key={suggestion.role_number}
+                className="suggestion"
+                onMouseDown={(e) => {
+                  e.preventDefault();
+                  selectSuggestion(suggestion);
+                }}
+              >
+                <span className="suggestion-title">{suggestion.title.replace(/\s+/g, ' ')}</span>
+                <span className="suggestion-code">{suggestion.role_number}</span>
+              </li>
+            ))}
+          </ul>
+        )}
       </div>
     </div>
   );
 }
 
-export default SearchBar;
\ No newline at end of file